@@ -7,10 +7,18 @@ const API_CONFIG = {
 // État global de l'application
 let appState = {
     products: [],
+    nextToken: null,
+    searchResults: [],
     currentEditProduct: null,
-    isLoading: false
+    isLoading: false,
+    searchTimer: null,
+    searchQuery: ''
 };
 
+// Wait this long after the last keystroke before searching
+const SEARCH_DEBOUNCE_MS = 250;
+const SEARCH_RESULT_LIMIT = 50;
+
 // Initialisation de l'application
 document.addEventListener('DOMContentLoaded', function() {
     initializeApp();
@@ -33,6 +41,12 @@ function setupEventListeners() {
     if (chatInput) {
         chatInput.addEventListener('keypress', handleChatKeyPress);
     }
+
+    // Product search (search-as-you-type)
+    const productSearch = document.getElementById('productSearch');
+    if (productSearch) {
+        productSearch.addEventListener('input', handleProductSearchInput);
+    }
 }
 
 // === NAVIGATION ===
@@ -73,25 +87,35 @@ function showTab(tabName, buttonElement) {
 }
 
 // === PRODUCTS MANAGEMENT ===
+async function fetchProductsPage(nextToken) {
+    // One page of products; the totals come from /stats, not from the pages
+    const query = nextToken ? `?next_token=${encodeURIComponent(nextToken)}` : '';
+    const response = await fetch(`${API_CONFIG.stockAPI}/products${query}`, {
+        method: 'GET',
+        headers: {
+            'Content-Type': 'application/json'
+        }
+    });
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    const data = await response.json();
+    return { products: data.products || [], nextToken: data.next_token || null };
+}
+
 async function loadProducts() {
     setLoading('productsGrid', true);
     
     try {
-        const response = await fetch(`${API_CONFIG.stockAPI}/products`, {
-            method: 'GET',
-            headers: {
-                'Content-Type': 'application/json'
-            }
-        });
-        
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        
-        const data = await response.json();
-        appState.products = data.products || [];
+        // First page only; further pages are loaded on demand
+        const page = await fetchProductsPage(null);
+        appState.products = page.products;
+        appState.nextToken = page.nextToken;
         
         renderProducts(appState.products);
+        updateLoadMore();
         updateStats();
         
     } catch (error) {
@@ -101,6 +125,70 @@ async function loadProducts() {
     }
 }
 
+async function loadMoreProducts() {
+    const button = document.getElementById('loadMoreProducts');
+    if (!appState.nextToken) return;
+    if (button) button.disabled = true;
+    
+    try {
+        const page = await fetchProductsPage(appState.nextToken);
+        appState.products.push(...page.products);
+        appState.nextToken = page.nextToken;
+        renderProducts(appState.products);
+    } catch (error) {
+        console.error('Error loading more products:', error);
+        showError('Failed to load more products.');
+    } finally {
+        if (button) button.disabled = false;
+        updateLoadMore();
+    }
+}
+
+function updateLoadMore() {
+    // Only the full listing pages; search results come in one response
+    const button = document.getElementById('loadMoreProducts');
+    if (button) {
+        button.style.display = appState.nextToken && !appState.searchQuery ? '' : 'none';
+    }
+}
+
+function handleProductSearchInput(event) {
+    clearTimeout(appState.searchTimer);
+    const query = event.target.value.trim();
+    appState.searchTimer = setTimeout(() => searchProducts(query), SEARCH_DEBOUNCE_MS);
+}
+
+async function searchProducts(query) {
+    appState.searchQuery = query;
+    updateLoadMore();
+    if (!query) {
+        renderProducts(appState.products);
+        return;
+    }
+
+    try {
+        const params = new URLSearchParams({ q: query, limit: SEARCH_RESULT_LIMIT });
+        const response = await fetch(`${API_CONFIG.stockAPI}/products/search?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const data = await response.json();
+        // Ignore answers to queries the user has already typed past
+        if (query === appState.searchQuery) {
+            appState.searchResults = data.products || [];
+            renderProducts(appState.searchResults);
+        }
+    } catch (error) {
+        console.error('Error searching products:', error);
+        // Fall back to filtering what is already loaded
+        const words = query.toLowerCase().split(/\s+/);
+        renderProducts(appState.products.filter(p => {
+            const text = `${p.name} ${p.category || ''} ${p.description || ''}`.toLowerCase();
+            return words.every(word => text.includes(word));
+        }));
+    }
+}
+
 function loadDemoProducts() {
     // Données de démo pour développement local
     appState.products = [
@@ -141,8 +229,10 @@ function loadDemoProducts() {
             description: 'Latest iPhone model'
         }
     ];
+    appState.nextToken = null;
     
     renderProducts(appState.products);
+    updateLoadMore();
     updateStats();
 }
 
@@ -204,12 +294,34 @@ function getQuantityClass(quantity, threshold) {
     return 'quantity-good';
 }
 
-function updateStats() {
-    const products = appState.products;
-    const totalProducts = products.length;
-    const lowStockCount = products.filter(p => p.quantity <= p.min_threshold).length;
-    const totalValue = products.reduce((sum, p) => sum + (p.quantity * (p.price || 0)), 0);
+async function updateStats() {
+    // Pre-aggregated totals from the API, computed locally if unavailable
+    try {
+        const response = await fetch(`${API_CONFIG.stockAPI}/stats`, {
+            method: 'GET',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
 
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const stats = await response.json();
+        renderStats(stats.total_products, stats.low_stock_count, stats.total_value);
+    } catch (error) {
+        console.error('Error loading stats:', error);
+        const products = appState.products;
+        renderStats(
+            products.length,
+            products.filter(p => p.quantity <= p.min_threshold).length,
+            products.reduce((sum, p) => sum + (p.quantity * (p.price || 0)), 0)
+        );
+    }
+}
+
+function renderStats(totalProducts, lowStockCount, totalValue) {
     // Update DOM elements
     const totalProductsEl = document.getElementById('totalProducts');
     const lowStockCountEl = document.getElementById('lowStockCount');
@@ -273,7 +385,9 @@ async function handleAddProduct(e) {
 }
 
 async function editProduct(productId) {
-    const product = appState.products.find(p => p.product_id === productId);
+    // Search results may include products from pages not loaded yet
+    const product = appState.products.find(p => p.product_id === productId)
+        || appState.searchResults.find(p => p.product_id === productId);
     if (!product) return;
 
     appState.currentEditProduct = product;
@@ -302,15 +416,28 @@ async function handleEditProduct(e) {
         min_threshold: parseInt(document.getElementById('editMinThreshold').value)
     };
 
+    // Optimistic concurrency: reject the edit if someone else changed the product
+    const requestHeaders = {
+        'Content-Type': 'application/json'
+    };
+    if (appState.currentEditProduct?.version !== undefined) {
+        requestHeaders['If-Match'] = `"${appState.currentEditProduct.version}"`;
+    }
+
     try {
         const response = await fetch(`${API_CONFIG.stockAPI}/products/${productId}`, {
             method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json'
-            },
+            headers: requestHeaders,
             body: JSON.stringify(updateData)
         });
 
+        if (response.status === 412) {
+            showError('Product was changed by someone else. Reloading...');
+            closeEditModal();
+            loadProducts();
+            return;
+        }
+
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -1,22 +1,197 @@
 import json
-import boto3
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 from datetime import datetime, timedelta
-import random
+from forecasting import forecast_demand, build_history_matrix, HISTORY_DAYS
+from prompt_builder import build_chat_prompt, normalize_question, tokenize
+from product_embeddings import ProductVectorIndex, make_embedder
+from product_search import ProductSearchIndex
+from restock import URGENCY_ORDER, build_recommendation, is_low_stock
+from aws_clients import lazy_client, lazy_resource, lazy_table
+from instrumentation import annotate, instrumented, log_error, record_bedrock_event, record_count, span
+from inventory_version import read_inventory_version
+from product_cache import PRODUCT_CACHE_URL, ProductCache, make_backend, table_loader
+from serialization import compress_response, dumps, from_item, parse_body
+from tenancy import (PARTITION_ATTRIBUTE, TENANT_HEADER, WAREHOUSE_HEADER, client_product_key, request_partition,
+                     scoped_key)
+import bedrock_resilience
+import results_store
+from bedrock_resilience import BedrockUnavailable
 
-# AWS services
-dynamodb = boto3.resource('dynamodb')
-bedrock = boto3.client('bedrock-runtime')
-table = dynamodb.Table('stock-products')
+# AWS services (created on first use: a chat-only invocation never builds what it doesn't call)
+# Product reads use the low-level client and convert raw attribute values
+# straight to JSON types (see serialization)
+PRODUCTS_TABLE = os.environ.get('DYNAMODB_TABLE', 'stock-products')
+dynamodb = lazy_resource('dynamodb')
+dynamodb_client = lazy_client('dynamodb')
+bedrock = lazy_client('bedrock-runtime')
+METADATA_TABLE = os.environ.get('METADATA_TABLE', 'stock-metadata')
+metadata_table = lazy_table(METADATA_TABLE)
+movements_table = lazy_table(os.environ.get('MOVEMENTS_TABLE', 'stock-movements'))
 
+# Single-product estimations read the product through the product cache
+# (see product_cache), whose shared tier the stock API keeps up to date
+product_cache = ProductCache(table_loader(dynamodb_client, PRODUCTS_TABLE), make_backend(PRODUCT_CACHE_URL))
+
+# Sparse low-stock index maintained by the stock API on every write; the flag
+# value is the product's partition, so each partition's low stock is one query
+LOW_STOCK_INDEX = 'low-stock-index'
+LOW_STOCK_ATTRIBUTE = 'low_stock'
+
+# Above this many products, demand history is read with one scan instead of
+# per-product queries (which run concurrently, FETCH_MAX_WORKERS at a time)
+HISTORY_QUERY_MAX_PRODUCTS = 200
+
+# Multi-product /estimate and /recommendations
+REQUEST_MAX_PRODUCTS = 1000
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+FETCH_MAX_WORKERS = 8
+
+# Optional per-product Bedrock narratives, generated concurrently for the most
+# urgent products and abandoned once the time budget is spent
+NARRATIVE_MAX_PRODUCTS = int(os.environ.get('NARRATIVE_MAX_PRODUCTS', '50'))
+NARRATIVE_MAX_WORKERS = int(os.environ.get('NARRATIVE_MAX_WORKERS', '8'))
+NARRATIVE_TIMEOUT_SECONDS = float(os.environ.get('NARRATIVE_TIMEOUT_SECONDS', '20'))
+
+# Materialized results (see results_store): the scheduled precompute job
+# writes recommendations and estimations for the whole catalog, and requests
+# serve them. Products changed since then are recomputed on demand, at most
+# INCREMENTAL_MAX_PRODUCTS per refresh; past that (or DELTA_MAX_PRODUCTS
+# refreshed since the last full run) results are served as stale until the
+# next scheduled run.
+PRECOMPUTED_RESULTS = os.environ.get('PRECOMPUTED_RESULTS', 'true').lower() == 'true'
+RESULTS_CHECK_SECONDS = float(os.environ.get('RESULTS_CHECK_SECONDS', '10'))
+INCREMENTAL_MAX_PRODUCTS = int(os.environ.get('INCREMENTAL_MAX_PRODUCTS', '100'))
+DELTA_MAX_PRODUCTS = int(os.environ.get('DELTA_MAX_PRODUCTS', '5000'))
+ESTIMATION_SHARD_PRODUCTS = int(os.environ.get('ESTIMATION_SHARD_PRODUCTS', '1000'))
+RESULTS_CACHE_MAX_BLOBS = int(os.environ.get('RESULTS_CACHE_MAX_BLOBS', '32'))
+PUBLISH_MAX_ATTEMPTS = 3
+
+_results = {}  # partition -> {'pointer', 'checked_at', 'plan'}
+_results_lock = threading.Lock()
+_results_blobs = OrderedDict()
+_results_blobs_lock = threading.Lock()
+
+# Inventory snapshot cache, kept across warm invocations: one snapshot per
+# partition, for the STOCK_CACHE_MAX_PARTITIONS most recently loaded.
+# Snapshots are shared between requests: callers must treat them as read-only.
+STOCK_CACHE_TTL_SECONDS = float(os.environ.get('STOCK_CACHE_TTL_SECONDS', '30'))
+STOCK_CACHE_MAX_ITEMS = int(os.environ.get('STOCK_CACHE_MAX_ITEMS', '50000'))
+STOCK_CACHE_MAX_PARTITIONS = int(os.environ.get('STOCK_CACHE_MAX_PARTITIONS', '16'))
+STOCK_CACHE_VERSION_CHECK = os.environ.get('STOCK_CACHE_VERSION_CHECK', 'false').lower() == 'true'
+INVENTORY_SUMMARY_KEY = 'inventory_summary'
+
+_stock_caches = OrderedDict()  # partition -> {'products', 'loaded_at', 'version'}
+_stock_cache_lock = threading.Lock()
+
+# Bedrock chat: prompt size budget and LRU cache of answers per inventory version
+CHAT_PROMPT_TOKEN_BUDGET = int(os.environ.get('CHAT_PROMPT_TOKEN_BUDGET', '3000'))
+CHAT_CACHE_TTL_SECONDS = float(os.environ.get('CHAT_CACHE_TTL_SECONDS', '300'))
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '256'))
+# A chat answer Bedrock has not given after this long is hedged with the
+# keyword answer, served if Bedrock fails or the request's budget runs out
+CHAT_HEDGE_AFTER_SECONDS = float(os.environ.get('CHAT_HEDGE_AFTER_SECONDS', '3'))
+BEDROCK_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+BEDROCK_MAX_TOKENS = 300
+
+_chat_cache = OrderedDict()
+_chat_cache_lock = threading.Lock()
+
+# Product search index for the keyword chat, one per cached snapshot and
+# re-synced only when the partition's snapshot is replaced
+CHAT_SEARCH_MAX_RESULTS = 3
+_search_indexes = {}  # partition -> {'index', 'snapshot'}
+_search_index_lock = threading.Lock()
+
+# Semantic retrieval for the chat: products are embedded locally (see
+# product_embeddings), one vector index per cached snapshot like the search
+# index, and the CHAT_RETRIEVAL_MAX_PRODUCTS closest to the question lead the
+# prompt whatever the catalog size. The keyword chat falls back to them when
+# no product matches the question's words.
+CHAT_EMBEDDER = os.environ.get('CHAT_EMBEDDER', 'hashing')
+EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', '128'))
+CHAT_RETRIEVAL_MAX_PRODUCTS = int(os.environ.get('CHAT_RETRIEVAL_MAX_PRODUCTS', '40'))
+CHAT_RETRIEVAL_MIN_SCORE = float(os.environ.get('CHAT_RETRIEVAL_MIN_SCORE', '0.35'))
+_vector_indexes = {}  # partition -> {'index', 'snapshot'}
+_vector_index_lock = threading.Lock()
+
+@instrumented('ai-assistant')
 def lambda_handler(event, context):
     """Main Lambda handler for AI assistant"""
+    bedrock_resilience.start_request(context)
+    response = route_request(event)
+    return compress_response(response, event)
+
+@instrumented('ai-precompute')
+def precompute_handler(event, context):
+    """
+    Scheduled job: compute recommendations and estimations for every partition and publish them.
+    
+    Partitions are processed one after the other (those listed in the event's
+    `partitions`, else every partition of the table); one that fails is
+    retried by the next run and doesn't stop the others.
+    """
+    with span('list_partitions'):
+        partitions = event.get('partitions') or list_partitions()
+    summaries = {}
+    failed = []
+    for partition in partitions:
+        try:
+            summaries[partition] = precompute_partition(partition)
+        except Exception:
+            failed.append(partition)
+    if failed:
+        raise RuntimeError(f'Results not precomputed for partitions {", ".join(failed)}')
+    return {'partitions': summaries}
+
+def precompute_partition(partition):
+    """
+    Compute and publish the results of one partition's catalog.
+    
+    Products queued as changed are taken off the queue first: anything that
+    changes during the run is queued again and refreshed on demand.
+    """
+    started_from = results_store.read_pointer(dynamodb_client, METADATA_TABLE, partition)
+    claimed, overflowed = results_store.claim_dirty(dynamodb_client, METADATA_TABLE, partition)
+    try:
+        with span('query'):
+            products = query_stock_products(partition)
+        blobs, counts = compute_full_results(partition, products)
+        pointer = publish_full_results(partition, blobs, counts, started_from)
+    except Exception as e:
+        log_error("Error precomputing results", e, partition=partition, claimed=len(claimed))
+        results_store.requeue_dirty(dynamodb_client, METADATA_TABLE, partition, claimed, overflowed)
+        raise
+    
+    record_count('PrecomputedPartitions')
+    record_count('PrecomputedProducts', counts['products'])
+    record_count('PrecomputeClaimedProducts', len(claimed))
+    return {'version': pointer['version'], 'claimed': len(claimed), **counts}
+
+def list_partitions():
+    """Every partition with products, from a scan of the partition keys only"""
+    partitions = set()
+    scan_kwargs = {'TableName': PRODUCTS_TABLE, 'ProjectionExpression': PARTITION_ATTRIBUTE}
+    while True:
+        response = dynamodb_client.scan(**scan_kwargs)
+        partitions.update(item[PARTITION_ATTRIBUTE]['S'] for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return sorted(partitions)
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def route_request(event):
+    """Dispatch an API Gateway event to its handler"""
     
     # CORS headers
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'POST, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': f'Content-Type, {TENANT_HEADER}, {WAREHOUSE_HEADER}'
     }
     
     try:
@@ -30,14 +205,22 @@ def lambda_handler(event, context):
         
         # Handle POST requests
         if event['httpMethod'] == 'POST':
-            body = json.loads(event['body'])
+            # Answers differ per tenant and warehouse
+            headers['Vary'] = f'{TENANT_HEADER}, {WAREHOUSE_HEADER}'
+            try:
+                partition = request_partition(event)
+            except ValueError as e:
+                return bad_request(str(e), headers)
+            body = parse_body(event)
             
             if event['path'] == '/chat':
-                return handle_chat(body.get('message', ''), headers)
+                return handle_chat(partition, body.get('message', ''), headers)
             elif event['path'] == '/estimate':
-                return handle_estimations(body.get('product_id'), headers)
+                return handle_estimations(partition, body.get('product_id'), headers,
+                                          product_ids=body.get('product_ids'), narratives=bool(body.get('narratives')))
             elif event['path'] == '/recommendations':
-                return handle_recommendations(headers)
+                return handle_recommendations(partition, headers, product_ids=body.get('product_ids'),
+                                              narratives=bool(body.get('narratives')))
             else:
                 return {
                     'statusCode': 404,
@@ -50,7 +233,7 @@ def lambda_handler(event, context):
             'headers': headers,
             'body': json.dumps({'error': 'Method not allowed'})
         }
-        
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -58,88 +241,89 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-def handle_chat(user_message, headers):
+def handle_chat(partition, user_message, headers):
     """Handle conversational queries about stock"""
     try:
-        # Get current stock data
-        stock_data = get_stock_context()
-        
-        # Try Bedrock first, fallback to simple chat
-        try:
-            # Prepare context for AI
-            context = f"""
-            You are a helpful stock management assistant. Here's the current inventory data:
-            {json.dumps(stock_data, indent=2)}
-            
-            User question: {user_message}
-            
-            Please provide a helpful response about the inventory. Be concise and actionable.
-            If asked about specific products, provide exact quantities and details.
-            If asked about recommendations or estimations, suggest based on current stock levels.
-            """
-            
-            # Call Bedrock Claude
-            response = call_bedrock_claude(context)
-            
+        # Answers are cached per partition, normalized question and inventory version
+        version = get_inventory_version(partition)
+        cache_key = (partition, normalize_question(user_message), version)
+        cached = get_cached_chat_response(cache_key)
+        if cached is not None:
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'body': json.dumps({
-                    'response': response,
-                    'context': 'AI-powered response',
+                    'response': cached,
+                    'context': 'AI-powered response (cached)',
+                    'cached': True,
                     'timestamp': datetime.now().isoformat()
                 })
             }
-        except:
-            # Fallback to simple matching
-            return handle_simple_chat(user_message, headers)
-        
-    except Exception as e:
-        return handle_simple_chat(user_message, headers)
-
-def handle_simple_chat(user_message, headers):
-    """Fallback chat handler with keyword matching"""
-    try:
-        message_lower = user_message.lower()
-        stock_data = get_stock_context()
-        
-        # Simple keyword responses
-        if any(word in message_lower for word in ['low', 'alert', 'critical']):
-            low_stock = [p for p in stock_data if p['quantity'] <= p['min_threshold']]
-            response = f"Found {len(low_stock)} products with low stock: " + ", ".join([p['name'] for p in low_stock[:3]])
         
-        elif any(word in message_lower for word in ['total', 'count', 'how many']):
-            total_value = sum(float(p.get('price', 0)) * p['quantity'] for p in stock_data)
-            response = f"You have {len(stock_data)} products in inventory with a total value of ${total_value:.2f}"
+        # Get current stock data
+        stock_data = get_stock_context(partition, version)
         
-        elif any(word in message_lower for word in ['expensive', 'valuable', 'high price']):
-            expensive = sorted(stock_data, key=lambda x: float(x.get('price', 0)), reverse=True)[:3]
-            response = f"Most valuable products: " + ", ".join([f"{p['name']} (${float(p.get('price', 0))})" for p in expensive])
+        # Prepare a compact context: aggregates plus the most relevant products
+        with span('retrieval'):
+            relevant = retrieve_products(partition, user_message, stock_data)
+        with span('prompt'):
+            prompt = build_chat_prompt(user_message, stock_data, CHAT_PROMPT_TOKEN_BUDGET, relevant)
         
-        else:
-            # Search for product names in the message
-            found_products = []
-            for product in stock_data:
-                if any(word in product['name'].lower() for word in message_lower.split()):
-                    found_products.append(product)
-            
-            if found_products:
-                product = found_products[0]
-                price = float(product.get('price', 0))
-                response = f"{product['name']}: {product['quantity']} units in stock, ${price} each"
-            else:
-                response = "I can help you with stock information. Try asking about product quantities, low stock alerts, or valuable items."
+        # Call Bedrock Claude, with the keyword answer as a hedge
+        response, fallback_reason = hedged_chat_answer(partition, user_message, lambda: call_bedrock_claude(prompt))
+        if fallback_reason:
+            return simple_chat_response(response, headers, fallback_reason)
+        if version is not None:
+            put_cached_chat_response(cache_key, response)
         
         return {
             'statusCode': 200,
             'headers': headers,
             'body': json.dumps({
                 'response': response,
-                'context': 'Simple keyword matching',
+                'context': 'AI-powered response',
+                'cached': False,
                 'timestamp': datetime.now().isoformat()
             })
         }
-        
+    
+    except Exception as e:
+        log_error("Chat error", e)
+        return handle_simple_chat(partition, user_message, headers)
+
+def hedged_chat_answer(partition, user_message, ask_bedrock):
+    """
+    Bedrock's answer, or the keyword answer when Bedrock fails or runs out of time.
+    
+    Returns (answer, None), or (keyword answer, reason Bedrock was not used).
+    The keyword answer is started once Bedrock has taken
+    CHAT_HEDGE_AFTER_SECONDS, so it is ready when the budget runs out and
+    costs nothing when Bedrock is fast.
+    """
+    bedrock_answer = bedrock_resilience.run_in_thread(ask_bedrock)
+    keyword_answer = None
+    try:
+        return bedrock_answer.result(timeout=CHAT_HEDGE_AFTER_SECONDS), None
+    except FutureTimeout:
+        keyword_answer = bedrock_resilience.run_in_thread(simple_chat_answer, partition, user_message)
+        try:
+            # Bounded by the request's deadline (see bedrock_resilience)
+            return bedrock_answer.result(), None
+        except BedrockUnavailable as e:
+            unavailable = e
+    except BedrockUnavailable as e:
+        unavailable = e
+    
+    record_bedrock_event('fallbacks')
+    log_error("Answering with keyword matching", unavailable, reason=unavailable.reason)
+    answer = keyword_answer.result() if keyword_answer else simple_chat_answer(partition, user_message)
+    return answer, unavailable.reason
+
+def handle_simple_chat(partition, user_message, headers):
+    """Fallback chat handler with keyword matching"""
+    try:
+        return simple_chat_response(simple_chat_answer(partition, user_message), headers)
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -147,49 +331,142 @@ def handle_simple_chat(user_message, headers):
             'body': json.dumps({'error': f'Chat failed: {str(e)}'})
         }
 
-def handle_estimations(product_id, headers):
+def simple_chat_answer(partition, user_message):
+    """Answer from keyword matching over the partition's stock, without Bedrock"""
+    message_lower = user_message.lower()
+    
+    # Simple keyword responses
+    if any(word in message_lower for word in ['low', 'alert', 'critical']):
+        low_stock = get_low_stock_context(partition)
+        return f"Found {len(low_stock)} products with low stock: " + ", ".join([p['name'] for p in low_stock[:3]])
+    
+    if any(word in message_lower for word in ['total', 'count', 'how many']):
+        product_count, total_value = get_inventory_totals(partition)
+        return f"You have {product_count} products in inventory with a total value of ${total_value:.2f}"
+    
+    if any(word in message_lower for word in ['expensive', 'valuable', 'high price']):
+        stock_data = get_stock_context(partition)
+        expensive = sorted(stock_data, key=lambda x: float(x.get('price', 0)), reverse=True)[:3]
+        return f"Most valuable products: " + ", ".join([f"{p['name']} (${float(p.get('price', 0))})" for p in expensive])
+    
+    # Search the product index with the meaningful words of the message,
+    # then by similarity when no product contains them
+    query = ' '.join(tokenize(user_message))
+    matches = get_search_index(partition).search(query, limit=CHAT_SEARCH_MAX_RESULTS)
+    if not matches:
+        matches = get_vector_index(partition).search(query, limit=CHAT_SEARCH_MAX_RESULTS,
+                                                     min_score=CHAT_RETRIEVAL_MIN_SCORE)
+    if matches:
+        return "; ".join([
+            f"{product['name']}: {product['quantity']} units in stock, ${float(product.get('price', 0))} each"
+            for product, _ in matches
+        ])
+    return "I can help you with stock information. Try asking about product quantities, low stock alerts, or valuable items."
+
+def simple_chat_response(response, headers, fallback_reason=None):
+    """200 response for a keyword-matching answer; fallback_reason says why Bedrock was not used"""
+    body = {
+        'response': response,
+        'context': 'Simple keyword matching',
+        'timestamp': datetime.now().isoformat()
+    }
+    if fallback_reason:
+        body['context'] = f'Simple keyword matching (AI unavailable: {fallback_reason})'
+        body['fallback'] = fallback_reason
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(body)
+    }
+
+def handle_estimations(partition, product_id, headers, product_ids=None, narratives=False):
     """Handle demand estimations for products"""
     try:
-        if not product_id:
-            # Get estimations for all low stock items
-            stock_data = get_stock_context()
-            low_stock = [p for p in stock_data if p['quantity'] <= p['min_threshold']]
+        if product_ids is not None:
+            # Estimations for an explicit list of products
+            try:
+                product_ids = parse_product_ids(product_ids)
+            except ValueError as e:
+                return bad_request(str(e), headers)
             
-            estimations = []
-            for product in low_stock[:5]:  # Limit to 5 products
-                est = generate_simple_estimation(product)
-                estimations.append(est)
+            # Precomputed estimations first; products missing from them are computed live
+            materialized = get_materialized_estimations(partition, product_ids)
+            found = dict(materialized['estimations']) if materialized else {}
+            missing = [p for p in product_ids if p not in found]
+            products = batch_get_products(partition, missing)
+            found.update((e['product_id'], e) for e in generate_estimations(partition, products))
+            estimations = [found[p] for p in product_ids if p in found]
+            if narratives:
+                estimations = [dict(e) for e in estimations]
+                add_narratives(estimations, key=lambda e: URGENCY_ORDER[e['urgency_level']])
             
+            result = {
+                'estimations': estimations,
+                'not_found': [p for p in product_ids if p not in found],
+                'message': f'Estimations for {len(estimations)} of {len(product_ids)} requested products'
+            }
+            # `stale` describes the precomputed results, so only when some were served
+            if materialized and len(missing) < len(product_ids):
+                result['stale'] = materialized['stale']
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({
-                    'estimations': estimations,
-                    'message': f'Estimations for {len(estimations)} low-stock products'
-                })
+                'body': dumps(result)
+            }
+        elif not product_id:
+            # Get estimations for all low stock items, precomputed when available
+            plan = get_restock_plan(partition)
+            if plan:
+                estimations = plan['estimations']
+            else:
+                estimations = generate_estimations(partition, get_low_stock_context(partition))
+            if narratives:
+                estimations = [dict(e) for e in estimations]
+                add_narratives(estimations, key=lambda e: URGENCY_ORDER[e['urgency_level']])
+            
+            result = {
+                'estimations': estimations,
+                'message': f'Estimations for {len(estimations)} low-stock products'
+            }
+            if plan:
+                result.update(generated_at=plan['generated_at'], stale=plan['stale'])
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': dumps(result)
             }
         else:
             # Get estimation for specific product
-            response = table.get_item(Key={'product_id': product_id})
-            if 'Item' not in response:
-                return {
-                    'statusCode': 404,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Product not found'})
-                }
-            
-            product = response['Item']
-            estimation = generate_simple_estimation(product)
+            materialized = get_materialized_estimations(partition, [product_id])
+            estimation = materialized['estimations'].get(product_id) if materialized else None
+            precomputed = estimation is not None
+            if estimation is None:
+                product = product_cache.get(partition, product_id)
+                if product is None:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Product not found'})
+                    }
+                
+                estimation = generate_estimations(partition, [product])[0]
+            elif narratives:
+                estimation = dict(estimation)
+            if narratives:
+                add_narratives([estimation])
             
+            result = {
+                'estimation': estimation,
+                'product_id': product_id
+            }
+            if precomputed:
+                result['stale'] = materialized['stale']
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({
-                    'estimation': estimation,
-                    'product_id': product_id
-                })
+                'body': dumps(result)
             }
-            
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -197,50 +474,52 @@ def handle_estimations(product_id, headers):
             'body': json.dumps({'error': f'Estimation failed: {str(e)}'})
         }
 
-def handle_recommendations(headers):
+def handle_recommendations(partition, headers, product_ids=None, narratives=False):
     """Handle restocking recommendations"""
     try:
-        stock_data = get_stock_context()
-        recommendations = []
-        
-        for product in stock_data:
-            if product['quantity'] <= product['min_threshold']:
-                # Calculate recommended order quantity
-                current_qty = product['quantity']
-                min_threshold = product['min_threshold']
-                
-                # Simple algorithm: order 3x threshold or current stock, whichever is higher
-                recommended_qty = max(min_threshold * 3, current_qty * 2)
-                
-                urgency = 'Critical' if current_qty == 0 else 'High' if current_qty <= min_threshold // 2 else 'Medium'
-                
-                price = float(product.get('price', 0))
-                recommendations.append({
-                    'product_id': product['product_id'],
-                    'product_name': product['name'],
-                    'current_quantity': current_qty,
-                    'recommended_order': recommended_qty,
-                    'urgency': urgency,
-                    'estimated_cost': recommended_qty * price,
-                    'reason': f'Stock below threshold ({min_threshold})'
-                })
+        not_found = None
+        plan = None
+        if product_ids is not None:
+            # Only the requested products, of which the low-stock ones get a recommendation
+            try:
+                product_ids = parse_product_ids(product_ids)
+            except ValueError as e:
+                return bad_request(str(e), headers)
+            products = batch_get_products(partition, product_ids)
+            found = {product['product_id'] for product in products}
+            not_found = [p for p in product_ids if p not in found]
+            low_stock = [p for p in products if is_low_stock(p['quantity'], p['min_threshold'])]
+        else:
+            plan = get_restock_plan(partition)
+            low_stock = None if plan else get_low_stock_context(partition)
         
-        # Sort by urgency and current quantity
-        urgency_order = {'Critical': 0, 'High': 1, 'Medium': 2}
-        recommendations.sort(key=lambda x: (urgency_order[x['urgency']], x['current_quantity']))
+        if plan:
+            # Already sorted; shared between requests, so copied before adding narratives
+            recommendations = [dict(r) for r in plan['recommendations']] if narratives else plan['recommendations']
+        else:
+            recommendations = [build_recommendation(product) for product in low_stock]
+            recommendations.sort(key=recommendation_order)
+        if narratives:
+            add_narratives(recommendations)
         
         total_cost = sum(r['estimated_cost'] for r in recommendations)
         
+        result = {
+            'recommendations': recommendations,
+            'total_cost': round(total_cost, 2),
+            'message': f'{len(recommendations)} products need restocking'
+        }
+        if not_found is not None:
+            result['not_found'] = not_found
+        if plan:
+            result.update(generated_at=plan['generated_at'], stale=plan['stale'])
+        
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
-                'recommendations': recommendations,
-                'total_cost': round(total_cost, 2),
-                'message': f'{len(recommendations)} products need restocking'
-            })
+            'body': dumps(result)
         }
-        
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -248,91 +527,626 @@ def handle_recommendations(headers):
             'body': json.dumps({'error': f'Recommendations failed: {str(e)}'})
         }
 
-def get_stock_context():
-    """Get current stock data for AI context"""
-    try:
-        response = table.scan()
-        products = response['Items']
+def recommendation_order(recommendation):
+    """Sort by urgency and current quantity (then product ID, so precomputed and live lists agree)"""
+    return URGENCY_ORDER[recommendation['urgency']], recommendation['current_quantity'], recommendation['product_id']
+
+def bad_request(message, headers):
+    """400 response with an error message"""
+    return {
+        'statusCode': 400,
+        'headers': headers,
+        'body': json.dumps({'error': message})
+    }
+
+def parse_product_ids(value):
+    """Validate a product_ids list, dropping duplicates but keeping order"""
+    if not isinstance(value, list) or not value:
+        raise ValueError('product_ids must be a non-empty list')
+    if len(value) > REQUEST_MAX_PRODUCTS:
+        raise ValueError(f'At most {REQUEST_MAX_PRODUCTS} product_ids per request')
+    if not all(isinstance(product_id, str) and product_id for product_id in value):
+        raise ValueError('product_ids must be non-empty strings')
+    return list(dict.fromkeys(value))
+
+def batch_get_products(partition, product_ids):
+    """Fetch products of a partition by ID, one BatchGetItem call per 100 keys, run concurrently"""
+    if not product_ids:
+        return []
+    chunks = [product_ids[i:i + BATCH_GET_MAX_KEYS] for i in range(0, len(product_ids), BATCH_GET_MAX_KEYS)]
+    with ThreadPoolExecutor(max_workers=min(FETCH_MAX_WORKERS, len(chunks))) as executor:
+        fetched = executor.map(lambda chunk: batch_get_chunk(partition, chunk), chunks)
+        found = {item['product_id']: item for items in fetched for item in items}
+    
+    # Same shape as get_low_stock_context(), in request order
+    return [found[product_id] for product_id in product_ids if product_id in found]
+
+def batch_get_chunk(partition, product_ids):
+    """One BatchGetItem call, retrying unprocessed keys with exponential backoff"""
+    # Clients are thread-safe, resources are not
+    request = {PRODUCTS_TABLE: {'Keys': [client_product_key(partition, product_id) for product_id in product_ids]}}
+    items = []
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        response = dynamodb_client.batch_get_item(RequestItems=request)
+        items.extend(from_item(item) for item in response['Responses'].get(PRODUCTS_TABLE, []))
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return items
+        time.sleep(min(1.0, 0.05 * 2 ** attempt))
+    raise RuntimeError(f'{len(request[PRODUCTS_TABLE]["Keys"])} products still unprocessed after '
+                       f'{BATCH_GET_MAX_ATTEMPTS} attempts')
+
+def add_narratives(entries, key=None):
+    """
+    Attach a short Bedrock narrative to the most urgent entries.
+    
+    Calls run NARRATIVE_MAX_WORKERS at a time. Entries whose call fails or is
+    still pending after NARRATIVE_TIMEOUT_SECONDS (or at the request's
+    deadline) get a null narrative; entries past NARRATIVE_MAX_PRODUCTS get none.
+    """
+    selected = sorted(entries, key=key)[:NARRATIVE_MAX_PRODUCTS] if key else entries[:NARRATIVE_MAX_PRODUCTS]
+    if not selected:
+        return entries
+    
+    executor = ThreadPoolExecutor(max_workers=min(NARRATIVE_MAX_WORKERS, len(selected)))
+    futures = {executor.submit(call_bedrock_claude, narrative_prompt(entry)): entry for entry in selected}
+    done, _ = wait(futures, timeout=max(0.0, min(NARRATIVE_TIMEOUT_SECONDS, bedrock_resilience.remaining())))
+    # Don't wait for stragglers: queued calls are cancelled, running ones are left to finish
+    executor.shutdown(wait=False, cancel_futures=True)
+    
+    for future, entry in futures.items():
+        entry['narrative'] = future.result() if future in done and not future.exception() else None
+    return entries
+
+def narrative_prompt(entry):
+    """Prompt asking for a short explanation of one estimation or recommendation"""
+    return (
+        "You are a stock management assistant. In at most two sentences, explain this "
+        "stock situation to a store manager and what they should do next.\n"
+        f"{json.dumps(entry)}"
+    )
+
+def get_stock_context(partition, version=None):
+    """Get a partition's current stock data for AI context, served from the warm snapshot cache"""
+    if STOCK_CACHE_VERSION_CHECK and version is None:
+        version = get_inventory_version(partition)
+    
+    cache = _stock_caches.get(partition)
+    if is_stock_cache_fresh(cache, version):
+        record_stock_cache('hit', cache)
+        return cache['products']
+    
+    # Single-flight refresh: concurrent callers wait for one reload and reuse it
+    with _stock_cache_lock:
+        cache = _stock_caches.get(partition)
+        if is_stock_cache_fresh(cache, version):
+            record_stock_cache('hit', cache)
+            return cache['products']
         
-        # Convert Decimal to float for JSON serialization
-        for product in products:
-            if 'price' in product:
-                product['price'] = float(product['price'])
+        try:
+            products = query_stock_products(partition)
+        except Exception as e:
+            log_error("Error getting stock context", e, partition=partition)
+            record_count('StockCacheErrors')
+            # Serve the stale snapshot rather than nothing
+            return cache['products'] if cache else []
+        
+        if len(products) <= STOCK_CACHE_MAX_ITEMS:
+            cache = {'products': products, 'loaded_at': time.monotonic(), 'version': version}
+            _stock_caches[partition] = cache
+            _stock_caches.move_to_end(partition)
+            while len(_stock_caches) > STOCK_CACHE_MAX_PARTITIONS:
+                evicted, _ = _stock_caches.popitem(last=False)
+                _search_indexes.pop(evicted, None)
+                _vector_indexes.pop(evicted, None)
+            record_count('StockCacheRefreshes')
+        else:
+            # Too large to keep in memory, drop any previous snapshot
+            invalidate_stock_cache(partition)
+            cache = None
         
+        record_stock_cache('miss', cache)
         return products
+
+def query_stock_products(partition):
+    """Read a partition's full catalog, following query pages"""
+    products = []
+    query_kwargs = {
+        'TableName': PRODUCTS_TABLE,
+        'KeyConditionExpression': f'{PARTITION_ATTRIBUTE} = :partition',
+        'ExpressionAttributeValues': {':partition': {'S': partition}}
+    }
+    while True:
+        response = dynamodb_client.query(**query_kwargs)
+        products.extend(from_item(item) for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    return products
+
+def is_stock_cache_fresh(cache, version):
+    """Check a snapshot against TTL and, if enabled, the inventory version"""
+    if cache is None:
+        return False
+    if time.monotonic() - cache['loaded_at'] > STOCK_CACHE_TTL_SECONDS:
+        return False
+    if STOCK_CACHE_VERSION_CHECK and version != cache['version']:
+        return False
+    return True
+
+def get_search_index(partition):
+    """Search index over a partition's current inventory snapshot"""
+    stock_data = get_stock_context(partition)
+    with _search_index_lock:
+        state = _search_indexes.setdefault(partition, {'index': ProductSearchIndex(), 'snapshot': None})
+        if state['snapshot'] is not stock_data:
+            # sync() re-indexes only products whose version changed
+            state['index'].sync(stock_data)
+            state['snapshot'] = stock_data
+    return state['index']
+
+def get_vector_index(partition, stock_data=None):
+    """Embeddings of a partition's current inventory snapshot (or of stock_data, already loaded)"""
+    if stock_data is None:
+        stock_data = get_stock_context(partition)
+    with _vector_index_lock:
+        state = _vector_indexes.get(partition)
+        if state is None:
+            state = _vector_indexes[partition] = {
+                'index': ProductVectorIndex(make_embedder(CHAT_EMBEDDER, EMBEDDING_DIMENSIONS)),
+                'snapshot': None
+            }
+        if state['snapshot'] is not stock_data:
+            # sync() embeds only products whose version changed
+            changed = state['index'].sync(stock_data)
+            state['snapshot'] = stock_data
+            record_count('VectorIndexChanged', changed)
+            annotate(vector_index_products=len(state['index']))
+    return state['index']
+
+def retrieve_products(partition, user_message, stock_data):
+    """The products closest to a question, best first; [] if retrieval fails"""
+    try:
+        index = get_vector_index(partition, stock_data)
+        matches = index.search(' '.join(tokenize(user_message)), limit=CHAT_RETRIEVAL_MAX_PRODUCTS,
+                               min_score=CHAT_RETRIEVAL_MIN_SCORE)
+        return [product for product, _ in matches]
     except Exception as e:
-        print(f"Error getting stock context: {e}")
+        log_error("Product retrieval error", e, partition=partition)
         return []
 
-def call_bedrock_claude(prompt):
-    """Call AWS Bedrock Claude for AI responses"""
+def invalidate_stock_cache(partition):
+    """Drop a partition's warm inventory snapshot"""
+    _stock_caches.pop(partition, None)
+
+def get_inventory_version(partition):
+    """A partition's inventory version counter, or None before its first change (or if unreadable)"""
     try:
-        # Prepare request for Claude
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 300,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
+        return read_inventory_version(metadata_table, partition)
+    except Exception as e:
+        log_error("Error getting inventory version", e)
+        return None
+
+def get_cached_chat_response(cache_key):
+    """Look up a cached Bedrock answer, dropping it once past its TTL"""
+    with _chat_cache_lock:
+        entry = _chat_cache.get(cache_key)
+        if entry is None or time.monotonic() - entry['cached_at'] > CHAT_CACHE_TTL_SECONDS:
+            if entry is not None:
+                del _chat_cache[cache_key]
+            record_count('ChatCacheMisses')
+            annotate(chat_cache_size=len(_chat_cache))
+            return None
+        _chat_cache.move_to_end(cache_key)
+        record_count('ChatCacheHits')
+        annotate(chat_cache_size=len(_chat_cache))
+        return entry['response']
+
+def put_cached_chat_response(cache_key, response):
+    """Store a Bedrock answer, evicting the least recently used entries"""
+    with _chat_cache_lock:
+        _chat_cache[cache_key] = {'response': response, 'cached_at': time.monotonic()}
+        _chat_cache.move_to_end(cache_key)
+        while len(_chat_cache) > CHAT_CACHE_MAX_ENTRIES:
+            _chat_cache.popitem(last=False)
+            record_count('ChatCacheEvictions')
+
+def get_inventory_totals(partition):
+    """A partition's product count and total value from its pre-aggregated summary item"""
+    try:
+        response = metadata_table.get_item(Key={'meta_key': scoped_key(INVENTORY_SUMMARY_KEY, partition)})
+        if 'Item' in response:
+            item = response['Item']
+            return int(item.get('product_count', 0)), float(item.get('total_value', 0))
+    except Exception as e:
+        log_error("Error getting inventory summary", e)
+    
+    # Summary not built yet: compute from the snapshot
+    stock_data = get_stock_context(partition)
+    total_value = sum(float(p.get('price', 0)) * float(p['quantity']) for p in stock_data)
+    return len(stock_data), total_value
+
+def record_stock_cache(result, cache):
+    """Count a snapshot cache lookup, noting the age and size of the snapshot served"""
+    record_count('StockCacheHits' if result == 'hit' else 'StockCacheMisses')
+    annotate(
+        stock_cache_partitions=len(_stock_caches),
+        stock_cache_age_seconds=round(time.monotonic() - cache['loaded_at'], 3) if cache else None,
+        stock_cache_size=len(cache['products']) if cache else 0
+    )
+
+def get_low_stock_context(partition):
+    """Get only a partition's low-stock products from the sparse low-stock index"""
+    try:
+        query_kwargs = {
+            'TableName': PRODUCTS_TABLE,
+            'IndexName': LOW_STOCK_INDEX,
+            'KeyConditionExpression': f'{LOW_STOCK_ATTRIBUTE} = :partition',
+            'ExpressionAttributeValues': {':partition': {'S': partition}}
         }
+        products = []
+        while True:
+            response = dynamodb_client.query(**query_kwargs)
+            products.extend(from_item(item) for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
-        # Call Bedrock
+        return products
+    except Exception as e:
+        log_error("Error getting low stock context", e)
+        return []
+
+def bedrock_request_body(prompt):
+    """Prepare request for Claude"""
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": BEDROCK_MAX_TOKENS,
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    })
+
+def call_bedrock_claude(prompt):
+    """Call AWS Bedrock Claude for AI responses; BedrockUnavailable when it can't answer in time"""
+    def invoke():
         response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            body=json.dumps(request_body),
+            modelId=BEDROCK_MODEL_ID,
+            body=bedrock_request_body(prompt),
             contentType="application/json"
         )
-        
-        # Parse response
+        # Parse response (reading the body is part of the attempt's time)
         response_body = json.loads(response['body'].read())
         return response_body['content'][0]['text']
-        
-    except Exception as e:
-        print(f"Bedrock error: {e}")
-        return f"AI temporarily unavailable. Error: {str(e)}"
+    
+    return bedrock_resilience.call(invoke)
 
-def generate_simple_estimation(product):
-    """Generate simple demand estimation for a product"""
+def load_demand_history(partition, product_ids, days=HISTORY_DAYS):
+    """Load daily outbound units for the last `days` days as an (n_skus, days) matrix"""
+    start_day = datetime.now().date() - timedelta(days=days - 1)
+    key_names = {'#day': 'day'}
+    rows = []
+    # Movement buckets are keyed by product ID scoped to its partition
+    history_keys = {scoped_key(product_id, partition): product_id for product_id in product_ids}
+    
+    def collect(items):
+        for item in items:
+            if item['product_id'] not in history_keys:
+                continue
+            day_index = (datetime.fromisoformat(item['day']).date() - start_day).days
+            rows.append((history_keys[item['product_id']], day_index, float(item.get('outbound', 0))))
+    
     try:
-        current_qty = product['quantity']
-        min_threshold = product['min_threshold']
+        if len(product_ids) <= HISTORY_QUERY_MAX_PRODUCTS:
+            # Few products: one Query per product over its recent days, run concurrently
+            with ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS) as executor:
+                for items in executor.map(lambda key: query_demand_history(key, start_day), history_keys):
+                    collect(items)
+        else:
+            # Whole catalog: one filtered scan of the (TTL-bounded) history table
+            scan_kwargs = {
+                'FilterExpression': '#day >= :start_day',
+                'ExpressionAttributeNames': key_names,
+                'ExpressionAttributeValues': {':start_day': start_day.isoformat()}
+            }
+            while True:
+                response = movements_table.scan(**scan_kwargs)
+                collect(response['Items'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        log_error("Error loading demand history", e)
+    
+    return build_history_matrix(product_ids, rows, days)
+
+def query_demand_history(history_key, start_day):
+    """Daily movement buckets of one product (by its scoped key) since start_day"""
+    # Clients are thread-safe, resources are not
+    client = dynamodb.meta.client
+    query_kwargs = {
+        'TableName': movements_table.name,
+        'KeyConditionExpression': 'product_id = :product_id AND #day >= :start_day',
+        'ExpressionAttributeNames': {'#day': 'day'},
+        'ExpressionAttributeValues': {':product_id': history_key, ':start_day': start_day.isoformat()}
+    }
+    items = []
+    while True:
+        response = client.query(**query_kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def generate_estimations(partition, products):
+    """Generate demand estimations for many products of a partition in one vectorized pass"""
+    if not products:
+        return []
+    
+    product_ids = [p['product_id'] for p in products]
+    quantities = [float(p['quantity']) for p in products]
+    history = load_demand_history(partition, product_ids)
+    with span('forecast'):
+        forecast = forecast_demand(history, quantities)
+    generated_at = datetime.now().isoformat()
+    
+    estimations = []
+    for i, product in enumerate(products):
+        current_qty = int(product['quantity'])
+        min_threshold = int(product['min_threshold'])
+        daily_demand = float(forecast['daily_forecast'][i])
+        days_left = float(forecast['days_to_stockout'][i])
+        days_until_stockout = None if days_left == float('inf') else int(days_left)
         
-        # Simple estimation algorithm
-        if current_qty == 0:
+        if current_qty <= 0 or (days_until_stockout is not None and days_until_stockout <= 3):
             urgency = "Critical"
-            days_until_stockout = 0
             recommended_action = "Order immediately"
-        elif current_qty <= min_threshold // 2:
+        elif current_qty <= min_threshold // 2 or (days_until_stockout is not None and days_until_stockout <= 7):
             urgency = "High"
-            days_until_stockout = random.randint(3, 7)
             recommended_action = "Order within 24 hours"
-        else:
+        elif current_qty <= min_threshold or (days_until_stockout is not None and days_until_stockout <= 21):
             urgency = "Medium"
-            days_until_stockout = random.randint(7, 21)
             recommended_action = "Plan order this week"
+        else:
+            urgency = "Low"
+            recommended_action = "No action needed"
         
-        # Simulate demand forecast
-        weekly_demand = random.randint(1, max(1, current_qty // 2))
-        monthly_demand = weekly_demand * 4
-        
-        return {
+        estimations.append({
             'product_id': product['product_id'],
             'product_name': product['name'],
             'current_stock': current_qty,
-            'estimated_weekly_demand': weekly_demand,
-            'estimated_monthly_demand': monthly_demand,
+            'estimated_daily_demand': round(daily_demand, 2),
+            'estimated_weekly_demand': round(daily_demand * 7, 1),
+            'estimated_monthly_demand': round(daily_demand * 30, 1),
             'estimated_days_until_stockout': days_until_stockout,
             'urgency_level': urgency,
             'recommended_action': recommended_action,
-            'confidence': random.randint(75, 95),  # Simulated confidence
-            'generated_at': datetime.now().isoformat()
-        }
+            'confidence': int(round(float(forecast['confidence'][i]))),
+            'forecast_method': f'Exponential smoothing + {HISTORY_DAYS}-day moving average',
+            'generated_at': generated_at
+        })
+    
+    return estimations
+
+def compute_full_results(partition, products):
+    """Result blobs for a partition's whole catalog: the restock plan and the estimations by shard"""
+    shard_count = max(1, -(-len(products) // ESTIMATION_SHARD_PRODUCTS))
+    with span('estimate'):
+        estimations = generate_estimations(partition, products)
+    
+    shards = {f'shard:{i}': {} for i in range(shard_count)}
+    recommendations = []
+    low_stock_estimations = []
+    for product, estimation in zip(products, estimations):
+        product_id = product['product_id']
+        shards[f'shard:{results_store.shard_of(product_id, shard_count)}'][product_id] = estimation
+        if is_low_stock(product['quantity'], product['min_threshold']):
+            recommendations.append(build_recommendation(product))
+            low_stock_estimations.append(estimation)
+    
+    recommendations.sort(key=recommendation_order)
+    low_stock_estimations.sort(key=estimation_order)
+    blobs = {'plan': {'recommendations': recommendations, 'estimations': low_stock_estimations}, **shards}
+    counts = {'products': len(products), 'low_stock': len(recommendations), 'shard_count': shard_count}
+    return blobs, counts
+
+def estimation_order(estimation):
+    """Low-stock estimations come lowest stock first, like the low-stock index"""
+    return estimation['current_stock'], estimation['product_id']
+
+def publish_full_results(partition, blobs, counts, started_from):
+    """
+    Write the blobs of a full run and point readers at them.
+    
+    A refresh published since the run started (from the `started_from`
+    pointer) loses its delta: its products are queued again so the next
+    refresh recomputes them.
+    """
+    tag = results_store.new_tag()
+    with span('write_results'):
+        refs = results_store.write_blobs(dynamodb_client, METADATA_TABLE, partition, tag, blobs)
+    now = datetime.now().isoformat()
+    fields = {**counts, 'generated_at': now, 'refreshed_at': now, 'delta_products': 0}
+    
+    for attempt in range(PUBLISH_MAX_ATTEMPTS):
+        current = results_store.read_pointer(dynamodb_client, METADATA_TABLE, partition)
+        pointer = results_store.publish(dynamodb_client, METADATA_TABLE, partition, current, fields, refs)
+        if pointer:
+            replaced_refresh = current and (not started_from or current['version'] != started_from['version'])
+            if replaced_refresh and 'delta' in current['blobs']:
+                delta = load_result_blobs(partition, current, ['delta'])['delta']
+                results_store.requeue_dirty(dynamodb_client, METADATA_TABLE, partition, sorted(delta))
+            return pointer
+    
+    results_store.delete_blobs(dynamodb_client, METADATA_TABLE, partition, refs)
+    raise RuntimeError(f'Results not published after {PUBLISH_MAX_ATTEMPTS} attempts')
+
+def get_materialized_results(partition):
+    """
+    A partition's current results pointer and whether it is stale, or None without precomputed results.
+    
+    Checked at most every RESULTS_CHECK_SECONDS per container. Products
+    queued as changed since the pointer was written are recomputed first
+    when there are few enough of them.
+    """
+    if not PRECOMPUTED_RESULTS:
+        return None
+    state = _results.get(partition)
+    if state and time.monotonic() - state['checked_at'] <= RESULTS_CHECK_SECONDS:
+        return state['pointer']
+    
+    # Single-flight: concurrent callers wait for one check (and refresh) and reuse it
+    with _results_lock:
+        state = _results.setdefault(partition, {'pointer': None, 'checked_at': 0.0, 'plan': None})
+        if time.monotonic() - state['checked_at'] <= RESULTS_CHECK_SECONDS:
+            return state['pointer']
+        try:
+            pointer = results_store.read_pointer(dynamodb_client, METADATA_TABLE, partition)
+            stale = False
+            if pointer:
+                dirty, overflowed = results_store.read_dirty(dynamodb_client, METADATA_TABLE, partition)
+                too_many = (len(dirty) > INCREMENTAL_MAX_PRODUCTS
+                            or pointer['delta_products'] + len(dirty) > DELTA_MAX_PRODUCTS)
+                if overflowed or too_many:
+                    # Left for the next full run
+                    stale = True
+                elif dirty:
+                    with span('refresh_results'):
+                        refreshed = refresh_results(partition, pointer, dirty)
+                    stale = refreshed is None
+                    pointer = refreshed or pointer
+        except Exception as e:
+            log_error("Error reading precomputed results", e, partition=partition)
+            # Serve live results until the next check
+            pointer = None
+        
+        state['pointer'] = dict(pointer, stale=stale) if pointer else None
+        state['checked_at'] = time.monotonic()
+        return state['pointer']
+
+def refresh_results(partition, pointer, product_ids):
+    """
+    Recompute changed products into a new delta and publish it; None if that was not possible.
+    
+    The delta holds every product refreshed since the last full run: its
+    estimation, and its recommendation while it is low on stock (None for a
+    product that was deleted).
+    """
+    claimed, _ = results_store.claim_dirty(dynamodb_client, METADATA_TABLE, partition, product_ids)
+    refs = None
+    try:
+        delta = dict(load_result_blobs(partition, pointer, ['delta']).get('delta', {}))
+        products = batch_get_products(partition, claimed)
+        for product, estimation in zip(products, generate_estimations(partition, products)):
+            recommendation = None
+            if is_low_stock(product['quantity'], product['min_threshold']):
+                recommendation = build_recommendation(product)
+            delta[product['product_id']] = {'estimation': estimation, 'recommendation': recommendation}
+        found = {product['product_id'] for product in products}
+        delta.update((product_id, None) for product_id in claimed if product_id not in found)
         
+        refs = results_store.write_blobs(dynamodb_client, METADATA_TABLE, partition, results_store.new_tag(),
+                                         {'delta': delta})
+        fields = {name: pointer[name] for name in ('products', 'low_stock', 'shard_count', 'generated_at')}
+        fields.update(refreshed_at=datetime.now().isoformat(), delta_products=len(delta))
+        published = results_store.publish(dynamodb_client, METADATA_TABLE, partition, pointer, fields,
+                                          {**pointer['blobs'], **refs})
+    except Exception:
+        results_store.requeue_dirty(dynamodb_client, METADATA_TABLE, partition, claimed)
+        raise
+    
+    if published is None:
+        # Another refresh or full run got there first
+        results_store.delete_blobs(dynamodb_client, METADATA_TABLE, partition, refs)
+        results_store.requeue_dirty(dynamodb_client, METADATA_TABLE, partition, claimed)
+    return published
+
+def load_result_blobs(partition, pointer, names):
+    """Decoded blobs of a results version, through an LRU cache (shared: read-only)"""
+    refs = {name: pointer['blobs'][name] for name in names if name in pointer['blobs']}
+    blobs = {}
+    with _results_blobs_lock:
+        for name, ref in refs.items():
+            key = (name, ref['tag'])
+            if key in _results_blobs:
+                _results_blobs.move_to_end(key)
+                blobs[name] = _results_blobs[key]
+    
+    missing = {name: ref for name, ref in refs.items() if name not in blobs}
+    if missing:
+        loaded = results_store.read_blobs(dynamodb_client, METADATA_TABLE, partition, missing)
+        with _results_blobs_lock:
+            for name, value in loaded.items():
+                _results_blobs[(name, refs[name]['tag'])] = value
+            while len(_results_blobs) > RESULTS_CACHE_MAX_BLOBS:
+                _results_blobs.popitem(last=False)
+        blobs.update(loaded)
+    return blobs
+
+def get_restock_plan(partition):
+    """
+    A partition's precomputed recommendations and low-stock estimations with the delta applied, or None.
+    
+    Merged once per results version; the lists are shared between requests.
+    """
+    pointer = get_materialized_results(partition)
+    if not pointer:
+        return None
+    state = _results[partition]
+    plan = state['plan']
+    if plan and plan['version'] == pointer['version']:
+        return dict(plan, stale=pointer['stale'])
+    
+    try:
+        blobs = load_result_blobs(partition, pointer, ['plan', 'delta'])
     except Exception as e:
-        return {
-            'error': f'Estimation failed: {str(e)}',
-            'product_id': product.get('product_id', 'unknown')
-        }
\ No newline at end of file
+        log_error("Error loading precomputed plan", e)
+        return None
+    delta = blobs.get('delta', {})
+    recommendations = [r for r in blobs['plan']['recommendations'] if r['product_id'] not in delta]
+    estimations = [e for e in blobs['plan']['estimations'] if e['product_id'] not in delta]
+    for entry in delta.values():
+        if entry and entry['recommendation']:
+            recommendations.append(entry['recommendation'])
+            estimations.append(entry['estimation'])
+    recommendations.sort(key=recommendation_order)
+    estimations.sort(key=estimation_order)
+    
+    plan = {
+        'version': pointer['version'],
+        'generated_at': pointer['generated_at'],
+        'recommendations': recommendations,
+        'estimations': estimations
+    }
+    state['plan'] = plan
+    return dict(plan, stale=pointer['stale'])
+
+def get_materialized_estimations(partition, product_ids):
+    """Precomputed estimations of the given products that have one, or None without precomputed results"""
+    pointer = get_materialized_results(partition)
+    if not pointer:
+        return None
+    
+    shard_count = pointer['shard_count']
+    names = {f'shard:{results_store.shard_of(product_id, shard_count)}' for product_id in product_ids}
+    try:
+        blobs = load_result_blobs(partition, pointer, sorted(names) + ['delta'])
+    except Exception as e:
+        log_error("Error loading precomputed estimations", e)
+        return None
+    delta = blobs.get('delta', {})
+    
+    estimations = {}
+    for product_id in product_ids:
+        if product_id in delta:
+            estimation = delta[product_id] and delta[product_id]['estimation']
+        else:
+            shard = blobs.get(f'shard:{results_store.shard_of(product_id, shard_count)}', {})
+            estimation = shard.get(product_id)
+        if estimation:
+            estimations[product_id] = estimation
+    return {'estimations': estimations, 'stale': pointer['stale']}
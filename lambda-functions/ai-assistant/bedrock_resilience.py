@@ -0,0 +1,168 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from botocore.exceptions import BotoCoreError, ClientError
+from instrumentation import log_error, record_bedrock_event
+
+# Every Bedrock call of a request shares one deadline: the Lambda's remaining
+# time, capped at REQUEST_BUDGET_SECONDS (API Gateway gives up on the request
+# after 29s whatever the function timeout), minus RESPONSE_RESERVE_SECONDS
+# left for the keyword fallback and for sending the response.
+REQUEST_BUDGET_SECONDS = float(os.environ.get('REQUEST_BUDGET_SECONDS', '28'))
+RESPONSE_RESERVE_SECONDS = float(os.environ.get('RESPONSE_RESERVE_SECONDS', '2'))
+
+# One attempt is abandoned after BEDROCK_ATTEMPT_TIMEOUT_SECONDS. Throttling,
+# timeouts and 5xx errors are retried up to BEDROCK_MAX_ATTEMPTS times in all,
+# with full-jitter exponential backoff, as long as the deadline leaves room
+# for another attempt of at least MIN_ATTEMPT_SECONDS.
+BEDROCK_ATTEMPT_TIMEOUT_SECONDS = float(os.environ.get('BEDROCK_ATTEMPT_TIMEOUT_SECONDS', '12'))
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '3'))
+BACKOFF_BASE_SECONDS = float(os.environ.get('BEDROCK_BACKOFF_BASE_SECONDS', '0.2'))
+BACKOFF_MAX_SECONDS = float(os.environ.get('BEDROCK_BACKOFF_MAX_SECONDS', '2'))
+MIN_ATTEMPT_SECONDS = 1.0
+RETRYABLE_CODES = ('ThrottlingException', 'ServiceUnavailableException', 'InternalServerException',
+                   'ModelNotReadyException', 'ModelTimeoutException')
+
+# Circuit breaker, shared by the requests of a warm container: after
+# BREAKER_FAILURES failed attempts in a row, calls fail fast for
+# BREAKER_COOLDOWN_SECONDS, then one probe call decides whether to close it.
+BREAKER_FAILURES = int(os.environ.get('BEDROCK_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get('BEDROCK_BREAKER_COOLDOWN_SECONDS', '30'))
+
+# Deadline of the invocation in progress (one at a time per container, shared
+# by its worker threads, like the instrumentation's request metrics)
+_deadline = {'at': None}
+
+class BedrockUnavailable(Exception):
+    """No answer from Bedrock within the request's budget; `reason` says why"""
+    
+    def __init__(self, reason, error=None):
+        super().__init__(f'Bedrock unavailable ({reason})' + (f': {error}' if error else ''))
+        self.reason = reason
+
+class CircuitBreaker:
+    """Closed, open (failing fast) or half-open (letting one probe call through)"""
+    
+    def __init__(self, failures, cooldown_seconds):
+        self.failures = failures
+        self.cooldown = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+    
+    def allow(self):
+        """Whether a call may go out now"""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+    
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.probing or self.consecutive_failures >= self.failures:
+                if self.opened_at is None or self.probing:
+                    log_error("Bedrock circuit breaker opened", failures=self.consecutive_failures)
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN_SECONDS)
+
+def start_request(context):
+    """Set the Bedrock deadline of a new invocation from its Lambda context (None outside Lambda)"""
+    budget = REQUEST_BUDGET_SECONDS
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000)
+    _deadline['at'] = time.monotonic() + budget - RESPONSE_RESERVE_SECONDS
+
+def remaining():
+    """Seconds left for Bedrock calls in this invocation"""
+    if _deadline['at'] is None:
+        return REQUEST_BUDGET_SECONDS - RESPONSE_RESERVE_SECONDS
+    return _deadline['at'] - time.monotonic()
+
+def run_in_thread(function, *args):
+    """
+    Start function(*args) on its own daemon thread and return its Future.
+    
+    Not a pool: a call abandoned at its timeout keeps its thread until
+    botocore's read timeout, and must not hold up the calls after it.
+    """
+    future = Future()
+    
+    def run():
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+def is_retryable(error):
+    if isinstance(error, ClientError):
+        return error.response['Error']['Code'] in RETRYABLE_CODES
+    # Connection errors and botocore's own timeouts
+    return isinstance(error, BotoCoreError)
+
+def call(request):
+    """
+    Run one Bedrock request (a function of no arguments) within the request's deadline.
+    
+    Raises BedrockUnavailable when the circuit is open, the deadline leaves
+    no room for an attempt, or every attempt failed; non-retryable errors
+    (such as a validation error) are raised as BedrockUnavailable too.
+    """
+    for attempt in range(BEDROCK_MAX_ATTEMPTS):
+        budget = min(BEDROCK_ATTEMPT_TIMEOUT_SECONDS, remaining())
+        if budget < MIN_ATTEMPT_SECONDS:
+            raise BedrockUnavailable('deadline')
+        if not breaker.allow():
+            record_bedrock_event('rejected')
+            raise BedrockUnavailable('circuit_open')
+        
+        try:
+            result = run_in_thread(request).result(timeout=budget)
+        except FutureTimeout:
+            record_bedrock_event('timeouts')
+            error = None
+            reason = 'timeout'
+        except Exception as e:
+            if not is_retryable(e):
+                # Bedrock answered: not a sign that it is down
+                breaker.record_success()
+                raise BedrockUnavailable('error', e) from e
+            error = e
+            throttled = isinstance(e, ClientError) and e.response['Error']['Code'] == 'ThrottlingException'
+            reason = 'throttled' if throttled else 'error'
+        else:
+            breaker.record_success()
+            return result
+        
+        breaker.record_failure()
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if attempt == BEDROCK_MAX_ATTEMPTS - 1 or remaining() - delay < MIN_ATTEMPT_SECONDS:
+            raise BedrockUnavailable(reason, error)
+        record_bedrock_event('retries')
+        time.sleep(delay)
@@ -0,0 +1,78 @@
+# Forecast settings
+HISTORY_DAYS = 28
+SHORT_WINDOW = 7
+SMOOTHING_ALPHA = 0.3
+
+def forecast_demand(history, quantities, alpha=SMOOTHING_ALPHA):
+    """
+    Forecast daily demand for many SKUs at once.
+    
+    history: (n_skus, n_days) array of daily outbound units, oldest day first
+    quantities: (n_skus,) array of units currently in stock
+    Returns a dict of (n_skus,) arrays.
+    """
+    # Imported here so routes that never forecast don't pay for numpy on a cold start
+    import numpy as np
+    
+    history = np.asarray(history, dtype=np.float64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    n_skus, n_days = history.shape
+    
+    if n_days == 0:
+        zeros = np.zeros(n_skus)
+        return {
+            'moving_average_7': zeros,
+            'moving_average_28': zeros,
+            'smoothed': zeros,
+            'daily_forecast': zeros,
+            'days_to_stockout': np.full(n_skus, np.inf),
+            'confidence': zeros
+        }
+    
+    # Moving averages over the most recent days
+    moving_average_short = history[:, -SHORT_WINDOW:].mean(axis=1)
+    moving_average_long = history[:, -HISTORY_DAYS:].mean(axis=1)
+    
+    # Simple exponential smoothing, vectorized across SKUs (loop over days only)
+    smoothed = history[:, 0].copy()
+    for day in range(1, n_days):
+        smoothed = alpha * history[:, day] + (1 - alpha) * smoothed
+    
+    # Blend recent trend and smoothed level
+    daily_forecast = 0.5 * smoothed + 0.25 * moving_average_short + 0.25 * moving_average_long
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_to_stockout = np.where(daily_forecast > 0, quantities / daily_forecast, np.inf)
+        # Stable demand and a full window of data give higher confidence
+        mean = history.mean(axis=1)
+        # No demand observed at all gives zero confidence
+        variation = np.where(mean > 0, history.std(axis=1) / mean, np.inf)
+    coverage = min(1.0, n_days / HISTORY_DAYS)
+    confidence = np.clip(100.0 * coverage / (1.0 + variation), 0, 100)
+    
+    days_to_stockout = np.where(quantities <= 0, 0.0, days_to_stockout)
+    
+    return {
+        'moving_average_7': moving_average_short,
+        'moving_average_28': moving_average_long,
+        'smoothed': smoothed,
+        'daily_forecast': daily_forecast,
+        'days_to_stockout': days_to_stockout,
+        'confidence': confidence
+    }
+
+def build_history_matrix(product_ids, daily_rows, days):
+    """
+    Turn movement rows into a (n_skus, n_days) outbound matrix.
+    
+    daily_rows: iterable of (product_id, day_index, outbound) with day_index in [0, days)
+    """
+    import numpy as np
+    
+    index = {product_id: i for i, product_id in enumerate(product_ids)}
+    history = np.zeros((len(product_ids), days), dtype=np.float64)
+    rows = [(index[p], d, units) for p, d, units in daily_rows if p in index and 0 <= d < days]
+    if rows:
+        sku_idx, day_idx, units = zip(*rows)
+        np.add.at(history, (np.array(sku_idx), np.array(day_idx)), np.array(units, dtype=np.float64))
+    return history
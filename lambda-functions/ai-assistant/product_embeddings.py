@@ -0,0 +1,306 @@
+import json
+import math
+import zlib
+from product_search import FIELD_WEIGHTS, product_version, tokenize
+
+# Character trigrams let "laptop", "lapto" and "latpop" land close to each
+# other. Together they weigh TRIGRAM_WEIGHT against 1.0 for the whole word,
+# so a word with a typo keeps most of its vector.
+TRIGRAM_WEIGHT = 5.0
+MIN_TRIGRAM_LENGTH = 3
+
+# Token vectors are memoized; the memo starts over past this many tokens.
+# Documents are embedded EMBED_BATCH_DOCUMENTS at a time to bound memory.
+FEATURE_CACHE_MAX_TOKENS = 200000
+EMBED_BATCH_DOCUMENTS = 2048
+
+# IDF weight of a question word no product contains (a typo, or a word like
+# "something"): its trigrams can still match, but it must not outweigh the
+# words that do occur in the catalog
+UNKNOWN_TERM_WEIGHT = 1.0
+
+class HashingEmbedder:
+    """
+    Offline embedder: words and their character trigrams hashed into signed buckets.
+    
+    Needs no model, network or fitting, so a product's vector depends only on
+    its own text and can be computed the moment it changes. Question terms
+    are weighted by ProductVectorIndex, which knows the catalog.
+    
+    Any object with `name`, `dimensions` and `embed(documents)` can stand in
+    for it (see EMBEDDERS).
+    """
+    
+    name = 'hashing'
+    
+    def __init__(self, dimensions=128):
+        import numpy as np
+        
+        self.dimensions = dimensions
+        self.token_rows = {}  # token -> row of token_vectors
+        self.token_vectors = np.zeros((0, dimensions), dtype=np.float32)
+    
+    def token_vector(self, token):
+        """Hashed features of one token, before normalization"""
+        import numpy as np
+        
+        grams = [(token, 1.0)]
+        if len(token) >= MIN_TRIGRAM_LENGTH and token.isalpha():
+            padded = f'<{token}>'
+            trigrams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+            grams.extend((gram, TRIGRAM_WEIGHT / len(trigrams)) for gram in trigrams)
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for gram, weight in grams:
+            digest = zlib.crc32(gram.encode('utf-8'))
+            # Signed hashing: collisions cancel out on average instead of adding up
+            vector[digest % self.dimensions] += weight if (digest // self.dimensions) % 2 else -weight
+        return vector
+    
+    def token_row(self, token):
+        """Row of a token's vector in token_vectors, hashing it on first use"""
+        import numpy as np
+        
+        row = self.token_rows.get(token)
+        if row is None:
+            row = self.token_rows[token] = len(self.token_rows)
+            if row == self.token_vectors.shape[0]:
+                grown = np.zeros((max(1024, 2 * row), self.dimensions), dtype=np.float32)
+                grown[:row] = self.token_vectors
+                self.token_vectors = grown
+            self.token_vectors[row] = self.token_vector(token)
+        return row
+    
+    def embed(self, documents):
+        """
+        L2-normalized vectors of documents, as a (len(documents), dimensions) float32 array.
+        
+        Each document is a {token: weight} dict (see product_terms).
+        """
+        import numpy as np
+        
+        if len(self.token_rows) >= FEATURE_CACHE_MAX_TOKENS:
+            self.token_rows = {}
+        matrix = np.zeros((len(documents), self.dimensions), dtype=np.float32)
+        for start in range(0, len(documents), EMBED_BATCH_DOCUMENTS):
+            rows, token_rows, weights = [], [], []
+            for row, terms in enumerate(documents[start:start + EMBED_BATCH_DOCUMENTS], start):
+                for token, weight in terms.items():
+                    rows.append(row)
+                    token_rows.append(self.token_row(token))
+                    weights.append(weight)
+            if not rows:
+                continue
+            # Sum each document's token vectors (rows are in order, so one reduceat does it)
+            rows = np.asarray(rows)
+            contributions = self.token_vectors[token_rows] * np.asarray(weights, dtype=np.float32)[:, None]
+            firsts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            matrix[rows[firsts]] = np.add.reduceat(contributions, firsts, axis=0)
+        
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+EMBEDDERS = {'hashing': HashingEmbedder}
+
+def make_embedder(name, dimensions):
+    """Embedder registered under a name; ValueError for an unknown one"""
+    if name not in EMBEDDERS:
+        raise ValueError(f'Unknown embedder {name!r}; expected one of {", ".join(sorted(EMBEDDERS))}')
+    return EMBEDDERS[name](dimensions)
+
+def product_terms(product):
+    """A product's tokens, weighted by the fields they appear in"""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(product.get(field)):
+            terms[token] = terms.get(token, 0.0) + weight
+    return terms
+
+class ProductVectorIndex:
+    """
+    Product embeddings in one float32 matrix, searched by brute force.
+    
+    Rows are kept contiguous (a removed row is replaced by the last one), so
+    a query is a single matrix-vector product plus a partial sort, a few
+    milliseconds for 100k products. Like ProductSearchIndex, it is synced
+    incrementally: only products whose version changed are embedded again.
+    Question terms are weighted by their inverse document frequency over the
+    indexed products (product vectors keep raw term weights, so they stay
+    valid as the catalog changes).
+    
+    save() writes the matrix as .npy and load() memory-maps it back, so an
+    index built once can be reopened without reading it all into memory.
+    """
+    
+    def __init__(self, embedder):
+        import numpy as np
+        
+        self.embedder = embedder
+        self.vectors = np.zeros((0, embedder.dimensions), dtype=np.float32)  # rows [0, len) in use
+        self.product_ids = []   # row -> product_id
+        self.rows = {}          # product_id -> row
+        self.products = {}      # product_id -> product
+        self.versions = {}      # product_id -> updated_at/version seen when embedded
+        self.term_counts = {}   # token -> number of indexed products containing it
+    
+    def __len__(self):
+        return len(self.product_ids)
+    
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes
+    
+    def reserve(self, rows):
+        """Make room for `rows` rows, copying a memory-mapped matrix into memory on first write"""
+        import numpy as np
+        
+        capacity = self.vectors.shape[0]
+        if rows <= capacity and self.vectors.flags.writeable:
+            return
+        if rows > capacity:
+            capacity = max(rows, 16, 2 * capacity)
+        vectors = np.zeros((capacity, self.embedder.dimensions), dtype=np.float32)
+        vectors[:len(self)] = self.vectors[:len(self)]
+        self.vectors = vectors
+    
+    def add_many(self, products):
+        """Embed and index products in one batch, replacing any previous versions"""
+        if not products:
+            return
+        terms = [product_terms(product) for product in products]
+        embedded = self.embedder.embed(terms)
+        new_rows = sum(1 for product in products if product['product_id'] not in self.rows)
+        self.reserve(len(self) + new_rows)
+        
+        for product, product_tokens, vector in zip(products, terms, embedded):
+            product_id = product['product_id']
+            row = self.rows.get(product_id)
+            if row is None:
+                row = self.rows[product_id] = len(self.product_ids)
+                self.product_ids.append(product_id)
+            old = self.products.get(product_id)
+            if old is not None:
+                self.count_terms(product_terms(old), -1)
+            self.count_terms(product_tokens, 1)
+            self.vectors[row] = vector
+            self.products[product_id] = product
+            self.versions[product_id] = product_version(product)
+    
+    def add(self, product):
+        """Index a product, replacing any previous version"""
+        self.add_many([product])
+    
+    def remove(self, product_id):
+        """Drop a product from the index"""
+        row = self.rows.pop(product_id, None)
+        old = self.products.pop(product_id, None)
+        if old is not None:
+            self.count_terms(product_terms(old), -1)
+        self.versions.pop(product_id, None)
+        if row is None:
+            return
+        self.reserve(len(self))
+        last = len(self.product_ids) - 1
+        if row != last:
+            # Keep rows contiguous: the last row takes the removed one's place
+            moved = self.product_ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.product_ids[row] = moved
+            self.rows[moved] = row
+        self.vectors[last] = 0
+        self.product_ids.pop()
+    
+    def sync(self, products):
+        """Bring the index in line with a full product list, embedding only what changed"""
+        seen = set()
+        changed = []
+        for product in products:
+            product_id = product['product_id']
+            seen.add(product_id)
+            if product_id not in self.rows or self.versions[product_id] != product_version(product):
+                changed.append(product)
+            else:
+                # Same revision: only refresh the object returned by search()
+                if product_id not in self.products:
+                    # Reopened by load(): vector already there, terms not counted yet
+                    self.count_terms(product_terms(product), 1)
+                self.products[product_id] = product
+        removed = [product_id for product_id in self.rows if product_id not in seen]
+        for product_id in removed:
+            self.remove(product_id)
+        self.add_many(changed)
+        return len(changed) + len(removed)
+    
+    def count_terms(self, terms, delta):
+        """Add or remove a product's tokens from the term counts"""
+        for token in terms:
+            count = self.term_counts.get(token, 0) + delta
+            if count > 0:
+                self.term_counts[token] = count
+            else:
+                self.term_counts.pop(token, None)
+    
+    def query_terms(self, query):
+        """Question tokens with their IDF weights over the indexed products"""
+        count = len(self)
+        terms = {}
+        for token in tokenize(query):
+            frequency = self.term_counts.get(token)
+            terms[token] = math.log(1 + count / frequency) if frequency else UNKNOWN_TERM_WEIGHT
+        return terms
+    
+    def search(self, query, limit=10, min_score=0.0):
+        """Ranked (product, score) pairs for a free-text query, by cosine similarity"""
+        import numpy as np
+        
+        count = len(self)
+        terms = self.query_terms(query)
+        if count == 0 or limit <= 0 or not terms:
+            return []
+        vector = self.embedder.embed([terms])[0]
+        if not vector.any():
+            return []
+        
+        scores = self.vectors[:count] @ vector
+        limit = min(limit, count)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.products[self.product_ids[row]], round(float(scores[row]), 4))
+                for row in top if scores[row] > min_score]
+    
+    def save(self, path):
+        """Write the index to `path`.npy (the vectors) and `path`.json (ids, versions, embedder)"""
+        import numpy as np
+        
+        np.save(f'{path}.npy', self.vectors[:len(self)])
+        with open(f'{path}.json', 'w') as f:
+            json.dump({
+                'embedder': self.embedder.name,
+                'dimensions': self.embedder.dimensions,
+                'product_ids': self.product_ids,
+                'versions': [self.versions[product_id] for product_id in self.product_ids]
+            }, f, default=str)
+    
+    @classmethod
+    def load(cls, path, embedder):
+        """
+        Reopen a saved index with its vectors memory-mapped.
+        
+        Products themselves are not saved: sync() the index with the current
+        catalog before searching it, which also embeds what changed since.
+        """
+        import numpy as np
+        
+        with open(f'{path}.json') as f:
+            saved = json.load(f)
+        if saved['embedder'] != embedder.name or saved['dimensions'] != embedder.dimensions:
+            raise ValueError(f'{path} was built with {saved["embedder"]}/{saved["dimensions"]}, '
+                             f'not {embedder.name}/{embedder.dimensions}')
+        
+        index = cls(embedder)
+        index.vectors = np.load(f'{path}.npy', mmap_mode='r')
+        index.product_ids = saved['product_ids']
+        index.rows = {product_id: row for row, product_id in enumerate(index.product_ids)}
+        index.versions = {product_id: tuple(version)
+                          for product_id, version in zip(index.product_ids, saved['versions'])}
+        return index
@@ -0,0 +1,112 @@
+import re
+
+# Rough size of one token in characters, good enough for budgeting prompts
+CHARS_PER_TOKEN = 4
+
+STOP_WORDS = {
+    'the', 'and', 'for', 'how', 'many', 'much', 'what', 'which', 'are', 'is',
+    'do', 'does', 'have', 'has', 'we', 'our', 'you', 'any', 'with', 'in',
+    'stock', 'products', 'product', 'items', 'item', 'show', 'me', 'of', 'a'
+}
+
+PROMPT_HEADER = """You are a helpful stock management assistant. Here is a summary of the current inventory:
+{summary}
+
+{products_title}
+{products}
+
+User question: {question}
+
+Please provide a helpful response about the inventory. Be concise and actionable.
+If asked about specific products, provide exact quantities and details.
+If asked about recommendations or estimations, suggest based on current stock levels."""
+
+def estimate_tokens(text):
+    """Approximate token count of a prompt fragment"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def tokenize(text):
+    """Lowercase words worth matching on, with plural 's' stripped"""
+    words = []
+    for word in re.findall(r'[a-z0-9]+', text.lower()):
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def normalize_question(text):
+    """Canonical form of a question for cache keys"""
+    return ' '.join(re.findall(r'[a-z0-9$]+', text.lower()))
+
+def summarize_inventory(stock_data):
+    """Aggregate lines describing the whole catalog"""
+    total_value = 0.0
+    low_stock_count = 0
+    categories = {}
+    for product in stock_data:
+        quantity = float(product['quantity'])
+        total_value += quantity * float(product.get('price', 0))
+        if product['quantity'] <= product['min_threshold']:
+            low_stock_count += 1
+        category = product.get('category', 'General')
+        categories[category] = categories.get(category, 0) + 1
+    
+    top_categories = sorted(categories.items(), key=lambda c: -c[1])[:10]
+    return (
+        f"Products: {len(stock_data)} | Total value: ${total_value:.2f} | Low stock: {low_stock_count}\n"
+        "Categories: " + ', '.join(f'{name} ({count})' for name, count in top_categories)
+    )
+
+def format_product(product):
+    """One compact line per product"""
+    return (
+        f"{product['product_id']} | {product['name']} | {product.get('category', 'General')} | "
+        f"qty {product['quantity']} | min {product['min_threshold']} | ${float(product.get('price', 0)):.2f}"
+    )
+
+def rank_products(question, stock_data):
+    """Products ordered by relevance: name/category matches, then low stock, then the rest"""
+    words = set(tokenize(question))
+    scored = []
+    for product in stock_data:
+        score = 0
+        if words:
+            product_words = set(tokenize(f"{product['name']} {product.get('category', '')}"))
+            score += 10 * len(words & product_words)
+        if product['quantity'] <= product['min_threshold']:
+            score += 1
+        scored.append((-score, product['quantity'], product))
+    scored.sort(key=lambda s: (s[0], s[1]))
+    return [product for _, _, product in scored]
+
+def build_chat_prompt(question, stock_data, token_budget, relevant=None):
+    """
+    Prompt with aggregates plus as many relevant products as the token budget allows.
+    
+    `relevant` products (retrieved for the question, best first) come before
+    the rest of the catalog in rank_products order.
+    """
+    summary = summarize_inventory(stock_data)
+    title = 'Products by relevance (id | name | category | quantity | min threshold | price):'
+    base = PROMPT_HEADER.format(summary=summary, products_title=title, products='', question=question)
+    remaining = token_budget - estimate_tokens(base)
+    
+    ranked = rank_products(question, stock_data)
+    if relevant:
+        relevant_ids = {product['product_id'] for product in relevant}
+        ranked = relevant + [product for product in ranked if product['product_id'] not in relevant_ids]
+    
+    lines = []
+    for product in ranked:
+        line = format_product(product)
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    if len(lines) < len(stock_data):
+        lines.append(f'({len(stock_data) - len(lines)} more products not shown)')
+    
+    return PROMPT_HEADER.format(summary=summary, products_title=title, products='\n'.join(lines), question=question)
@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+import time
+import uuid
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from serialization import dumps, from_item
+from tenancy import scoped_key
+
+# Materialized recommendations and estimations, kept in the metadata table.
+#
+# A pointer item names the current version and the blobs it is made of: the
+# restock plan, the per-shard estimations and the delta of products refreshed
+# since the last full run. Each blob is gzipped JSON split into items of at
+# most BLOB_PART_BYTES, keyed by blob name and a tag unique to the run that
+# wrote it, so a refresh that only rewrites the delta keeps pointing at the
+# other blobs, and runs that lose the race to publish never overwrite a blob.
+# Readers holding the previous pointer can still load its blobs: only blobs
+# referenced by neither the new nor the previous pointer are deleted.
+#
+# Each partition (tenant and warehouse) has its own pointer, blobs and queue.
+RESULTS_KEY = 'precomputed_results'
+
+# Products whose results are out of date, queued by the stock-stream function
+DIRTY_KEY = 'precompute_dirty'
+
+BLOB_PART_BYTES = 350 * 1024
+GZIP_LEVEL = 6
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_MAX_ATTEMPTS = 5
+
+serializer = TypeSerializer()
+
+def shard_of(product_id, shard_count):
+    """Estimation shard of a product, stable for a given shard count"""
+    digest = hashlib.md5(product_id.encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % shard_count
+
+def new_tag():
+    """Blob tag for one run: sortable by time, unique across concurrent runs"""
+    return f'{int(time.time())}-{uuid.uuid4().hex[:8]}'
+
+def pointer_key(partition):
+    return {'meta_key': {'S': scoped_key(RESULTS_KEY, partition)}}
+
+def dirty_key(partition):
+    return {'meta_key': {'S': scoped_key(DIRTY_KEY, partition)}}
+
+def part_key(partition, name, tag, part):
+    return {'meta_key': {'S': f'{scoped_key(RESULTS_KEY, partition)}:{name}:{tag}#{part}'}}
+
+def read_pointer(client, table, partition):
+    """The current pointer of a partition as plain values, or None before its first run"""
+    response = client.get_item(TableName=table, Key=pointer_key(partition), ConsistentRead=True)
+    item = response.get('Item')
+    return from_item(item) if item else None
+
+def read_blobs(client, table, partition, refs):
+    """Load and decode blobs given as {name: {'tag', 'parts'}}"""
+    keys = {}
+    for name, ref in refs.items():
+        for part in range(ref['parts']):
+            keys[part_key(partition, name, ref['tag'], part)['meta_key']['S']] = (name, part)
+    
+    chunks = {}
+    pending = [{'meta_key': {'S': key}} for key in keys]
+    for attempt in range(BATCH_MAX_ATTEMPTS * max(1, len(pending) // BATCH_GET_MAX_KEYS)):
+        if not pending:
+            break
+        request = {table: {'Keys': pending[:BATCH_GET_MAX_KEYS]}}
+        response = client.batch_get_item(RequestItems=request)
+        for item in response['Responses'].get(table, []):
+            chunks[keys[item['meta_key']['S']]] = item['data']['B']
+        unprocessed = response.get('UnprocessedKeys', {}).get(table, {}).get('Keys', [])
+        pending = unprocessed + pending[BATCH_GET_MAX_KEYS:]
+        if unprocessed:
+            time.sleep(min(1.0, 0.05 * 2 ** min(attempt, 5)))
+    if pending:
+        raise RuntimeError(f'{len(pending)} result parts still unprocessed')
+    
+    blobs = {}
+    for name, ref in refs.items():
+        parts = [chunks.get((name, part)) for part in range(ref['parts'])]
+        if any(part is None for part in parts):
+            raise LookupError(f'Result blob {name}:{ref["tag"]} is incomplete')
+        blobs[name] = json.loads(gzip.decompress(b''.join(parts)))
+    return blobs
+
+def write_items(client, table, requests):
+    """BatchWriteItem in groups of 25, retrying unprocessed items"""
+    for i in range(0, len(requests), BATCH_WRITE_MAX_ITEMS):
+        request = {table: requests[i:i + BATCH_WRITE_MAX_ITEMS]}
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            response = client.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems')
+            if not request:
+                break
+            time.sleep(min(1.0, 0.05 * 2 ** attempt))
+        else:
+            raise RuntimeError(f'{len(request[table])} result parts still unprocessed')
+
+def write_blobs(client, table, partition, tag, blobs):
+    """Store blobs under a tag; returns their refs for the pointer"""
+    refs = {}
+    requests = []
+    for name, value in blobs.items():
+        data = gzip.compress(dumps(value).encode('utf-8'), compresslevel=GZIP_LEVEL)
+        parts = [data[i:i + BLOB_PART_BYTES] for i in range(0, len(data), BLOB_PART_BYTES)]
+        for part, chunk in enumerate(parts):
+            requests.append({'PutRequest': {'Item': {**part_key(partition, name, tag, part), 'data': {'B': chunk}}}})
+        refs[name] = {'tag': tag, 'parts': len(parts)}
+    write_items(client, table, requests)
+    return refs
+
+def delete_blobs(client, table, partition, refs):
+    """Delete the parts of blobs given as {name: ref}"""
+    requests = [{'DeleteRequest': {'Key': part_key(partition, name, ref['tag'], part)}}
+                for name, ref in refs.items() for part in range(ref['parts'])]
+    write_items(client, table, requests)
+
+def unreferenced(refs, *keep):
+    """The refs not used by any of the `keep` ref maps"""
+    kept = {(name, ref['tag']) for refs_kept in keep for name, ref in refs_kept.items()}
+    return {name: ref for name, ref in refs.items() if (name, ref['tag']) not in kept}
+
+def publish(client, table, partition, current, fields, refs):
+    """
+    Point readers at a new version made of `refs`, unless `current` is no longer the latest.
+    
+    Returns the new pointer, or None if another run published first.
+    """
+    pointer = dict(fields, version=(current['version'] + 1) if current else 1, blobs=refs,
+                   previous_blobs=current['blobs'] if current else {})
+    item = dict(pointer_key(partition))
+    item.update({name: serializer.serialize(value) for name, value in pointer.items()})
+    try:
+        if current:
+            client.put_item(TableName=table, Item=item, ConditionExpression='#version = :version',
+                            ExpressionAttributeNames={'#version': 'version'},
+                            ExpressionAttributeValues={':version': {'N': str(current['version'])}})
+        else:
+            client.put_item(TableName=table, Item=item, ConditionExpression='attribute_not_exists(meta_key)')
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+    
+    if current:
+        # Blobs of the pointer before `current` are no longer read by anyone
+        delete_blobs(client, table, partition, unreferenced(current['previous_blobs'], current['blobs'], refs))
+    return pointer
+
+def read_dirty(client, table, partition):
+    """Queued product IDs and whether the queue overflowed (the next full run catches up)"""
+    response = client.get_item(TableName=table, Key=dirty_key(partition), ConsistentRead=True)
+    item = response.get('Item', {})
+    return sorted(item.get('product_ids', {}).get('SS', [])), 'overflowed_at' in item
+
+def claim_dirty(client, table, partition, product_ids=None):
+    """
+    Take products off the queue before recomputing them.
+    
+    Changes that land afterwards queue the product again, so none is lost.
+    Without product_ids the whole queue is taken, with its overflow flag;
+    returns the product IDs that were queued and whether it had overflowed.
+    """
+    key = dirty_key(partition)
+    if product_ids is None:
+        response = client.update_item(TableName=table, Key=key, UpdateExpression='REMOVE product_ids, overflowed_at',
+                                      ReturnValues='ALL_OLD')
+        attributes = response.get('Attributes', {})
+        return sorted(attributes.get('product_ids', {}).get('SS', [])), 'overflowed_at' in attributes
+    if product_ids:
+        client.update_item(TableName=table, Key=key, UpdateExpression='DELETE product_ids :ids',
+                           ExpressionAttributeValues={':ids': {'SS': list(product_ids)}})
+    return list(product_ids), False
+
+def requeue_dirty(client, table, partition, product_ids, overflowed=False):
+    """Put claimed products back on the queue after a failed or lost run"""
+    if overflowed:
+        client.update_item(TableName=table, Key=dirty_key(partition),
+                           UpdateExpression='SET overflowed_at = if_not_exists(overflowed_at, :now)',
+                           ExpressionAttributeValues={':now': {'N': str(int(time.time()))}})
+    if product_ids:
+        client.update_item(TableName=table, Key=dirty_key(partition),
+                           UpdateExpression='ADD product_ids :ids',
+                           ExpressionAttributeValues={':ids': {'SS': list(product_ids)}})
@@ -0,0 +1,97 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+from instrumentation import install as instrument_session
+
+# Tuned for Lambda: fail fast on connect, keep idle connections alive between
+# warm invocations, enough pooled connections for the thread pools, and
+# adaptive retries that back off client-side when DynamoDB throttles.
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get('AWS_CONNECT_TIMEOUT_SECONDS', '2'))
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '5'))
+
+# Read timeouts per service; Bedrock generations take much longer than DynamoDB calls
+READ_TIMEOUT_SECONDS = {
+    'dynamodb': 10,
+    'bedrock-runtime': 60
+}
+
+# Retries per service. The AI assistant retries Bedrock itself, within each
+# request's deadline and behind a circuit breaker (bedrock_resilience.py),
+# so botocore makes a single attempt there.
+RETRIES = {
+    'bedrock-runtime': {'mode': 'standard', 'max_attempts': 1}
+}
+
+_session = None
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+def client_config(service):
+    """botocore Config used for every client of a service"""
+    return Config(
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+        read_timeout=READ_TIMEOUT_SECONDS.get(service, 30),
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries=RETRIES.get(service, {'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS})
+    )
+
+def get_session():
+    # boto3's default session is not safe to create from several threads at once
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+            # Clients inherit the session's event hooks when they are created
+            instrument_session(_session)
+        return _session
+
+def get_client(service):
+    """Memoized low-level client, created on first use"""
+    if service not in _clients:
+        session = get_session()
+        with _lock:
+            if service not in _clients:
+                _clients[service] = session.client(service, config=client_config(service))
+    return _clients[service]
+
+def get_resource(service):
+    """Memoized resource, created on first use (loading its model is the slow part)"""
+    if service not in _resources:
+        session = get_session()
+        with _lock:
+            if service not in _resources:
+                _resources[service] = session.resource(service, config=client_config(service))
+    return _resources[service]
+
+class LazyClient:
+    """
+    Stand-in for a boto3 client, resource or table that builds it on first use.
+    
+    Lets handlers keep module-level names like `table` or `bedrock` while a
+    cold start only pays for the AWS objects the invoked route touches.
+    """
+    
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._target_lock = threading.Lock()
+    
+    def __getattr__(self, name):
+        if self._target is None:
+            with self._target_lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return getattr(self._target, name)
+
+def lazy_client(service):
+    return LazyClient(lambda: get_client(service))
+
+def lazy_resource(service):
+    return LazyClient(lambda: get_resource(service))
+
+def lazy_table(name):
+    return LazyClient(lambda: get_resource('dynamodb').Table(name))
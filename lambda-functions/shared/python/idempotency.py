@@ -0,0 +1,136 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+from botocore.exceptions import ClientError
+from instrumentation import log_error
+from serialization import from_item
+
+# A request carrying an Idempotency-Key header runs once per key: its
+# response is stored in the idempotency table and replayed to every retry
+# for IDEMPOTENCY_TTL_SECONDS (the table's TTL deletes it after that). While
+# the first request runs, the key is locked for IDEMPOTENCY_LOCK_SECONDS
+# (longer than the function timeout); a retry after that takes it over.
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60'))
+KEY_PATTERN = re.compile(r'^[\x21-\x7e]{1,255}$')
+
+# Stored responses are compressed. One still larger than this is replaced
+# by a short note: retries must not run the request again either way.
+MAX_STORED_RESPONSE_BYTES = 350000
+TOO_LARGE_BODY = json.dumps({'message': 'Request already processed; its response is too large to replay'})
+
+IN_PROGRESS = 'IN_PROGRESS'
+COMPLETED = 'COMPLETED'
+
+class IdempotencyConflict(Exception):
+    """The key can't serve this request: `status` is 409 (still in progress) or 422 (different request)"""
+    
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def request_hash(payload):
+    """Fingerprint of a request body, to tell a retry from another request reusing the key"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def claim(table, scope, key, payload):
+    """
+    Lock an idempotency key for a request about to run.
+    
+    Returns the key's record for complete() or release(). Its `response`
+    ({'statusCode', 'body'}) is set when an identical request already
+    completed: replay it instead of running the request. `started_ms` is the
+    time of the first attempt, the same for every retry. Raises ValueError
+    for a malformed key and IdempotencyConflict when it can't be used now.
+    """
+    if not isinstance(key, str) or not KEY_PATTERN.match(key):
+        raise ValueError(f'{IDEMPOTENCY_HEADER} must be 1-255 printable ASCII characters')
+    now = time.time()
+    record = {
+        'idempotency_key': f'{scope}#{key}',
+        'status': IN_PROGRESS,
+        'request_hash': request_hash(payload),
+        'started_ms': int(now * 1000),
+        'locked_until': int(now) + IDEMPOTENCY_LOCK_SECONDS,
+        'expires_at': int(now) + IDEMPOTENCY_TTL_SECONDS
+    }
+    try:
+        # New key, expired record (TTL deletion lags) or abandoned lock
+        response = table.put_item(
+            Item=record,
+            ConditionExpression=('attribute_not_exists(idempotency_key) OR expires_at < :now '
+                                 'OR (#status = :in_progress AND locked_until < :now)'),
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':now': int(now), ':in_progress': IN_PROGRESS},
+            ReturnValues='ALL_OLD',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        current = from_item(e.response.get('Item') or {})
+        if current.get('request_hash') != record['request_hash']:
+            raise IdempotencyConflict(422, f'{IDEMPOTENCY_HEADER} was already used for a different request')
+        if current.get('status') != COMPLETED:
+            raise IdempotencyConflict(409, f'A request with this {IDEMPOTENCY_HEADER} is still in progress')
+        record['response'] = {
+            'statusCode': int(current['status_code']),
+            'body': zlib.decompress(base64.b64decode(current['body'])).decode('utf-8')
+        }
+        return record
+    
+    previous = response.get('Attributes')
+    if previous and previous.get('status') == IN_PROGRESS and previous.get('request_hash') == record['request_hash']:
+        # Taking over an abandoned attempt of the same request: keep its start
+        # time, so the IDs it may already have written are generated again
+        record['started_ms'] = int(previous['started_ms'])
+        table.update_item(
+            Key={'idempotency_key': record['idempotency_key']},
+            UpdateExpression='SET started_ms = :started_ms',
+            ExpressionAttributeValues={':started_ms': record['started_ms']}
+        )
+    return record
+
+def complete(table, record, status_code, body):
+    """Store a claimed request's response for its retries"""
+    compressed = zlib.compress(body.encode('utf-8'))
+    if len(compressed) > MAX_STORED_RESPONSE_BYTES:
+        log_error("Idempotent response too large to store", size=len(compressed))
+        compressed = zlib.compress(TOO_LARGE_BODY.encode('utf-8'))
+    try:
+        table.update_item(
+            Key={'idempotency_key': record['idempotency_key']},
+            UpdateExpression='SET #status = :completed, status_code = :status_code, body = :body REMOVE locked_until',
+            # Unless another attempt took the key over in the meantime
+            ConditionExpression='locked_until = :locked_until',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':completed': COMPLETED, ':status_code': status_code, ':body': compressed,
+                                       ':locked_until': record['locked_until']}
+        )
+    except ClientError as e:
+        # Retries will run the request again; its conditional writes keep that safe
+        log_error("Error storing idempotent response", e)
+
+def release(table, record):
+    """
+    Unlock a claimed key after a failure, so a retry can run right away.
+    
+    The record is kept, expired lock included: the retry takes it over with
+    the same start time, so it regenerates the IDs of anything written
+    before the failure.
+    """
+    try:
+        table.update_item(
+            Key={'idempotency_key': record['idempotency_key']},
+            UpdateExpression='SET locked_until = :unlocked',
+            ConditionExpression='locked_until = :locked_until',
+            ExpressionAttributeValues={':unlocked': 0, ':locked_until': record['locked_until']}
+        )
+    except ClientError as e:
+        # The lock expires on its own
+        log_error("Error releasing idempotency key", e)
@@ -0,0 +1,64 @@
+import hashlib
+import secrets
+import time
+from datetime import timezone
+
+# Product IDs are ULIDs: a 48-bit millisecond timestamp followed by 80 random
+# bits, as 26 Crockford base32 characters. The random part makes a collision
+# practically impossible even for IDs created in the same millisecond, and
+# IDs sort by creation time, so products created in a time range are a range
+# of the products table's sort key. (IDs created before, 8 hex characters,
+# fall outside such ranges.)
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ID_LENGTH = 26
+RANDOM_BYTES = 10
+
+def encode(value):
+    """128-bit integer as 26 base32 characters"""
+    characters = []
+    for _ in range(ID_LENGTH):
+        value, digit = divmod(value, 32)
+        characters.append(ALPHABET[digit])
+    return ''.join(reversed(characters))
+
+def time_ordered_id(timestamp_ms=None, entropy=None):
+    """New ID for the given time (default now); `entropy` (10 bytes) replaces the random part"""
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    if entropy is None:
+        entropy = secrets.token_bytes(RANDOM_BYTES)
+    return encode((timestamp_ms << 8 * RANDOM_BYTES) | int.from_bytes(entropy[:RANDOM_BYTES], 'big'))
+
+class IdGenerator:
+    """
+    New IDs for the items of one request, by position in the request.
+    
+    Unseeded, every call returns a fresh random ID. Seeded with the request's
+    idempotency key and the time of its first attempt, a retry gets the same
+    IDs again (`deterministic`), so its conditional puts find the products
+    already written instead of creating them twice.
+    """
+    
+    def __init__(self, seed=None, timestamp_ms=None):
+        self.seed = seed
+        self.timestamp_ms = timestamp_ms
+        self.deterministic = seed is not None
+    
+    def __call__(self, position):
+        if not self.deterministic:
+            return time_ordered_id()
+        entropy = hashlib.sha256(f'{self.seed}#{position}'.encode('utf-8')).digest()
+        return time_ordered_id(self.timestamp_ms, entropy)
+
+def epoch_ms(moment):
+    """Milliseconds since the epoch of a datetime (naive ones are UTC)"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+def id_range(start=None, end=None):
+    """(lowest, highest) ID of items created between two datetimes, either end open if None"""
+    random_bits = 8 * RANDOM_BYTES
+    lowest = 0 if start is None else epoch_ms(start) << random_bits
+    highest = 2 ** 128 - 1 if end is None else (epoch_ms(end) << random_bits) | (2 ** random_bits - 1)
+    return encode(lowest), encode(highest)
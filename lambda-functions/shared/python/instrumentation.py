@@ -0,0 +1,297 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# One CloudWatch Embedded Metric Format line per invocation, keyed by route
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'StockManager')
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+# Ask DynamoDB to return ConsumedCapacity on every call that supports it
+TRACE_CONSUMED_CAPACITY = os.environ.get('TRACE_CONSUMED_CAPACITY', 'true').lower() == 'true'
+# Add a Server-Timing header (shown in browser dev tools) to API responses
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+
+CAPACITY_OPERATIONS = ('GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan', 'BatchGetItem',
+                       'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems')
+WRITE_OPERATIONS = ('PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems')
+THROTTLING_CODES = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+
+_invocations = {'count': 0}
+_invocations_lock = threading.Lock()
+
+# Metrics of the invocation in progress. Lambda runs one invocation at a time
+# per container, so worker threads of that invocation share it.
+_current = {'request': None}
+
+class RequestMetrics:
+    """Counters for one invocation, updated by the AWS call hooks"""
+    
+    def __init__(self, service, route, cold_start):
+        self.service = service
+        self.route = route
+        self.cold_start = cold_start
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.dynamodb = {'calls': 0, 'ms': 0.0, 'rcu': 0.0, 'wcu': 0.0, 'items': 0, 'scanned': 0, 'pages': 0,
+                         'retries': 0, 'throttles': 0, 'errors': 0}
+        self.operations = {}  # "Operation table" -> {'calls', 'ms', 'capacity'}
+        self.bedrock = {'calls': 0, 'ms': 0.0, 'input_tokens': 0, 'output_tokens': 0, 'errors': 0,
+                        'retries': 0, 'timeouts': 0, 'rejected': 0, 'fallbacks': 0}
+        self.cache = {'local_hits': 0, 'remote_hits': 0, 'misses': 0}  # product cache lookups
+        self.spans = {}        # name -> ms, from span()
+        self.counters = {}     # name -> count, from record_count()
+        self.annotations = {}  # name -> value, from annotate()
+        self.logged_errors = 0
+
+def install(session):
+    """Trace DynamoDB and Bedrock calls of every client later created from a boto3 session"""
+    events = session.events
+    # Timing starts before parameter validation, which every call goes through
+    events.register('before-parameter-build.dynamodb', prepare_dynamodb_call, unique_id='instrumentation-prepare')
+    events.register('after-call.dynamodb', record_dynamodb_call, unique_id='instrumentation-dynamodb')
+    events.register('before-parameter-build.bedrock-runtime', start_call, unique_id='instrumentation-start')
+    events.register('after-call.bedrock-runtime', record_bedrock_call, unique_id='instrumentation-bedrock')
+
+def prepare_dynamodb_call(params, model, context, **kwargs):
+    context['instrumentation_started'] = time.perf_counter()
+    context['instrumentation_table'] = params.get('TableName') or ','.join(params.get('RequestItems', {}))
+    if TRACE_CONSUMED_CAPACITY and model.name in CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+def start_call(context, **kwargs):
+    context['instrumentation_started'] = time.perf_counter()
+
+def consumed_units(consumed):
+    """Total CapacityUnits from a ConsumedCapacity entry or list of entries"""
+    if not consumed:
+        return 0.0
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(float(entry.get('CapacityUnits', 0)) for entry in consumed)
+
+def returned_items(parsed):
+    if 'Items' in parsed:
+        return len(parsed['Items'])
+    if 'Responses' in parsed:
+        return sum(len(items) for items in parsed['Responses'].values())
+    return 1 if parsed.get('Item') else 0
+
+def record_dynamodb_call(parsed, model, context, **kwargs):
+    metrics = _current['request']
+    if metrics is None:
+        return
+    elapsed_ms = (time.perf_counter() - context.get('instrumentation_started', metrics.started)) * 1000
+    operation = model.name
+    units = consumed_units(parsed.get('ConsumedCapacity'))
+    error = parsed.get('Error', {}).get('Code')
+    key = f"{operation} {context.get('instrumentation_table') or '-'}"
+    
+    with metrics.lock:
+        totals = metrics.dynamodb
+        totals['calls'] += 1
+        totals['ms'] += elapsed_ms
+        totals['wcu' if operation in WRITE_OPERATIONS else 'rcu'] += units
+        totals['items'] += returned_items(parsed)
+        totals['retries'] += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if operation in ('Scan', 'Query'):
+            totals['pages'] += 1
+            totals['scanned'] += parsed.get('ScannedCount', 0)
+        if error:
+            totals['errors'] += 1
+            if error in THROTTLING_CODES:
+                totals['throttles'] += 1
+        
+        entry = metrics.operations.setdefault(key, {'calls': 0, 'ms': 0.0, 'capacity': 0.0})
+        entry['calls'] += 1
+        entry['ms'] += elapsed_ms
+        entry['capacity'] += units
+
+def record_bedrock_call(http_response, parsed, context, **kwargs):
+    metrics = _current['request']
+    if metrics is None:
+        return
+    elapsed_ms = (time.perf_counter() - context.get('instrumentation_started', metrics.started)) * 1000
+    headers = getattr(http_response, 'headers', None) or {}
+    with metrics.lock:
+        metrics.bedrock['calls'] += 1
+        metrics.bedrock['ms'] += elapsed_ms
+        metrics.bedrock['input_tokens'] += int(headers.get('x-amzn-bedrock-input-token-count', 0))
+        metrics.bedrock['output_tokens'] += int(headers.get('x-amzn-bedrock-output-token-count', 0))
+        if 'Error' in parsed:
+            metrics.bedrock['errors'] += 1
+
+def record_bedrock_event(name):
+    """Count a resilience event: 'retries', 'timeouts', 'rejected' (circuit open) or 'fallbacks'"""
+    metrics = _current['request']
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.bedrock[name] += 1
+
+def record_cache_result(result):
+    """Count a product cache lookup: 'local_hits', 'remote_hits' or 'misses'"""
+    metrics = _current['request']
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.cache[result] += 1
+
+def record_count(name, amount=1):
+    """Add to a named counter, reported as a Count metric of the route"""
+    metrics = _current['request']
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.counters[name] = metrics.counters.get(name, 0) + amount
+
+def annotate(**fields):
+    """Attach values such as sizes and versions to the invocation's log line (not metrics)"""
+    metrics = _current['request']
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.annotations.update(fields)
+
+@contextmanager
+def span(name):
+    """Time a block of handler code; reported in the log line and Server-Timing"""
+    metrics = _current['request']
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with metrics.lock:
+                metrics.spans[name] = metrics.spans.get(name, 0.0) + elapsed_ms
+
+def log_error(message, error=None, **fields):
+    """Structured error log line, tagged with the current route"""
+    metrics = _current['request']
+    line = {'level': 'error', 'message': message}
+    if error is not None:
+        line['error'] = str(error)
+        line['error_type'] = type(error).__name__
+    if metrics is not None:
+        line['service'] = metrics.service
+        line['route'] = metrics.route
+        with metrics.lock:
+            metrics.logged_errors += 1
+    line.update(fields)
+    print(json.dumps(line, default=str))
+
+def route_of(event):
+    """Low-cardinality route name: API Gateway's resource template, not the raw path"""
+    if 'httpMethod' in event:
+        return f"{event['httpMethod']} {event.get('resource') or event.get('path', '/')}"
+    if 'Records' in event:
+        return 'stream'
+    return event.get('source', 'invoke')
+
+def server_timing(metrics, duration_ms):
+    parts = [f'total;dur={duration_ms:.1f}']
+    if metrics.dynamodb['calls']:
+        parts.append(f'dynamodb;dur={metrics.dynamodb["ms"]:.1f};'
+                     f'desc="{metrics.dynamodb["calls"]} calls, {metrics.dynamodb["rcu"]:g} RCU"')
+    if metrics.bedrock['calls']:
+        parts.append(f'bedrock;dur={metrics.bedrock["ms"]:.1f}')
+    parts.extend(f'{name};dur={ms:.1f}' for name, ms in metrics.spans.items())
+    return ', '.join(parts)
+
+def metrics_line(metrics, duration_ms, status, request_id):
+    """Structured log line that is also an EMF document"""
+    dynamodb, bedrock, cache = metrics.dynamodb, metrics.bedrock, metrics.cache
+    values = {
+        'Duration': (duration_ms, 'Milliseconds'),
+        'ColdStart': (int(metrics.cold_start), 'Count'),
+        'Errors': (int(status is None or status >= 500), 'Count'),
+        'DynamoDBCalls': (dynamodb['calls'], 'Count'),
+        'DynamoDBTime': (dynamodb['ms'], 'Milliseconds'),
+        'ConsumedReadCapacity': (dynamodb['rcu'], 'Count'),
+        'ConsumedWriteCapacity': (dynamodb['wcu'], 'Count'),
+        'ScanPages': (dynamodb['pages'], 'Count'),
+        'ItemsScanned': (dynamodb['scanned'], 'Count'),
+        'ItemsReturned': (dynamodb['items'], 'Count'),
+        'DynamoDBThrottles': (dynamodb['throttles'], 'Count'),
+        'BedrockCalls': (bedrock['calls'], 'Count'),
+        'BedrockTime': (bedrock['ms'], 'Milliseconds'),
+        'BedrockInputTokens': (bedrock['input_tokens'], 'Count'),
+        'BedrockOutputTokens': (bedrock['output_tokens'], 'Count'),
+        'BedrockRetries': (bedrock['retries'], 'Count'),
+        'BedrockFallbacks': (bedrock['fallbacks'], 'Count'),
+        'ProductCacheHits': (cache['local_hits'] + cache['remote_hits'], 'Count'),
+        'ProductCacheMisses': (cache['misses'], 'Count')
+    }
+    values.update({name: (amount, 'Count') for name, amount in metrics.counters.items()})
+    line = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Service', 'Route']],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in values.items()]
+            }]
+        },
+        'metric': 'request',
+        'Service': metrics.service,
+        'Route': metrics.route,
+        'status': status,
+        'cold_start': metrics.cold_start,
+        'request_id': request_id,
+        'dynamodb_retries': dynamodb['retries'],
+        'dynamodb_errors': dynamodb['errors'],
+        'bedrock_errors': bedrock['errors'],
+        'bedrock_timeouts': bedrock['timeouts'],
+        'bedrock_rejected': bedrock['rejected'],
+        'logged_errors': metrics.logged_errors,
+        'product_cache': dict(cache),
+        'operations': {key: {'calls': entry['calls'], 'ms': round(entry['ms'], 2),
+                             'capacity': round(entry['capacity'], 2)}
+                       for key, entry in metrics.operations.items()},
+        'spans': {name: round(ms, 2) for name, ms in metrics.spans.items()},
+        'annotations': dict(metrics.annotations)
+    }
+    line.update({name: round(value, 2) for name, (value, _) in values.items()})
+    return line
+
+def instrumented(service):
+    """
+    Decorate a Lambda handler to trace its AWS calls per invocation.
+    
+    Prints one JSON line per invocation that CloudWatch reads as Embedded
+    Metric Format (metrics per Service/Route) and that Logs Insights can
+    query as a structured log. Adds a Server-Timing header to API responses
+    when SERVER_TIMING is enabled.
+    """
+    def decorate(handler):
+        if not INSTRUMENTATION_ENABLED:
+            return handler
+        
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            with _invocations_lock:
+                _invocations['count'] += 1
+                cold_start = _invocations['count'] == 1
+            metrics = RequestMetrics(service, route_of(event), cold_start)
+            _current['request'] = metrics
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _current['request'] = None
+                duration_ms = (time.perf_counter() - metrics.started) * 1000
+                status = response.get('statusCode') if isinstance(response, dict) else None
+                if status is None and response is not None:
+                    status = 200
+                if SERVER_TIMING and isinstance(response, dict) and 'statusCode' in response:
+                    headers = response.setdefault('headers', {})
+                    headers['Server-Timing'] = server_timing(metrics, duration_ms)
+                    headers['Timing-Allow-Origin'] = '*'
+                request_id = getattr(context, 'aws_request_id', None)
+                print(json.dumps(metrics_line(metrics, duration_ms, status, request_id)))
+        
+        return wrapper
+    return decorate
@@ -0,0 +1,35 @@
+import os
+from tenancy import scoped_key
+
+# Each partition has an inventory version counter in the metadata table,
+# bumped by stock-stream after every batch of product changes and by the
+# stock API's own writes. Caches of partition-wide data (list ETags, stock
+# snapshots, chat answers) are keyed by it. Before a partition's first change
+# there is no counter and the version is None: a None version must not be
+# cached under, since the first change does not move it to a new value
+# anyone has seen.
+INVENTORY_VERSION_KEY = 'inventory_version'
+
+# stock-stream records the products each of its bumps covers in a changes
+# item ("inventory_changes:<version>", scoped by partition), written in the
+# same transaction as the new version, so warm containers can catch up on the
+# products changed since the version they last saw instead of re-reading the
+# partition. The stock API's own bumps have no changes item: the stream
+# records their products under a later version. Changes items expire (TTL on
+# expire_at) after INVENTORY_CHANGES_RETENTION_SECONDS.
+INVENTORY_CHANGES_KEY = 'inventory_changes'
+INVENTORY_CHANGES_RETENTION_SECONDS = int(os.environ.get('INVENTORY_CHANGES_RETENTION_SECONDS', '86400'))
+
+def inventory_version_key(partition):
+    """Metadata key of a partition's inventory version counter"""
+    return scoped_key(INVENTORY_VERSION_KEY, partition)
+
+def read_inventory_version(table, partition, consistent_read=False):
+    """Current inventory version counter of a partition (metadata Table resource), or None before its first change"""
+    response = table.get_item(Key={'meta_key': inventory_version_key(partition)}, ConsistentRead=consistent_read)
+    item = response.get('Item')
+    return int(item['version']) if item and 'version' in item else None
+
+def inventory_changes_key(partition, version):
+    """Metadata key of the products stock-stream changed in one inventory version of a partition"""
+    return scoped_key(f'{INVENTORY_CHANGES_KEY}:{version}', partition)
@@ -0,0 +1,238 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from instrumentation import log_error, record_cache_result
+from serialization import dumps, from_item
+from tenancy import client_product_key
+
+# Read-through cache of single products (GET /products/{id}, one-product
+# estimations), in tiers: an LRU in each warm container, then an optional
+# shared backend (PRODUCT_CACHE_URL, a Redis-compatible endpoint such as
+# ElastiCache), then DynamoDB. Missing products are cached too, for
+# PRODUCT_CACHE_NEGATIVE_TTL_SECONDS. The stock API drops a product from
+# both tiers when it writes it; other containers' LRUs catch up within
+# PRODUCT_CACHE_TTL_SECONDS. (A read racing a write in another container can
+# put the old version back in the shared tier, for at most
+# PRODUCT_CACHE_REMOTE_TTL_SECONDS.)
+PRODUCT_CACHE_ENABLED = os.environ.get('PRODUCT_CACHE_ENABLED', 'true').lower() == 'true'
+PRODUCT_CACHE_TTL_SECONDS = float(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', '5'))
+PRODUCT_CACHE_NEGATIVE_TTL_SECONDS = float(os.environ.get('PRODUCT_CACHE_NEGATIVE_TTL_SECONDS', '5'))
+PRODUCT_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', '10000'))
+PRODUCT_CACHE_URL = os.environ.get('PRODUCT_CACHE_URL', '')
+PRODUCT_CACHE_REMOTE_TTL_SECONDS = int(os.environ.get('PRODUCT_CACHE_REMOTE_TTL_SECONDS', '30'))
+# A slow or unreachable backend must cost less than the DynamoDB read it
+# saves: calls time out quickly, and after a failure the backend is skipped
+# for REMOTE_RETRY_SECONDS. Connecting (once per container, TLS included)
+# may take up to REMOTE_CONNECT_TIMEOUT_SECONDS.
+PRODUCT_CACHE_REMOTE_TIMEOUT_SECONDS = float(os.environ.get('PRODUCT_CACHE_REMOTE_TIMEOUT_SECONDS', '0.05'))
+REMOTE_CONNECT_TIMEOUT_SECONDS = 1.0
+REMOTE_RETRY_SECONDS = 30
+
+# Stored for a product known not to exist
+MISSING = b'null'
+
+class LocalBackend:
+    """
+    In-memory stand-in for a shared backend, with the same get/set/delete calls.
+    
+    A shared backend is any object with get(key) -> bytes or None,
+    set(key, value, ttl_seconds) and delete(keys); one LocalBackend passed to
+    several ProductCaches behaves like a cache shared by several containers.
+    """
+    
+    def __init__(self):
+        self.entries = {}  # key -> (value, expires_at)
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            return entry[0]
+    
+    def set(self, key, value, ttl_seconds):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl_seconds)
+    
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+class RedisBackend:
+    """
+    Shared backend on a Redis-compatible endpoint (redis:// or rediss:// URL), through redis-py.
+    
+    redis-py is only imported here, so functions without a PRODUCT_CACHE_URL
+    don't pay for it on cold start. Its connection pool is thread-safe and
+    reconnects once when a warm container's idle connection was dropped.
+    """
+    
+    def __init__(self, url, timeout=PRODUCT_CACHE_REMOTE_TIMEOUT_SECONDS):
+        import redis
+        from redis.backoff import NoBackoff
+        from redis.retry import Retry
+        
+        scheme = urlparse(url).scheme
+        if scheme not in ('redis', 'rediss'):
+            raise ValueError(f'Unsupported cache URL scheme {scheme!r}; expected redis or rediss')
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=timeout,
+            socket_connect_timeout=REMOTE_CONNECT_TIMEOUT_SECONDS,
+            retry=Retry(NoBackoff(), 1),
+            retry_on_error=[redis.exceptions.ConnectionError]
+        )
+    
+    def get(self, key):
+        return self.client.get(key)
+    
+    def set(self, key, value, ttl_seconds):
+        self.client.set(key, value, ex=max(1, int(ttl_seconds)))
+    
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*keys)
+
+def make_backend(url):
+    """Shared backend for a PRODUCT_CACHE_URL ('local' for an in-memory LocalBackend), None if empty"""
+    if not url:
+        return None
+    if url == 'local':
+        return LocalBackend()
+    return RedisBackend(url)
+
+def table_loader(client, table_name):
+    """ProductCache loader reading products with a low-level client"""
+    def load(partition, product_id):
+        item = client.get_item(TableName=table_name, Key=client_product_key(partition, product_id)).get('Item')
+        return from_item(item) if item else None
+    return load
+
+class ProductCache:
+    """
+    Read-through product cache: LRU with TTL, then the shared backend, then `loader`.
+    
+    loader(partition, product_id) reads a product from DynamoDB (None if it
+    does not exist). Products are served as JSON-native dicts shared by every
+    caller: treat them as read-only. stats() returns the container's hit
+    counters; each lookup is also counted in the request's metrics line.
+    """
+    
+    def __init__(self, loader, backend=None, max_entries=PRODUCT_CACHE_MAX_ENTRIES,
+                 ttl_seconds=PRODUCT_CACHE_TTL_SECONDS, negative_ttl_seconds=PRODUCT_CACHE_NEGATIVE_TTL_SECONDS,
+                 remote_ttl_seconds=PRODUCT_CACHE_REMOTE_TTL_SECONDS, enabled=PRODUCT_CACHE_ENABLED):
+        self.loader = loader
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.remote_ttl_seconds = remote_ttl_seconds
+        self.enabled = enabled
+        self.entries = OrderedDict()  # key -> (product or None, expires_at)
+        self.lock = threading.Lock()
+        self.remote_down_until = 0.0
+        self.counters = {'local_hits': 0, 'remote_hits': 0, 'misses': 0, 'negative_hits': 0,
+                         'evictions': 0, 'remote_errors': 0}
+    
+    @staticmethod
+    def key(partition, product_id):
+        return f'product#{partition}#{product_id}'
+    
+    def get(self, partition, product_id):
+        """A product, or None if it does not exist"""
+        if not self.enabled:
+            return self.loader(partition, product_id)
+        key = self.key(partition, product_id)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            hit = entry is not None and entry[1] > now
+            if hit:
+                self.entries.move_to_end(key)
+        if hit:
+            self.count('local_hits', entry[0] is None)
+            return entry[0]
+        
+        value = self.remote_get(key)
+        if value is not None:
+            product = json.loads(value)
+            self.count('remote_hits', product is None)
+        else:
+            product = self.loader(partition, product_id)
+            self.count('misses', False)
+            self.remote_set(key, MISSING if product is None else dumps(product).encode('utf-8'), product is None)
+        self.local_set(key, product, now)
+        return product
+    
+    def invalidate(self, partition, product_ids):
+        """Forget products just written (or created, for cached misses) in every tier"""
+        if not self.enabled:
+            return
+        keys = [self.key(partition, product_id) for product_id in product_ids]
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if self.backend is not None and keys:
+            # Unlike reads, deletes are not skipped while the backend looks down:
+            # a missed one would leave other containers a stale product
+            try:
+                self.backend.delete(keys)
+            except Exception as e:
+                self.remote_failed('Error invalidating product cache', e)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self):
+        """Container counters, entry count and hit ratio since the cold start"""
+        with self.lock:
+            counters = dict(self.counters, entries=len(self.entries))
+        lookups = counters['local_hits'] + counters['remote_hits'] + counters['misses']
+        counters['hit_ratio'] = round((lookups - counters['misses']) / lookups, 4) if lookups else None
+        return counters
+    
+    def count(self, result, negative):
+        with self.lock:
+            self.counters[result] += 1
+            if negative:
+                self.counters['negative_hits'] += 1
+        record_cache_result(result)
+    
+    def local_set(self, key, product, now):
+        ttl = self.negative_ttl_seconds if product is None else self.ttl_seconds
+        with self.lock:
+            self.entries[key] = (product, now + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+    
+    def remote_get(self, key):
+        if self.backend is None or time.monotonic() < self.remote_down_until:
+            return None
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            self.remote_failed('Error reading product cache', e)
+            return None
+    
+    def remote_set(self, key, value, negative):
+        if self.backend is None or time.monotonic() < self.remote_down_until:
+            return
+        ttl = self.negative_ttl_seconds if negative else self.remote_ttl_seconds
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            self.remote_failed('Error writing product cache', e)
+    
+    def remote_failed(self, message, error):
+        with self.lock:
+            self.counters['remote_errors'] += 1
+        self.remote_down_until = time.monotonic() + REMOTE_RETRY_SECONDS
+        log_error(message, error)
@@ -0,0 +1,212 @@
+import heapq
+import math
+import re
+from bisect import bisect_left
+
+# Field weights: a hit in the name counts more than one in the description
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+
+# How much a non-exact term match is worth compared to an exact one
+PREFIX_MATCH_FACTOR = 0.7
+FUZZY_MATCH_FACTOR = 0.5
+
+MIN_PREFIX_LENGTH = 2
+MIN_FUZZY_LENGTH = 4
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens with a plural 's' stripped"""
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', str(text or '').lower()):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def deletes(token):
+    """All variants of a token with one character removed"""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+def within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitution or adjacent swap"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) == 2 and diffs[1] == diffs[0] + 1:
+            return a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+    if len(a) > len(b):
+        a, b = b, a
+    i = j = edits = 0
+    while i < len(a) and j < len(b):
+        if a[i] != b[j]:
+            edits += 1
+            if edits > 1:
+                return False
+            if len(a) == len(b):
+                i += 1
+            j += 1
+        else:
+            i += 1
+            j += 1
+    return edits + (len(b) - j) <= 1
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index over product name, category and description.
+    
+    Supports exact, prefix and one-edit fuzzy term matching with TF-IDF style
+    ranking, and incremental add/remove so a warm container keeps one index
+    up to date instead of rebuilding it per request.
+    """
+    
+    def __init__(self):
+        self.postings = {}      # token -> {product_id: weight}
+        self.documents = {}     # product_id -> {token: weight}
+        self.products = {}      # product_id -> product
+        self.versions = {}      # product_id -> updated_at/version seen when indexed
+        self.vocabulary = []    # sorted tokens, for prefix lookups (rebuilt lazily)
+        self.vocabulary_dirty = False
+        self.delete_index = {}  # one-deletion variant -> tokens, for fuzzy lookups
+    
+    def __len__(self):
+        return len(self.documents)
+    
+    def add(self, product):
+        """Index a product, replacing any previous version"""
+        product_id = product['product_id']
+        if product_id in self.documents:
+            self.remove(product_id)
+        
+        weights = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for token in tokenize(product.get(field)):
+                weights[token] = weights.get(token, 0.0) + field_weight
+        
+        for token, weight in weights.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                self.vocabulary_dirty = True
+                if len(token) >= MIN_FUZZY_LENGTH:
+                    for variant in deletes(token) | {token}:
+                        self.delete_index.setdefault(variant, set()).add(token)
+            self.postings[token][product_id] = weight
+        
+        self.documents[product_id] = weights
+        self.products[product_id] = product
+        self.versions[product_id] = product_version(product)
+    
+    def remove(self, product_id):
+        """Drop a product from the index"""
+        weights = self.documents.pop(product_id, None)
+        self.products.pop(product_id, None)
+        self.versions.pop(product_id, None)
+        if not weights:
+            return
+        for token in weights:
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(product_id, None)
+            if not posting:
+                # Last product using this token: forget the token entirely
+                del self.postings[token]
+                self.vocabulary_dirty = True
+                for variant in deletes(token) | {token}:
+                    tokens = self.delete_index.get(variant)
+                    if tokens:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self.delete_index[variant]
+    
+    def sync(self, products):
+        """Bring the index in line with a full product list, re-indexing only what changed"""
+        seen = set()
+        changed = 0
+        for product in products:
+            product_id = product['product_id']
+            seen.add(product_id)
+            if product_id not in self.versions or self.versions[product_id] != product_version(product):
+                self.add(product)
+                changed += 1
+        for product_id in [p for p in self.documents if p not in seen]:
+            self.remove(product_id)
+            changed += 1
+        return changed
+    
+    def expand(self, term, allow_prefix):
+        """Index tokens matching a query term, with their match factor"""
+        matches = {}
+        if term in self.postings:
+            matches[term] = 1.0
+        
+        if allow_prefix and len(term) >= MIN_PREFIX_LENGTH:
+            if self.vocabulary_dirty:
+                self.vocabulary = sorted(self.postings)
+                self.vocabulary_dirty = False
+            start = bisect_left(self.vocabulary, term)
+            for token in self.vocabulary[start:]:
+                if not token.startswith(term):
+                    break
+                matches.setdefault(token, PREFIX_MATCH_FACTOR)
+        
+        if not matches and len(term) >= MIN_FUZZY_LENGTH:
+            candidates = set()
+            for variant in deletes(term) | {term}:
+                candidates |= self.delete_index.get(variant, set())
+            for token in candidates:
+                if within_one_edit(term, token):
+                    matches.setdefault(token, FUZZY_MATCH_FACTOR)
+        
+        return matches
+    
+    def search(self, query, limit=10):
+        """
+        Ranked (product, score) pairs for a free-text query.
+        
+        Products matching every term are ranked first; only when no product
+        matches them all are products matching any term considered.
+        """
+        terms = tokenize(query)
+        if not terms or not self.documents:
+            return []
+        
+        # Only the last term can be an unfinished word (search-as-you-type)
+        expanded = [self.expand(term, position == len(terms) - 1) for position, term in enumerate(terms)]
+        matched = []
+        for matches in expanded:
+            product_ids = set()
+            for token in matches:
+                product_ids.update(self.postings[token])
+            matched.append(product_ids)
+        
+        # Intersect smallest first, so common terms only cost a set lookup
+        candidates = None
+        for product_ids in sorted((ids for ids in matched if ids), key=len):
+            candidates = product_ids if candidates is None else candidates & product_ids
+        if not candidates or len([ids for ids in matched if ids]) < len(terms):
+            candidates = set().union(*matched)
+        if not candidates:
+            return []
+        
+        total = len(self.documents)
+        scores = dict.fromkeys(candidates, 0.0)
+        for matches in expanded:
+            for token, factor in matches.items():
+                posting = self.postings[token]
+                idf = math.log(1 + total / len(posting))
+                if len(posting) <= len(scores):
+                    for product_id, weight in posting.items():
+                        if product_id in scores:
+                            scores[product_id] += idf * weight * factor
+                else:
+                    for product_id in scores:
+                        weight = posting.get(product_id)
+                        if weight:
+                            scores[product_id] += idf * weight * factor
+        
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda s: (s[1], s[0]))
+        return [(self.products[product_id], round(score, 4)) for product_id, score in ranked]
+
+def product_version(product):
+    """What identifies a product revision for incremental sync"""
+    return (product.get('version'), product.get('updated_at'))
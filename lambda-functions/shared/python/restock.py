@@ -0,0 +1,29 @@
+# Restocking rules shared by the ai-assistant recommendations and the
+# stock-alerts stream processor
+URGENCY_ORDER = {'Critical': 0, 'High': 1, 'Medium': 2, 'Low': 3}
+
+def is_low_stock(quantity, min_threshold):
+    """A product needs restocking once its quantity is at or below its threshold"""
+    return quantity <= min_threshold
+
+def build_recommendation(product):
+    """Restocking recommendation for one low-stock product"""
+    # Calculate recommended order quantity
+    current_qty = int(product['quantity'])
+    min_threshold = int(product['min_threshold'])
+    
+    # Simple algorithm: order 3x threshold or current stock, whichever is higher
+    recommended_qty = max(min_threshold * 3, current_qty * 2)
+    
+    urgency = 'Critical' if current_qty == 0 else 'High' if current_qty <= min_threshold // 2 else 'Medium'
+    
+    price = float(product.get('price', 0))
+    return {
+        'product_id': product['product_id'],
+        'product_name': product['name'],
+        'current_quantity': current_qty,
+        'recommended_order': recommended_qty,
+        'urgency': urgency,
+        'estimated_cost': recommended_qty * price,
+        'reason': f'Stock below threshold ({min_threshold})'
+    }
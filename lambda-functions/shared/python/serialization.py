@@ -0,0 +1,173 @@
+import base64
+import gzip
+import json
+from decimal import Decimal
+
+# Optional faster encoders/compressors; the stdlib is used when they are missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are not worth the CPU to compress
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv')
+CONTENT_CODINGS = ('br', 'gzip')
+
+def number(text):
+    """DynamoDB number string to int or float"""
+    if '.' in text or 'e' in text or 'E' in text:
+        return float(text)
+    return int(text)
+
+def from_attribute_value(value):
+    """One low-level AttributeValue ({'S': ...}, {'N': ...}, ...) to a JSON-native value"""
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        return number(value['N'])
+    if 'BOOL' in value:
+        return value['BOOL']
+    if 'NULL' in value:
+        return None
+    if 'M' in value:
+        return from_item(value['M'])
+    if 'L' in value:
+        return [from_attribute_value(v) for v in value['L']]
+    if 'SS' in value:
+        return list(value['SS'])
+    if 'NS' in value:
+        return [number(v) for v in value['NS']]
+    if 'B' in value:
+        return base64.b64encode(value['B']).decode('ascii')
+    if 'BS' in value:
+        return [base64.b64encode(v).decode('ascii') for v in value['BS']]
+    raise TypeError(f'Unsupported attribute value: {value}')
+
+def from_item(item):
+    """
+    Low-level client item to a JSON-native dict in one pass.
+    
+    Skips the resource API's TypeDeserializer, which builds a Decimal for
+    every number only for the handler to convert it again before encoding.
+    """
+    return {name: from_attribute_value(value) for name, value in item.items()}
+
+def to_python(value):
+    """Resource API values (Decimal, sets, nested maps/lists) to JSON-native types"""
+    if isinstance(value, dict):
+        return {k: to_python(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_python(v) for v in value]
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return [to_python(v) for v in value]
+    return value
+
+def json_default(value):
+    """JSON fallback for DynamoDB types that slip through unconverted"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(value):
+    """Compact JSON text, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default).decode('utf-8')
+    return json.dumps(value, default=json_default, separators=(',', ':'))
+
+def parse_body(event):
+    """JSON request body, decoding it first if API Gateway passed it base64-encoded"""
+    body = event['body']
+    if event.get('isBase64Encoded') and body is not None:
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+def choose_encoding(accept_encoding):
+    """Best supported content coding the client accepts, or None"""
+    accepted = set()
+    for part in (accept_encoding or '').lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def accept_encoding(event):
+    """The request's Accept-Encoding header (header names are case-insensitive)"""
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'accept-encoding':
+            return value
+    return None
+
+def etag_value(tag):
+    """Opaque part of an entity tag: no W/ prefix, quotes or content-coding suffix"""
+    value = tag.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"')
+    for coding in CONTENT_CODINGS:
+        if value.endswith(f'-{coding}'):
+            return value[:-len(coding) - 1]
+    return value
+
+def matching_etag(if_none_match, etag):
+    """
+    The If-None-Match tag that matches the current ETag (weak comparison), or None.
+    
+    Returning the client's own tag lets a 304 carry the tag of the
+    representation it holds, compressed or not.
+    """
+    if not if_none_match or not etag:
+        return None
+    if if_none_match.strip() == '*':
+        return etag
+    current = etag_value(etag)
+    for tag in if_none_match.split(','):
+        if etag_value(tag) == current:
+            return tag.strip()
+    return None
+
+def compress_response(response, event):
+    """Compress a large text response body if the request accepts it"""
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if not isinstance(body, str) or response.get('isBase64Encoded') or len(body) < COMPRESSION_MIN_BYTES:
+        return response
+    if not headers.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES) or 'Content-Encoding' in headers:
+        return response
+    encoding = choose_encoding(accept_encoding(event))
+    if encoding is None:
+        return response
+    
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        compressed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(raw, compresslevel=GZIP_LEVEL)
+    
+    compressed_headers = dict(headers)
+    compressed_headers['Content-Encoding'] = encoding
+    vary = [name.strip() for name in headers.get('Vary', '').split(',') if name.strip()]
+    if 'Accept-Encoding' not in vary:
+        vary.append('Accept-Encoding')
+    compressed_headers['Vary'] = ', '.join(vary)
+    # A compressed body is a different representation, so it gets its own tag
+    etag = compressed_headers.get('ETag')
+    if etag and etag.endswith('"'):
+        compressed_headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return dict(response, headers=compressed_headers,
+                body=base64.b64encode(compressed).decode('ascii'), isBase64Encoded=True)
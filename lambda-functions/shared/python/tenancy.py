@@ -0,0 +1,74 @@
+import os
+import re
+
+# Products are partitioned by tenant and warehouse. The products table's
+# partition key is "<tenant_id>#<warehouse_id>" and its sort key the
+# product_id, so every read of a view is a Query of one partition and scales
+# with that partition's data, not with the whole table.
+#
+# Items derived from products (metadata items, movement buckets, alert state)
+# carry the partition in their key too, except for the default partition:
+# its keys are the unscoped ones used before partitioning, so a single-tenant
+# deployment keeps its existing metadata and history.
+PARTITION_ATTRIBUTE = 'partition_key'
+DEFAULT_TENANT = os.environ.get('DEFAULT_TENANT', 'default')
+DEFAULT_WAREHOUSE = os.environ.get('DEFAULT_WAREHOUSE', 'main')
+PARTITION_SEPARATOR = '#'
+
+# The tenant comes from the API Gateway authorizer when there is one; the
+# header is for deployments without an authorizer (trusted callers only)
+TENANT_HEADER = 'X-Tenant-Id'
+WAREHOUSE_HEADER = 'X-Warehouse-Id'
+TENANT_CLAIM = 'tenant_id'
+ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+def partition_of(tenant_id, warehouse_id):
+    """Partition key value of a tenant's warehouse"""
+    for value in (tenant_id, warehouse_id):
+        if not isinstance(value, str) or not ID_PATTERN.match(value):
+            raise ValueError('Tenant and warehouse IDs must be 1-64 letters, digits, "_", "." or "-"')
+    return f'{tenant_id}{PARTITION_SEPARATOR}{warehouse_id}'
+
+DEFAULT_PARTITION = partition_of(DEFAULT_TENANT, DEFAULT_WAREHOUSE)
+
+def split_partition(partition):
+    """(tenant_id, warehouse_id) of a partition key value"""
+    tenant_id, warehouse_id = partition.split(PARTITION_SEPARATOR, 1)
+    return tenant_id, warehouse_id
+
+def header(event, name):
+    """Case-insensitive request header lookup"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def authorizer_tenant(event):
+    """Tenant set by the API Gateway authorizer, None without one"""
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or {}
+    return authorizer.get(TENANT_CLAIM) or claims.get(f'custom:{TENANT_CLAIM}')
+
+def request_partition(event):
+    """Partition an API Gateway request reads and writes; ValueError for invalid IDs"""
+    tenant_id = authorizer_tenant(event) or header(event, TENANT_HEADER) or DEFAULT_TENANT
+    warehouse_id = header(event, WAREHOUSE_HEADER) or DEFAULT_WAREHOUSE
+    return partition_of(tenant_id, warehouse_id)
+
+def partition_of_item(item):
+    """Partition of a product item or stream image (items written before partitioning have none)"""
+    return item.get(PARTITION_ATTRIBUTE) or DEFAULT_PARTITION
+
+def product_key(partition, product_id):
+    """Primary key of a product, for the resource API"""
+    return {PARTITION_ATTRIBUTE: partition, 'product_id': product_id}
+
+def client_product_key(partition, product_id):
+    """Primary key of a product, for the low-level client"""
+    return {PARTITION_ATTRIBUTE: {'S': partition}, 'product_id': {'S': product_id}}
+
+def scoped_key(name, partition):
+    """A key derived from a product or view, unique across partitions"""
+    if partition == DEFAULT_PARTITION:
+        return name
+    return f'{name}{PARTITION_SEPARATOR}{partition}'
@@ -0,0 +1,292 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from aws_clients import lazy_client
+from instrumentation import instrumented, log_error
+from restock import build_recommendation, is_low_stock
+from serialization import dumps
+from tenancy import PARTITION_ATTRIBUTE, partition_of_item, scoped_key, split_partition
+
+# AWS services: only single-item writes and PutEvents, so low-level clients
+dynamodb = lazy_client('dynamodb')
+events = lazy_client('events')
+METADATA_TABLE = os.environ.get('METADATA_TABLE', 'stock-metadata')
+EVENT_BUS_NAME = os.environ.get('EVENT_BUS_NAME', 'default')
+
+# Alert state: one metadata item per alerted product ("low_stock_alert:<product_id>",
+# scoped by partition outside the default one) saying whether it is currently
+# low and, while it is, holding its precomputed restock recommendation. It also
+# keeps the sequence number of the last stream record applied, so duplicate and
+# replayed records are dropped by the condition on each write. Sequence numbers
+# are zero-padded to compare as strings.
+ALERT_KEY_PREFIX = 'low_stock_alert:'
+STATE_LOW = 'low'
+STATE_RESOLVED = 'resolved'
+SEQUENCE_NUMBER_DIGITS = 40
+
+# Alert events on EventBridge
+EVENT_SOURCE = 'stock-manager.alerts'
+LOW_STOCK_DETECTED = 'Low Stock Detected'
+LOW_STOCK_RESOLVED = 'Low Stock Resolved'
+PUT_EVENTS_MAX_ENTRIES = 10
+
+# Products of a batch are handled concurrently; one product's changes stay in stream order
+PRODUCT_MAX_WORKERS = int(os.environ.get('PRODUCT_MAX_WORKERS', '8'))
+
+# Changing any of these while a product stays low refreshes its recommendation
+RECOMMENDATION_FIELDS = ('quantity', 'min_threshold', 'price', 'name')
+
+deserializer = TypeDeserializer()
+serializer = TypeSerializer()
+
+@instrumented('stock-alerts')
+def lambda_handler(event, context):
+    """
+    Turn low-stock threshold crossings in a stock-products stream batch into alerts.
+    
+    Returns the records that failed as batchItemFailures: Lambda retries the
+    batch from the first of them, and records already alerted on are skipped.
+    """
+    records = event.get('Records', [])
+    by_product = {}
+    for record in records:
+        change = threshold_change(record)
+        if change:
+            by_product.setdefault((change['partition'], change['product_id']), []).append(change)
+    
+    counts = dict.fromkeys(('detected', 'resolved', 'refreshed', 'skipped'), 0)
+    failed = []
+    queues = [coalesce_refreshes(changes) for changes in by_product.values()]
+    with ThreadPoolExecutor(max_workers=PRODUCT_MAX_WORKERS) as executor:
+        while queues:
+            # One change per product per round: a product's next change waits
+            # until the event of its previous one is out, so alerts stay in
+            # stream order and a product never has two unpublished transitions
+            batch = [queue.pop(0) for queue in queues]
+            outcomes = list(executor.map(apply_change, batch))
+            alerts = [change for change, outcome in zip(batch, outcomes) if outcome == 'alert']
+            rejected = put_alert_events(alerts)
+            list(executor.map(mark_published, [change for change in alerts if id(change) not in rejected]))
+            
+            remaining = []
+            for queue, change, outcome in zip(queues, batch, outcomes):
+                if outcome == 'failed' or id(change) in rejected:
+                    # Later changes of the product are retried with this one
+                    failed.append(change)
+                    continue
+                counts[change['kind'] if outcome == 'alert' else outcome] += 1
+                if queue:
+                    remaining.append(queue)
+            queues = remaining
+    
+    failed_sequences = sorted({change['sequence_number'] for change in failed}, key=int)
+    print(json.dumps({
+        'metric': 'stock_alerts',
+        'records': len(records),
+        'products': len(by_product),
+        **counts,
+        'failed_records': len(failed_sequences)
+    }))
+    
+    return {'batchItemFailures': [{'itemIdentifier': sequence} for sequence in failed_sequences]}
+
+def deserialize_image(image):
+    """Convert a stream image from DynamoDB JSON to Python values"""
+    return {k: deserializer.deserialize(v) for k, v in (image or {}).items()}
+
+def serialize(values):
+    """Convert Python values to DynamoDB JSON for the low-level client (floats as Decimal)"""
+    values = json.loads(dumps(values), parse_float=Decimal)
+    return {k: serializer.serialize(v) for k, v in values.items()}
+
+def image_is_low(image):
+    if 'quantity' not in image or 'min_threshold' not in image:
+        return False
+    return is_low_stock(image['quantity'], image['min_threshold'])
+
+def threshold_change(record):
+    """A stream record as a low-stock crossing ('detected'/'resolved'), a 'refresh' of a still-low product, or None"""
+    stream = record.get('dynamodb', {})
+    old_image = deserialize_image(stream.get('OldImage'))
+    new_image = deserialize_image(stream.get('NewImage'))
+    was_low = image_is_low(old_image)
+    now_low = image_is_low(new_image)
+    
+    if now_low and not was_low:
+        kind = 'detected'
+    elif was_low and not now_low:
+        kind = 'resolved'
+    elif now_low and any(old_image.get(field) != new_image.get(field) for field in RECOMMENDATION_FIELDS):
+        kind = 'refresh'
+    else:
+        return None
+    
+    timestamp = stream.get('ApproximateCreationDateTime')
+    changed_at = datetime.fromtimestamp(timestamp, timezone.utc) if timestamp else datetime.now(timezone.utc)
+    return {
+        'kind': kind,
+        'partition': partition_of_item(new_image or old_image),
+        'product_id': (new_image or old_image)['product_id'],
+        'sequence_number': stream['SequenceNumber'],
+        'old_image': old_image,
+        'new_image': new_image,
+        'changed_at': changed_at
+    }
+
+def coalesce_refreshes(changes):
+    """Drop refreshes superseded by a later change of the same product in the batch"""
+    last = len(changes) - 1
+    return [change for i, change in enumerate(changes) if change['kind'] != 'refresh' or i == last]
+
+def apply_change(change):
+    """Write one change to its product's alert state: 'alert', 'refreshed', 'skipped' or 'failed'"""
+    try:
+        if change['kind'] == 'refresh':
+            return 'refreshed' if refresh_recommendation(change) else 'skipped'
+        return 'alert' if record_transition(change) else 'skipped'
+    except Exception as e:
+        log_error("Error recording low-stock transition", e, partition=change['partition'],
+                  product_id=change['product_id'], sequence_number=change['sequence_number'])
+        return 'failed'
+
+def alert_key(change):
+    return {'meta_key': {'S': ALERT_KEY_PREFIX + scoped_key(change['product_id'], change['partition'])}}
+
+def sequence_key(sequence_number):
+    return sequence_number.zfill(SEQUENCE_NUMBER_DIGITS)
+
+def record_transition(change):
+    """
+    Store a detected/resolved transition as the product's alert state.
+    
+    Returns False for a record older than the stored state, or one that does
+    not change it (a duplicate, or a product that was low before alerts were
+    tracked). The item stays `pending` until the event is published, so a
+    retry of the same record publishes it again instead of dropping it.
+    """
+    values = {
+        ':state': STATE_LOW if change['kind'] == 'detected' else STATE_RESOLVED,
+        ':sequence': sequence_key(change['sequence_number']),
+        ':product_id': change['product_id'],
+        ':partition': change['partition'],
+        ':updated_at': datetime.now().isoformat()
+    }
+    update = ('SET #state = :state, sequence_number = :sequence, pending = :sequence, '
+              f'product_id = :product_id, {PARTITION_ATTRIBUTE} = :partition, updated_at = :updated_at')
+    changed = 'sequence_number < :sequence AND #state <> :state'
+    if change['kind'] == 'detected':
+        change['recommendation'] = build_recommendation(change['new_image'])
+        values[':recommendation'] = change['recommendation']
+        update += ', recommendation = :recommendation'
+        changed = f'attribute_not_exists(#state) OR ({changed})'
+    else:
+        # No stored state: the product was never alerted on, so there is nothing to resolve
+        update += ' REMOVE recommendation'
+    
+    try:
+        dynamodb.update_item(
+            TableName=METADATA_TABLE,
+            Key=alert_key(change),
+            UpdateExpression=update,
+            ConditionExpression=f'{changed} OR pending = :sequence',
+            ExpressionAttributeNames={'#state': 'state'},
+            ExpressionAttributeValues=serialize(values)
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def refresh_recommendation(change):
+    """Update the stored recommendation of a product that is still low; False if it is not alerted"""
+    try:
+        dynamodb.update_item(
+            TableName=METADATA_TABLE,
+            Key=alert_key(change),
+            UpdateExpression='SET recommendation = :recommendation, sequence_number = :sequence, '
+                             'updated_at = :updated_at',
+            ConditionExpression='#state = :low AND sequence_number < :sequence',
+            ExpressionAttributeNames={'#state': 'state'},
+            ExpressionAttributeValues=serialize({
+                ':recommendation': build_recommendation(change['new_image']),
+                ':sequence': sequence_key(change['sequence_number']),
+                ':updated_at': datetime.now().isoformat(),
+                ':low': STATE_LOW
+            })
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def alert_event(change):
+    """PutEvents entry for one transition"""
+    old_image, new_image = change['old_image'], change['new_image']
+    product = new_image or old_image
+    tenant_id, warehouse_id = split_partition(change['partition'])
+    detail = {
+        'tenant_id': tenant_id,
+        'warehouse_id': warehouse_id,
+        'product_id': change['product_id'],
+        'product_name': product.get('name'),
+        'quantity': new_image.get('quantity'),
+        'previous_quantity': old_image.get('quantity'),
+        'min_threshold': product.get('min_threshold'),
+        'sequence_number': change['sequence_number'],
+        'changed_at': change['changed_at'].isoformat()
+    }
+    if change['kind'] == 'detected':
+        detail['recommendation'] = change['recommendation']
+    elif not new_image:
+        detail['reason'] = 'removed'
+    elif new_image['quantity'] > old_image['quantity']:
+        detail['reason'] = 'restocked'
+    else:
+        detail['reason'] = 'threshold_lowered'
+    
+    return {
+        'Source': EVENT_SOURCE,
+        'DetailType': LOW_STOCK_DETECTED if change['kind'] == 'detected' else LOW_STOCK_RESOLVED,
+        'Detail': dumps(detail),
+        'EventBusName': EVENT_BUS_NAME,
+        'Time': change['changed_at']
+    }
+
+def put_alert_events(alerts):
+    """Publish alert events, 10 per PutEvents call; returns the ids of the alerts that failed"""
+    rejected = set()
+    for i in range(0, len(alerts), PUT_EVENTS_MAX_ENTRIES):
+        chunk = alerts[i:i + PUT_EVENTS_MAX_ENTRIES]
+        try:
+            response = events.put_events(Entries=[alert_event(change) for change in chunk])
+        except Exception as e:
+            log_error("Error publishing low-stock alerts", e, count=len(chunk))
+            rejected.update(id(change) for change in chunk)
+            continue
+        if response.get('FailedEntryCount'):
+            for change, entry in zip(chunk, response['Entries']):
+                if 'ErrorCode' in entry:
+                    log_error("Low-stock alert rejected", product_id=change['product_id'],
+                              error_code=entry['ErrorCode'], error=entry.get('ErrorMessage'))
+                    rejected.add(id(change))
+    return rejected
+
+def mark_published(change):
+    """Clear the pending flag once the transition's event is out"""
+    try:
+        dynamodb.update_item(
+            TableName=METADATA_TABLE,
+            Key=alert_key(change),
+            UpdateExpression='REMOVE pending',
+            ConditionExpression='pending = :sequence',
+            ExpressionAttributeValues={':sequence': {'S': sequence_key(change['sequence_number'])}}
+        )
+    except Exception as e:
+        # Not a failed record: the event is out, at worst a later retry sends it again
+        log_error("Error clearing pending alert", e, product_id=change['product_id'])
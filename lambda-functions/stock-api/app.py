@@ -1,22 +1,127 @@
 import json
-import boto3
-import uuid
+import os
+import csv
+import io
+import base64
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
+from botocore.exceptions import ClientError
+from product_search import ProductSearchIndex
+from aws_clients import lazy_client, lazy_resource, lazy_table
+from identifiers import IdGenerator, id_range
+from idempotency import IDEMPOTENCY_HEADER, IdempotencyConflict
+from instrumentation import annotate, instrumented, log_error, record_count, span
+from inventory_version import (INVENTORY_CHANGES_RETENTION_SECONDS, inventory_changes_key, inventory_version_key,
+                               read_inventory_version)
+from product_cache import PRODUCT_CACHE_URL, ProductCache, make_backend, table_loader
+from serialization import compress_response, dumps, etag_value, matching_etag, from_item, parse_body, to_python
+from tenancy import (PARTITION_ATTRIBUTE, TENANT_HEADER, WAREHOUSE_HEADER, authorizer_tenant, product_key,
+                     request_partition, scoped_key)
+import idempotency
 
-# DynamoDB setup
-dynamodb = boto3.resource('dynamodb')
-table = dynamodb.Table('stock-products')
+# DynamoDB setup (created on first use, so a cold start only pays for what the route needs)
+# Large reads (partition queries) use the low-level client and convert raw
+# attribute values straight to JSON types (see serialization).
+# Products are keyed by partition (tenant and warehouse, see tenancy) and
+# product_id; every request is scoped to the caller's partition.
+PRODUCTS_TABLE = os.environ.get('DYNAMODB_TABLE', 'stock-products')
+dynamodb = lazy_resource('dynamodb')
+dynamodb_client = lazy_client('dynamodb')
+table = lazy_table(PRODUCTS_TABLE)
+metadata_table = lazy_table(os.environ.get('METADATA_TABLE', 'stock-metadata'))
+idempotency_table = lazy_table(os.environ.get('IDEMPOTENCY_TABLE', 'stock-idempotency'))
 
+# GET /products/{id} reads through the product cache (see product_cache);
+# every write here drops the products it touched from it
+product_cache = ProductCache(table_loader(dynamodb_client, PRODUCTS_TABLE), make_backend(PRODUCT_CACHE_URL))
+
+# Pagination settings for GET /products
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_QUERY_PAGES = 10
+
+# Sparse low-stock index: only products with quantity <= min_threshold carry
+# the LOW_STOCK_ATTRIBUTE, set to their partition, so the GSI holds exactly
+# the products to restock, grouped by partition.
+LOW_STOCK_INDEX = 'low-stock-index'
+LOW_STOCK_ATTRIBUTE = 'low_stock'
+
+# Products of a partition by category
+CATEGORY_INDEX = 'category-index'
+
+# Product creation: POST /products takes one product or an array of them,
+# POST /products/bulk an array. New products are written with conditional
+# puts (never over an existing ID), arrays in TransactWriteItems chunks since
+# BatchWriteItem has no conditions. With an Idempotency-Key header, a retried
+# request replays the first response (see idempotency) and, if it has to run
+# again, regenerates the same product IDs (see identifiers).
+CREATE_MAX_ATTEMPTS = 3
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# Bulk import / export settings
+BULK_MAX_ITEMS = 10000
+EXPORT_FIELDS = [
+    'product_id', 'name', 'category', 'quantity', 'min_threshold',
+    'price', 'description', 'created_at', 'updated_at'
+]
+
+# Inventory summary maintained by the stock-stream function
+INVENTORY_SUMMARY_KEY = 'inventory_summary'
+
+# Cache-Control of the conditional GET routes; a stored response is
+# revalidated with If-None-Match once it is stale. Lists and alerts must
+# show a write at once, so they are revalidated before each reuse and kept
+# out of shared caches. A single product may be reused for
+# PRODUCT_MAX_AGE_SECONDS (other containers' product caches already serve it
+# that late) and stats for STATS_MAX_AGE_SECONDS (stock-stream updates them
+# asynchronously anyway). Those two may also be stored by shared caches (API
+# Gateway, CloudFront) keyed on the Vary headers, except when the tenant comes
+# from the authorizer: the caller's identity is not in the shared cache key.
+CONDITIONAL_CACHE_CONTROL = 'private, no-cache'
+PRODUCT_MAX_AGE_SECONDS = int(os.environ.get('PRODUCT_MAX_AGE_SECONDS', '5'))
+STATS_MAX_AGE_SECONDS = int(os.environ.get('STATS_MAX_AGE_SECONDS', '10'))
+CATEGORY_PREFIX = 'category_'
+CATEGORY_FIELDS = ('count', 'units', 'value', 'low_stock')
+
+# Stock movement settings
+MOVEMENTS_MAX_ITEMS = 1000
+TRANSACTION_MAX_ITEMS = 100
+BATCH_GET_MAX_KEYS = 100
+
+# Product search: one inverted index per partition in each warm container
+# (the SEARCH_INDEX_MAX_PARTITIONS most recently searched), built from a query
+# of the partition on first use. After that, each search reads the inventory
+# version and re-fetches only the products stock-stream recorded as changed
+# since the version the index is at (see inventory_version); this container's
+# own writes are applied right away. It is only built again when it falls
+# more than SEARCH_INDEX_MAX_CHANGE_VERSIONS versions behind, or the changes
+# it needs may have expired.
+SEARCH_INDEX_MAX_CHANGE_VERSIONS = int(os.environ.get('SEARCH_INDEX_MAX_CHANGE_VERSIONS', '100'))
+SEARCH_INDEX_MAX_PARTITIONS = int(os.environ.get('SEARCH_INDEX_MAX_PARTITIONS', '16'))
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+_search_indexes = OrderedDict()  # partition -> {'index', 'version', 'synced_at'}
+
+@instrumented('stock-api')
 def lambda_handler(event, context):
     """Main Lambda handler for stock API"""
+    response = route_request(event)
+    return compress_response(response, event)
+
+def route_request(event):
+    """Dispatch an API Gateway event to its handler"""
     
     # CORS headers
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': (f'Content-Type, If-Match, If-None-Match, {IDEMPOTENCY_HEADER}, '
+                                         f'{TENANT_HEADER}, {WAREHOUSE_HEADER}'),
+        'Access-Control-Expose-Headers': f'ETag, {REPLAYED_HEADER}'
     }
     
     try:
@@ -32,28 +137,52 @@ def lambda_handler(event, context):
         method = event['httpMethod']
         path = event['path']
         
+        # Responses differ per tenant and warehouse, and by compression
+        headers['Vary'] = f'{TENANT_HEADER}, {WAREHOUSE_HEADER}, Accept-Encoding'
+        try:
+            partition = request_partition(event)
+        except ValueError as e:
+            return bad_request(str(e), headers)
+        
         if method == 'GET' and path == '/products':
-            return get_all_products(headers)
+            return get_all_products(partition, event.get('queryStringParameters') or {}, headers,
+                                    if_none_match=get_header(event, 'If-None-Match'))
+        elif method == 'GET' and path == '/products/export':
+            return export_products(partition, event.get('queryStringParameters') or {}, headers)
+        elif method == 'GET' and path == '/products/search':
+            return search_products(partition, event.get('queryStringParameters') or {}, headers)
+        elif method == 'POST' and path == '/products/bulk':
+            return run_idempotent(event, partition, 'POST /products/bulk', headers, bulk_create_products)
+        elif method == 'POST' and path.startswith('/products/') and path.endswith('/movements'):
+            product_id = path.split('/')[-2]
+            return apply_stock_movement(partition, product_id, parse_body(event), headers)
+        elif method == 'POST' and path == '/movements':
+            return apply_stock_movements(partition, parse_body(event), headers)
         elif method == 'GET' and path.startswith('/products/'):
             product_id = path.split('/')[-1]
-            return get_product(product_id, headers)
+            return get_product(partition, product_id, headers, if_none_match=get_header(event, 'If-None-Match'),
+                               cache_control=reusable_cache_control(event, PRODUCT_MAX_AGE_SECONDS))
         elif method == 'POST' and path == '/products':
-            return create_product(json.loads(event['body']), headers)
+            return run_idempotent(event, partition, 'POST /products', headers, create_products)
         elif method == 'PUT' and path.startswith('/products/'):
             product_id = path.split('/')[-1]
-            return update_product(product_id, json.loads(event['body']), headers)
+            return update_product(partition, product_id, parse_body(event), headers,
+                                  if_match=get_header(event, 'If-Match'))
         elif method == 'DELETE' and path.startswith('/products/'):
             product_id = path.split('/')[-1]
-            return delete_product(product_id, headers)
+            return delete_product(partition, product_id, headers, if_match=get_header(event, 'If-Match'))
         elif method == 'GET' and path == '/alerts':
-            return get_low_stock_alerts(headers)
+            return get_low_stock_alerts(partition, headers, if_none_match=get_header(event, 'If-None-Match'))
+        elif method == 'GET' and path == '/stats':
+            return get_inventory_stats(partition, headers, if_none_match=get_header(event, 'If-None-Match'),
+                                       cache_control=reusable_cache_control(event, STATS_MAX_AGE_SECONDS))
         else:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'body': json.dumps({'error': 'Route not found'})
             }
-            
+    
     except Exception as e:
         return {
             'statusCode': 500,
@@ -61,23 +190,83 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
-def get_all_products(headers):
-    """Get all products from stock"""
+def get_all_products(partition, params, headers, if_none_match=None):
+    """Get one page of a partition's products, optionally filtered and projected"""
     try:
-        response = table.scan()
-        products = response['Items']
+        # Parse pagination parameters
+        try:
+            limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return bad_request('limit must be an integer', headers)
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            return bad_request(f'limit must be between 1 and {MAX_PAGE_SIZE}', headers)
         
-        # Convert Decimal to float for JSON serialization
-        for product in products:
-            if 'price' in product:
-                product['price'] = float(product['price'])
+        query_kwargs = {'TableName': PRODUCTS_TABLE}
+        if params.get('next_token'):
+            try:
+                query_kwargs['ExclusiveStartKey'] = decode_next_token(params['next_token'], partition)
+            except ValueError:
+                return bad_request('Invalid next_token', headers)
+        
+        # Each filter reads its own index of the partition: category from the
+        # category index, low stock from the sparse low-stock index
+        expression_names = {}
+        expression_values = {':partition': {'S': partition}}
+        low_stock = params.get('low_stock', '').lower() in ('true', '1', 'yes')
+        if params.get('category'):
+            query_kwargs['IndexName'] = CATEGORY_INDEX
+            query_kwargs['KeyConditionExpression'] = f'{PARTITION_ATTRIBUTE} = :partition AND category = :category'
+            expression_values[':category'] = {'S': params['category']}
+            if low_stock:
+                query_kwargs['FilterExpression'] = 'quantity <= min_threshold'
+        elif low_stock:
+            query_kwargs['IndexName'] = LOW_STOCK_INDEX
+            query_kwargs['KeyConditionExpression'] = f'{LOW_STOCK_ATTRIBUTE} = :partition'
+        else:
+            query_kwargs['KeyConditionExpression'] = f'{PARTITION_ATTRIBUTE} = :partition'
+        
+        # Projection (always include the key so clients can address items)
+        if params.get('fields'):
+            fields = ['product_id'] + [
+                f.strip() for f in params['fields'].split(',')
+                if f.strip() and f.strip() != 'product_id'
+            ]
+            placeholders = []
+            for i, field in enumerate(fields):
+                expression_names[f'#f{i}'] = field
+                placeholders.append(f'#f{i}')
+            query_kwargs['ProjectionExpression'] = ', '.join(placeholders)
+        
+        if expression_names:
+            query_kwargs['ExpressionAttributeNames'] = expression_names
+        query_kwargs['ExpressionAttributeValues'] = expression_values
+        
+        # Unchanged inventory: answer 304 before querying anything
+        etag = list_etag(partition, 'products', params)
+        matched = matching_etag(if_none_match, etag)
+        if matched:
+            return not_modified(matched, headers)
+        
+        # Query until the page is full. Limit bounds the items evaluated per call,
+        # so we never read past the last item we return.
+        products = []
+        last_key = None
+        for _ in range(MAX_QUERY_PAGES):
+            query_kwargs['Limit'] = limit - len(products)
+            response = dynamodb_client.query(**query_kwargs)
+            products.extend(from_item(item) for item in response['Items'])
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key or len(products) >= limit:
+                break
+            query_kwargs['ExclusiveStartKey'] = last_key
         
         return {
             'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+            'headers': conditional_headers(headers, etag),
+            'body': dumps({
                 'products': products,
-                'count': len(products)
+                'count': len(products),
+                'next_token': encode_next_token(last_key) if last_key else None
             })
         }
     except Exception as e:
@@ -87,26 +276,54 @@ def get_all_products(headers):
             'body': json.dumps({'error': f'Failed to get products: {str(e)}'})
         }
 
-def get_product(product_id, headers):
-    """Get single product by ID"""
+def encode_next_token(last_evaluated_key):
+    """Wrap a LastEvaluatedKey into an opaque pagination token"""
+    raw = json.dumps(last_evaluated_key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_next_token(token, partition):
+    """Unwrap a pagination token back into a (low-level client) ExclusiveStartKey of the partition"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid next_token')
+    if not isinstance(key, dict) or 'product_id' not in key:
+        raise ValueError('Invalid next_token')
+    # A token only resumes a listing of the partition that issued it
+    if key.get(PARTITION_ATTRIBUTE) != {'S': partition}:
+        raise ValueError('Invalid next_token')
+    return key
+
+def bad_request(message, headers):
+    """Build a 400 response"""
+    return {
+        'statusCode': 400,
+        'headers': headers,
+        'body': json.dumps({'error': message})
+    }
+
+def get_product(partition, product_id, headers, if_none_match=None, cache_control=CONDITIONAL_CACHE_CONTROL):
+    """Get single product by ID, served from the product cache when it is there"""
     try:
-        response = table.get_item(Key={'product_id': product_id})
+        product = product_cache.get(partition, product_id)
         
-        if 'Item' not in response:
+        if product is None:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'body': json.dumps({'error': 'Product not found'})
             }
         
-        product = response['Item']
-        if 'price' in product:
-            product['price'] = float(product['price'])
+        # Same tag the PUT/DELETE If-Match check expects
+        etag = f'"{int(product.get("version", 0))}"'
+        matched = matching_etag(if_none_match, etag)
+        if matched:
+            return not_modified(matched, headers, cache_control)
         
         return {
             'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({'product': product})
+            'headers': conditional_headers(headers, etag, cache_control),
+            'body': dumps({'product': product})
         }
     except Exception as e:
         return {
@@ -115,37 +332,75 @@ def get_product(product_id, headers):
             'body': json.dumps({'error': f'Failed to get product: {str(e)}'})
         }
 
-def create_product(data, headers):
-    """Create new product"""
+def run_idempotent(event, partition, route, headers, handler):
+    """
+    Run a create handler, once per Idempotency-Key when the request has one.
+    
+    handler(partition, data, headers, ids) creates products with the IDs of
+    `ids`, seeded by the key: a retry that must run again (its first attempt
+    failed or was abandoned) writes the same IDs, not new products.
+    """
+    data = parse_body(event)
+    key = get_header(event, IDEMPOTENCY_HEADER)
+    if key is None:
+        return handler(partition, data, headers, IdGenerator())
+    
     try:
-        # Generate unique ID
-        product_id = str(uuid.uuid4())[:8].upper()
-        
-        # Prepare item
-        item = {
-            'product_id': product_id,
-            'name': data['name'],
-            'quantity': int(data['quantity']),
-            'min_threshold': int(data.get('min_threshold', 5)),
-            'price': Decimal(str(data.get('price', 0))),
-            'category': data.get('category', 'General'),
-            'description': data.get('description', ''),
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat()
+        record = idempotency.claim(idempotency_table, f'{partition}#{route}', key, data)
+    except ValueError as e:
+        return bad_request(str(e), headers)
+    except IdempotencyConflict as e:
+        return {
+            'statusCode': e.status,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
         }
+    if 'response' in record:
+        replay_headers = dict(headers)
+        replay_headers[REPLAYED_HEADER] = 'true'
+        return {
+            'statusCode': record['response']['statusCode'],
+            'headers': replay_headers,
+            'body': record['response']['body']
+        }
+    
+    try:
+        response = handler(partition, data, headers, IdGenerator(record['idempotency_key'], record['started_ms']))
+    except Exception:
+        idempotency.release(idempotency_table, record)
+        raise
+    if response['statusCode'] >= 500:
+        # Let the client retry right away
+        idempotency.release(idempotency_table, record)
+    else:
+        idempotency.complete(idempotency_table, record, response['statusCode'], response['body'])
+    return response
+
+def create_products(partition, data, headers, ids):
+    """POST /products: one product, or an array of them like /products/bulk"""
+    if isinstance(data, list):
+        return bulk_create_products(partition, data, headers, ids)
+    return create_product(partition, data, headers, ids)
+
+def create_product(partition, data, headers, ids):
+    """Create new product"""
+    try:
+        try:
+            item = build_product_item(partition, data, ids(0))
+        except ValueError as e:
+            return bad_request(str(e), headers)
         
-        # Save to DynamoDB
-        table.put_item(Item=item)
-        
-        # Convert Decimal for response
-        item['price'] = float(item['price'])
+        item = put_new_product(item, ids)
+        product_cache.invalidate(partition, [item['product_id']])
+        index_product(item)
+        bump_inventory_version(partition)
         
         return {
             'statusCode': 201,
             'headers': headers,
-            'body': json.dumps({
+            'body': dumps({
                 'message': 'Product created successfully',
-                'product': item
+                'product': to_python(item)
             })
         }
     except Exception as e:
@@ -155,60 +410,412 @@ def create_product(data, headers):
             'body': json.dumps({'error': f'Failed to create product: {str(e)}'})
         }
 
-def update_product(product_id, data, headers):
-    """Update existing product"""
+def put_new_product(item, ids):
+    """
+    Write a new product, never over an existing one; returns the stored item.
+    
+    A taken ID is either the product an earlier attempt of the same
+    idempotent request wrote (deterministic IDs), returned as is, or a
+    collision of random IDs, retried under a new one.
+    """
+    for attempt in range(CREATE_MAX_ATTEMPTS):
+        try:
+            table.put_item(Item=item, ConditionExpression='attribute_not_exists(product_id)')
+            return item
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        if ids.deterministic:
+            existing = table.get_item(Key=product_key(item[PARTITION_ATTRIBUTE], item['product_id']),
+                                      ConsistentRead=True).get('Item')
+            if existing:
+                return existing
+        else:
+            item['product_id'] = ids(0)
+    raise RuntimeError('No free product ID found')
+
+def put_new_products(items, ids):
+    """
+    Write new products with conditional puts, TRANSACTION_MAX_ITEMS per TransactWriteItems call.
+    
+    Transactional writes cost two write units per item: the price of a
+    condition on each put. Items of a cancelled chunk are written again, and
+    taken IDs are handled as in put_new_product. Returns how many products
+    an earlier attempt of the same request had already written.
+    """
+    client = dynamodb.meta.client
+    pending = list(items)
+    existing = 0
+    for attempt in range(CREATE_MAX_ATTEMPTS):
+        retry = []
+        for start in range(0, len(pending), TRANSACTION_MAX_ITEMS):
+            chunk = pending[start:start + TRANSACTION_MAX_ITEMS]
+            try:
+                client.transact_write_items(TransactItems=[
+                    {'Put': {
+                        'TableName': table.name,
+                        'Item': item,
+                        'ConditionExpression': 'attribute_not_exists(product_id)'
+                    }}
+                    for item in chunk
+                ])
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                reasons = e.response.get('CancellationReasons', [])
+                for i, item in enumerate(chunk):
+                    code = reasons[i].get('Code', 'None') if i < len(reasons) else 'None'
+                    if code != 'ConditionalCheckFailed':
+                        # Rolled back with its chunk, or throttled
+                        retry.append(item)
+                    elif ids.deterministic:
+                        existing += 1
+                    else:
+                        item['product_id'] = ids(0)
+                        retry.append(item)
+        if not retry:
+            return existing
+        pending = retry
+    raise RuntimeError(f'{len(pending)} products could not be written')
+
+def parse_product_fields(data):
+    """Validate the product fields present in `data`; returns them typed for DynamoDB"""
+    if not isinstance(data, dict):
+        raise ValueError('Product must be an object')
+    fields = {name: data[name] for name in ('name', 'category', 'description') if name in data}
+    if 'name' in fields and not fields['name']:
+        raise ValueError('name must not be empty')
+    try:
+        for name in ('quantity', 'min_threshold'):
+            if name in data:
+                fields[name] = int(data[name])
+        if 'price' in data:
+            fields['price'] = Decimal(str(data['price']))
+    except Exception:
+        raise ValueError('quantity, min_threshold and price must be numbers')
+    if 'price' in fields and not fields['price'].is_finite():
+        raise ValueError('quantity, min_threshold and price must be numbers')
+    if any(fields[name] < 0 for name in ('quantity', 'min_threshold', 'price') if name in fields):
+        raise ValueError('quantity, min_threshold and price must not be negative')
+    return fields
+
+def build_product_item(partition, data, product_id):
+    """Validate product input and build the DynamoDB item"""
+    if not isinstance(data, dict):
+        raise ValueError('Product must be an object')
+    if not data.get('name'):
+        raise ValueError('name is required')
+    if 'quantity' not in data:
+        raise ValueError('quantity is required')
+    fields = parse_product_fields(data)
+    
+    # Prepare item
+    item = {
+        PARTITION_ATTRIBUTE: partition,
+        'product_id': product_id,
+        'name': fields['name'],
+        'quantity': fields['quantity'],
+        'min_threshold': fields.get('min_threshold', 5),
+        'price': fields.get('price', Decimal(0)),
+        'category': data.get('category', 'General'),
+        'description': data.get('description', ''),
+        'created_at': datetime.now().isoformat(),
+        'updated_at': datetime.now().isoformat(),
+        'version': 1
+    }
+    if is_low_stock(item['quantity'], item['min_threshold']):
+        item[LOW_STOCK_ATTRIBUTE] = partition
+    
+    return item
+
+def bulk_create_products(partition, data, headers, ids):
+    """Create many products in one request using batched conditional writes"""
     try:
-        # Check if product exists
-        response = table.get_item(Key={'product_id': product_id})
-        if 'Item' not in response:
+        products = data.get('products') if isinstance(data, dict) else data
+        if not isinstance(products, list) or not products:
+            return bad_request('Expected a non-empty list of products', headers)
+        if len(products) > BULK_MAX_ITEMS:
+            return bad_request(f'At most {BULK_MAX_ITEMS} products per request', headers)
+        
+        # Validate everything first so bad rows are reported, not written
+        items = []
+        errors = []
+        for index, product in enumerate(products):
+            try:
+                items.append(build_product_item(partition, product, ids(index)))
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+        
+        if not items:
             return {
-                'statusCode': 404,
+                'statusCode': 400,
                 'headers': headers,
-                'body': json.dumps({'error': 'Product not found'})
+                'body': json.dumps({'error': 'No valid products', 'errors': errors})
             }
         
+        put_new_products(items, ids)
+        product_cache.invalidate(partition, [item['product_id'] for item in items])
+        for item in items:
+            index_product(item)
+        bump_inventory_version(partition)
+        
+        return {
+            'statusCode': 201,
+            'headers': headers,
+            'body': json.dumps({
+                'message': f'{len(items)} products created, {len(errors)} rejected',
+                'created': len(items),
+                'product_ids': [item['product_id'] for item in items],
+                'errors': errors
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to import products: {str(e)}'})
+        }
+
+def export_products(partition, params, headers):
+    """
+    Export a partition's catalog as NDJSON or CSV, one query page at a time.
+    
+    created_from / created_to (ISO 8601) limit it to the products created
+    in that range, a range of product IDs since those are time-ordered.
+    """
+    try:
+        export_format = params.get('format', 'ndjson').lower()
+        if export_format not in ('ndjson', 'csv'):
+            return bad_request('format must be ndjson or csv', headers)
+        id_bounds = None
+        if params.get('created_from') or params.get('created_to'):
+            try:
+                id_bounds = id_range(*(datetime.fromisoformat(params[name]) if params.get(name) else None
+                                       for name in ('created_from', 'created_to')))
+            except ValueError:
+                return bad_request('created_from and created_to must be ISO 8601 datetimes', headers)
+        
+        # Write each page as it arrives instead of holding all items
+        output = io.StringIO()
+        if export_format == 'csv':
+            writer = csv.DictWriter(output, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for items in query_partition_pages(partition, id_bounds):
+                writer.writerows(items)
+        else:
+            for items in query_partition_pages(partition, id_bounds):
+                for item in items:
+                    output.write(dumps(item))
+                    output.write('\n')
+        
+        export_headers = dict(headers)
+        export_headers['Content-Type'] = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        export_headers['Content-Disposition'] = f'attachment; filename="products.{export_format}"'
+        
+        return {
+            'statusCode': 200,
+            'headers': export_headers,
+            'body': output.getvalue()
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to export products: {str(e)}'})
+        }
+
+def query_partition_pages(partition, id_bounds=None):
+    """Every product of a partition (with a product ID within id_bounds), one query page (up to 1MB) at a time"""
+    query_kwargs = {
+        'TableName': PRODUCTS_TABLE,
+        'KeyConditionExpression': f'{PARTITION_ATTRIBUTE} = :partition',
+        'ExpressionAttributeValues': {':partition': {'S': partition}}
+    }
+    if id_bounds:
+        query_kwargs['KeyConditionExpression'] += ' AND product_id BETWEEN :lowest AND :highest'
+        query_kwargs['ExpressionAttributeValues'][':lowest'] = {'S': id_bounds[0]}
+        query_kwargs['ExpressionAttributeValues'][':highest'] = {'S': id_bounds[1]}
+    while True:
+        response = dynamodb_client.query(**query_kwargs)
+        yield [from_item(item) for item in response['Items']]
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def search_products(partition, params, headers):
+    """Ranked free-text search over product name, category and description"""
+    try:
+        query = (params.get('q') or '').strip()
+        if not query:
+            return bad_request('q is required', headers)
+        try:
+            limit = int(params.get('limit', SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            return bad_request('limit must be an integer', headers)
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        
+        results = []
+        for product, score in get_search_index(partition).search(query, limit=limit):
+            result = dict(product)
+            result['score'] = score
+            results.append(result)
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': dumps({
+                'query': query,
+                'products': results,
+                'count': len(results)
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to search products: {str(e)}'})
+        }
+
+def get_search_index(partition):
+    """The container's search index of a partition, brought up to the partition's inventory version"""
+    state = _search_indexes.get(partition)
+    if state is None:
+        state = _search_indexes[partition] = {'index': ProductSearchIndex(), 'version': 0, 'synced_at': None}
+        while len(_search_indexes) > SEARCH_INDEX_MAX_PARTITIONS:
+            _search_indexes.popitem(last=False)
+    _search_indexes.move_to_end(partition)
+    
+    # Read before the products, like list ETags: a change made meanwhile is
+    # fetched again on the next search rather than missed. An eventually
+    # consistent read can lag behind the version the index is at; the index
+    # then stays where it is.
+    version = read_inventory_version(metadata_table, partition) or 0
+    behind = version - state['version']
+    synced_at = state['synced_at']
+    if (synced_at is None or behind > SEARCH_INDEX_MAX_CHANGE_VERSIONS
+            or time.time() - synced_at > INVENTORY_CHANGES_RETENTION_SECONDS):
+        # sync() only re-indexes changed products
+        with span('search_index_build'):
+            products = [item for items in query_partition_pages(partition) for item in items]
+            changed = state['index'].sync(products)
+        record_count('SearchIndexBuilds')
+    elif behind > 0:
+        with span('search_index_sync'):
+            product_ids = sorted(changed_product_ids(partition, state['version'], version))
+            products = {item['product_id']: to_python(item) for item in batch_get_products(partition, product_ids)}
+            for product_id in product_ids:
+                if product_id in products:
+                    state['index'].add(products[product_id])
+                else:
+                    state['index'].remove(product_id)
+        changed = len(product_ids)
+    else:
+        version = state['version']
+        changed = 0
+    state['version'] = version
+    state['synced_at'] = time.time()
+    record_count('SearchIndexChanged', changed)
+    annotate(search_index_products=len(state['index']))
+    return state['index']
+
+def changed_product_ids(partition, after_version, version):
+    """Products stock-stream recorded as changed in a partition's inventory versions after after_version, up to version"""
+    keys = [{'meta_key': inventory_changes_key(partition, v)} for v in range(after_version + 1, version + 1)]
+    product_ids = set()
+    for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        # Versions bumped by the stock API alone have no changes item
+        request = {metadata_table.name: {
+            'Keys': keys[start:start + BATCH_GET_MAX_KEYS],
+            'ConsistentRead': True,
+            'ProjectionExpression': 'product_ids'
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(metadata_table.name, []):
+                product_ids.update(item.get('product_ids', ()))
+            request = response.get('UnprocessedKeys')
+    return product_ids
+
+def index_product(item):
+    """Apply this container's own write to its partition's search index, if it has been built"""
+    state = _search_indexes.get(item[PARTITION_ATTRIBUTE])
+    if state is not None and state['synced_at'] is not None:
+        state['index'].add(to_python(item))
+
+def unindex_product(partition, product_id):
+    """Drop a deleted product from its partition's search index"""
+    state = _search_indexes.get(partition)
+    if state is not None:
+        state['index'].remove(product_id)
+
+def update_product(partition, product_id, data, headers, if_match=None):
+    """Update existing product in a single conditional round trip"""
+    try:
+        try:
+            expected_version = parse_if_match(if_match)
+        except ValueError:
+            return bad_request('Invalid If-Match header', headers)
+        # Same rules as on creation
+        try:
+            fields = parse_product_fields(data)
+        except ValueError as e:
+            return bad_request(str(e), headers)
+        
         # Prepare update expression
         update_expression = "SET updated_at = :updated_at"
-        expression_values = {':updated_at': datetime.now().isoformat()}
+        expression_values = {':updated_at': datetime.now().isoformat(), ':one': 1}
+        expression_names = {'#version': 'version'}
         
         # Add fields to update
-        if 'name' in data:
+        if 'name' in fields:
             update_expression += ", #name = :name"
-            expression_values[':name'] = data['name']
-        if 'quantity' in data:
-            update_expression += ", quantity = :quantity"
-            expression_values[':quantity'] = int(data['quantity'])
-        if 'min_threshold' in data:
-            update_expression += ", min_threshold = :min_threshold"
-            expression_values[':min_threshold'] = int(data['min_threshold'])
-        if 'price' in data:
-            update_expression += ", price = :price"
-            expression_values[':price'] = Decimal(str(data['price']))
-        if 'category' in data:
-            update_expression += ", category = :category"
-            expression_values[':category'] = data['category']
-        if 'description' in data:
-            update_expression += ", description = :description"
-            expression_values[':description'] = data['description']
-        
-        # Update item
-        table.update_item(
-            Key={'product_id': product_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expression_values,
-            ExpressionAttributeNames={'#name': 'name'} if 'name' in data else {}
-        )
+            expression_values[':name'] = fields['name']
+            expression_names['#name'] = 'name'
+        for name in ('quantity', 'min_threshold', 'price', 'category', 'description'):
+            if name in fields:
+                update_expression += f", {name} = :{name}"
+                expression_values[f':{name}'] = fields[name]
+        
+        # When both stock fields are sent, the low-stock flag can be set in the
+        # same write; otherwise it is reconciled from the returned item below.
+        if 'quantity' in fields and 'min_threshold' in fields:
+            if is_low_stock(expression_values[':quantity'], expression_values[':min_threshold']):
+                update_expression += f", {LOW_STOCK_ATTRIBUTE} = :low_stock"
+                expression_values[':low_stock'] = partition
+            else:
+                update_expression += f" REMOVE {LOW_STOCK_ATTRIBUTE}"
+        update_expression += " ADD #version :one"
         
-        # Get updated item
-        updated_response = table.get_item(Key={'product_id': product_id})
-        updated_item = updated_response['Item']
-        if 'price' in updated_item:
-            updated_item['price'] = float(updated_item['price'])
+        condition_expression = 'attribute_exists(product_id)'
+        condition_expression += version_condition(expected_version, expression_values)
+        
+        # Update item and get the new image back in the same call
+        try:
+            response = table.update_item(
+                Key=product_key(partition, product_id),
+                UpdateExpression=update_expression,
+                ConditionExpression=condition_expression,
+                ExpressionAttributeValues=expression_values,
+                ExpressionAttributeNames=expression_names,
+                ReturnValues='ALL_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            return condition_failed_response(e, headers)
+        
+        updated_item = sync_low_stock_flag(response['Attributes'])
+        product_cache.invalidate(partition, [product_id])
+        index_product(updated_item)
+        bump_inventory_version(partition)
+        updated_item = to_python(updated_item)
+        
+        response_headers = dict(headers)
+        response_headers['ETag'] = f'"{updated_item["version"]}"'
         
         return {
             'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+            'headers': response_headers,
+            'body': dumps({
                 'message': 'Product updated successfully',
                 'product': updated_item
             })
@@ -220,20 +827,37 @@ def update_product(product_id, data, headers):
             'body': json.dumps({'error': f'Failed to update product: {str(e)}'})
         }
 
-def delete_product(product_id, headers):
-    """Delete product"""
+def delete_product(partition, product_id, headers, if_match=None):
+    """Delete product in a single conditional round trip"""
     try:
-        # Check if product exists
-        response = table.get_item(Key={'product_id': product_id})
-        if 'Item' not in response:
-            return {
-                'statusCode': 404,
-                'headers': headers,
-                'body': json.dumps({'error': 'Product not found'})
-            }
+        try:
+            expected_version = parse_if_match(if_match)
+        except ValueError:
+            return bad_request('Invalid If-Match header', headers)
+        
+        expression_values = {}
+        version_clause = version_condition(expected_version, expression_values)
+        
+        delete_kwargs = {
+            'Key': product_key(partition, product_id),
+            'ConditionExpression': 'attribute_exists(product_id)' + version_clause,
+            'ReturnValues': 'ALL_OLD',
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }
+        # If-Match: "0" (unversioned item) refers to #version without any value
+        if version_clause:
+            delete_kwargs['ExpressionAttributeNames'] = {'#version': 'version'}
+        if expression_values:
+            delete_kwargs['ExpressionAttributeValues'] = expression_values
         
         # Delete item
-        table.delete_item(Key={'product_id': product_id})
+        try:
+            table.delete_item(**delete_kwargs)
+        except ClientError as e:
+            return condition_failed_response(e, headers)
+        product_cache.invalidate(partition, [product_id])
+        unindex_product(partition, product_id)
+        bump_inventory_version(partition)
         
         return {
             'statusCode': 200,
@@ -247,24 +871,356 @@ def delete_product(product_id, headers):
             'body': json.dumps({'error': f'Failed to delete product: {str(e)}'})
         }
 
-def get_low_stock_alerts(headers):
-    """Get products with low stock (quantity <= min_threshold)"""
+def get_header(event, name):
+    """Case-insensitive request header lookup"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def parse_if_match(if_match):
+    """Turn an If-Match header ("3", W/"3" or 3) into an expected version"""
+    if if_match is None or if_match.strip() == '*':
+        return None
+    value = etag_value(if_match)
+    if not value.isdigit():
+        raise ValueError('Invalid If-Match header')
+    return int(value)
+
+def version_condition(expected_version, expression_values):
+    """Optimistic concurrency clause for the expected item version"""
+    if expected_version is None:
+        return ''
+    if expected_version == 0:
+        # Items written before versioning have no version attribute
+        return ' AND attribute_not_exists(#version)'
+    expression_values[':expected_version'] = expected_version
+    return ' AND #version = :expected_version'
+
+def condition_failed_response(error, headers):
+    """Map a failed write condition to 404 (missing) or 412 (stale version)"""
+    if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+        raise error
+    
+    current = error.response.get('Item')
+    if not current:
+        return {
+            'statusCode': 404,
+            'headers': headers,
+            'body': json.dumps({'error': 'Product not found'})
+        }
+    
+    current_version = int(current.get('version', {}).get('N', 0))
+    response_headers = dict(headers)
+    response_headers['ETag'] = f'"{current_version}"'
+    return {
+        'statusCode': 412,
+        'headers': response_headers,
+        'body': json.dumps({
+            'error': 'Product was modified by another request',
+            'current_version': current_version
+        })
+    }
+
+def list_etag(partition, route, params):
+    """ETag for a list response: the partition's inventory version plus the query parameters"""
+    # Read before the data, so a concurrent write can only leave the tag older
+    # than the body (the next poll refetches) and never newer
+    version = get_inventory_version(partition)
+    if version is None:
+        return None
+    query = hashlib.sha1(json.dumps([partition, params], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f'"{route}-{version}-{query}"'
+
+def get_inventory_version(partition):
+    """Current inventory version counter of a partition, or None before its first change"""
+    return read_inventory_version(metadata_table, partition, consistent_read=True)
+
+def bump_inventory_version(partition):
+    """Invalidate the partition's list ETags right away instead of waiting for stock-stream"""
     try:
-        response = table.scan()
-        products = response['Items']
+        metadata_table.update_item(
+            Key={'meta_key': inventory_version_key(partition)},
+            UpdateExpression='ADD version :one SET updated_at = :updated_at',
+            ExpressionAttributeValues={':one': 1, ':updated_at': datetime.now().isoformat()}
+        )
+    except ClientError as e:
+        # The stream bumps it shortly anyway; don't fail the write
+        log_error("Error bumping inventory version", e)
+
+def reusable_cache_control(event, max_age):
+    """Cache-Control of a GET response that may be reused for max_age seconds"""
+    scope = 'private' if authorizer_tenant(event) else 'public'
+    return f'{scope}, max-age={max_age}'
+
+def conditional_headers(headers, etag, cache_control=CONDITIONAL_CACHE_CONTROL):
+    """Response headers for a revalidatable GET"""
+    response_headers = dict(headers)
+    response_headers['Cache-Control'] = cache_control
+    if etag:
+        response_headers['ETag'] = etag
+    return response_headers
+
+def not_modified(etag, headers, cache_control=CONDITIONAL_CACHE_CONTROL):
+    """304 with no body: the client's cached copy is still current"""
+    return {
+        'statusCode': 304,
+        'headers': conditional_headers(headers, etag, cache_control),
+        'body': ''
+    }
+
+def sync_low_stock_flag(item):
+    """Reconcile the low-stock flag after a partial update of the stock fields"""
+    should_flag = is_low_stock(item['quantity'], item['min_threshold'])
+    if should_flag == (LOW_STOCK_ATTRIBUTE in item):
+        return item
+    
+    partition = item[PARTITION_ATTRIBUTE]
+    if should_flag:
+        update_expression = f"SET {LOW_STOCK_ATTRIBUTE} = :low_stock"
+        expression_values = {':low_stock': partition}
+    else:
+        update_expression = f"REMOVE {LOW_STOCK_ATTRIBUTE}"
+        expression_values = {}
+    
+    # Only fix the flag if no other write changed the stock fields meanwhile
+    expression_values[':quantity'] = item['quantity']
+    expression_values[':min_threshold'] = item['min_threshold']
+    try:
+        response = table.update_item(
+            Key=product_key(partition, item['product_id']),
+            UpdateExpression=update_expression,
+            ConditionExpression='quantity = :quantity AND min_threshold = :min_threshold',
+            ExpressionAttributeValues=expression_values,
+            ReturnValues='ALL_NEW'
+        )
+        return response['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # The concurrent write maintained the flag itself
+        return item
+
+def apply_stock_movement(partition, product_id, data, headers):
+    """Atomically add a quantity delta to one product"""
+    try:
+        try:
+            delta = parse_delta(data.get('delta'))
+        except ValueError as e:
+            return bad_request(str(e), headers)
+        allow_negative = bool(data.get('allow_negative', False))
         
-        # Filter low stock products
-        low_stock = []
-        for product in products:
-            if product['quantity'] <= product['min_threshold']:
-                if 'price' in product:
-                    product['price'] = float(product['price'])
-                low_stock.append(product)
+        update_kwargs = movement_update_kwargs(partition, product_id, delta, allow_negative)
+        try:
+            response = table.update_item(
+                ReturnValues='ALL_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD',
+                **update_kwargs
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            current = e.response.get('Item')
+            if not current:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Product not found'})
+                }
+            return {
+                'statusCode': 409,
+                'headers': headers,
+                'body': json.dumps({
+                    'error': 'Insufficient stock',
+                    'product_id': product_id,
+                    'quantity': int(current['quantity']['N']),
+                    'delta': delta
+                })
+            }
+        
+        item = sync_low_stock_flag(response['Attributes'])
+        product_cache.invalidate(partition, [product_id])
+        index_product(item)
+        bump_inventory_version(partition)
         
         return {
             'statusCode': 200,
             'headers': headers,
-            'body': json.dumps({
+            'body': dumps({
+                'message': 'Stock movement applied',
+                'movement': movement_result(item, delta)
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to apply movement: {str(e)}'})
+        }
+
+def apply_stock_movements(partition, data, headers):
+    """Apply a pick list of movements in TransactWriteItems chunks"""
+    try:
+        movements = data.get('movements') if isinstance(data, dict) else None
+        if not isinstance(movements, list) or not movements:
+            return bad_request('Expected a non-empty list of movements', headers)
+        if len(movements) > MOVEMENTS_MAX_ITEMS:
+            return bad_request(f'At most {MOVEMENTS_MAX_ITEMS} movements per request', headers)
+        allow_negative = bool(data.get('allow_negative', False))
+        
+        # A transaction cannot touch the same item twice: merge deltas per SKU
+        deltas = {}
+        for index, movement in enumerate(movements):
+            try:
+                if not isinstance(movement, dict) or not movement.get('product_id'):
+                    raise ValueError('product_id is required')
+                delta = parse_delta(movement.get('delta'))
+            except ValueError as e:
+                return bad_request(f'Movement {index}: {str(e)}', headers)
+            product_id = str(movement['product_id'])
+            deltas[product_id] = deltas.get(product_id, 0) + delta
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta != 0}
+        
+        # Each chunk is all-or-nothing; chunks are independent of each other
+        client = dynamodb.meta.client
+        product_ids = list(deltas)
+        applied = []
+        failed = []
+        for start in range(0, len(product_ids), TRANSACTION_MAX_ITEMS):
+            chunk = product_ids[start:start + TRANSACTION_MAX_ITEMS]
+            transact_items = [
+                {'Update': {
+                    'TableName': table.name,
+                    **movement_update_kwargs(partition, product_id, deltas[product_id], allow_negative)
+                }}
+                for product_id in chunk
+            ]
+            try:
+                client.transact_write_items(TransactItems=transact_items)
+                applied.extend(chunk)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                reasons = e.response.get('CancellationReasons', [])
+                for i, product_id in enumerate(chunk):
+                    code = reasons[i].get('Code', 'None') if i < len(reasons) else 'Unknown'
+                    if code == 'ConditionalCheckFailed':
+                        reason = 'Product not found or insufficient stock'
+                    elif code == 'None':
+                        reason = 'Rolled back with its chunk'
+                    else:
+                        reason = code
+                    failed.append({
+                        'product_id': product_id,
+                        'delta': deltas[product_id],
+                        'reason': reason
+                    })
+        
+        # Read back the committed quantities and keep the low-stock flag in sync
+        results = []
+        for item in batch_get_products(partition, applied):
+            item = sync_low_stock_flag(item)
+            index_product(item)
+            results.append(movement_result(item, deltas[item['product_id']]))
+        product_cache.invalidate(partition, applied)
+        if applied:
+            bump_inventory_version(partition)
+        
+        return {
+            'statusCode': 200 if not failed else 409,
+            'headers': headers,
+            'body': dumps({
+                'message': f'{len(applied)} products updated, {len(failed)} failed',
+                'movements': results,
+                'failed': failed
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to apply movements: {str(e)}'})
+        }
+
+def parse_delta(value):
+    """Validate a movement delta"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('delta must be a non-zero integer')
+    try:
+        delta = int(value)
+    except ValueError:
+        raise ValueError('delta must be a non-zero integer')
+    if delta == 0:
+        raise ValueError('delta must be a non-zero integer')
+    return delta
+
+def movement_update_kwargs(partition, product_id, delta, allow_negative):
+    """Build the ADD quantity update shared by single and batched movements"""
+    condition_expression = 'attribute_exists(product_id)'
+    expression_values = {
+        ':delta': delta,
+        ':one': 1,
+        ':updated_at': datetime.now().isoformat()
+    }
+    if delta < 0 and not allow_negative:
+        condition_expression += ' AND quantity >= :required'
+        expression_values[':required'] = -delta
+    return {
+        'Key': product_key(partition, product_id),
+        'UpdateExpression': 'SET updated_at = :updated_at ADD quantity :delta, #version :one',
+        'ConditionExpression': condition_expression,
+        'ExpressionAttributeNames': {'#version': 'version'},
+        'ExpressionAttributeValues': expression_values
+    }
+
+def movement_result(item, delta):
+    """Describe the new quantity and any threshold crossing"""
+    new_quantity = item['quantity']
+    old_quantity = new_quantity - delta
+    min_threshold = item['min_threshold']
+    crossed = None
+    if old_quantity > min_threshold >= new_quantity:
+        crossed = 'below'
+    elif old_quantity <= min_threshold < new_quantity:
+        crossed = 'above'
+    return {
+        'product_id': item['product_id'],
+        'delta': delta,
+        'previous_quantity': old_quantity,
+        'quantity': new_quantity,
+        'min_threshold': min_threshold,
+        'low_stock': is_low_stock(new_quantity, min_threshold),
+        'crossed_threshold': crossed
+    }
+
+def batch_get_products(partition, product_ids):
+    """Fetch products of a partition by ID with BatchGetItem, retrying unprocessed keys"""
+    items = []
+    for start in range(0, len(product_ids), BATCH_GET_MAX_KEYS):
+        request = {table.name: {
+            'Keys': [product_key(partition, product_id) for product_id in product_ids[start:start + BATCH_GET_MAX_KEYS]],
+            'ConsistentRead': True
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            items.extend(response['Responses'].get(table.name, []))
+            request = response.get('UnprocessedKeys')
+    return items
+
+def get_low_stock_alerts(partition, headers, if_none_match=None):
+    """Get products with low stock (quantity <= min_threshold)"""
+    try:
+        etag = list_etag(partition, 'alerts', {})
+        matched = matching_etag(if_none_match, etag)
+        if matched:
+            return not_modified(matched, headers)
+        
+        low_stock = query_low_stock(partition)
+        
+        return {
+            'statusCode': 200,
+            'headers': conditional_headers(headers, etag),
+            'body': dumps({
                 'alerts': low_stock,
                 'count': len(low_stock),
                 'message': f'{len(low_stock)} products need restocking'
@@ -275,4 +1231,72 @@ def get_low_stock_alerts(headers):
             'statusCode': 500,
             'headers': headers,
             'body': json.dumps({'error': f'Failed to get alerts: {str(e)}'})
-        }
\ No newline at end of file
+        }
+
+def get_inventory_stats(partition, headers, if_none_match=None, cache_control=CONDITIONAL_CACHE_CONTROL):
+    """Get a partition's inventory totals from its pre-aggregated summary item (one read)"""
+    try:
+        etag = list_etag(partition, 'stats', {})
+        matched = matching_etag(if_none_match, etag)
+        if matched:
+            return not_modified(matched, headers, cache_control)
+        
+        response = metadata_table.get_item(Key={'meta_key': scoped_key(INVENTORY_SUMMARY_KEY, partition)})
+        item = response.get('Item', {})
+        
+        # Category values are stored flat as "category_<field>:<category>"
+        categories = {}
+        for field, amount in item.items():
+            if not field.startswith(CATEGORY_PREFIX) or ':' not in field:
+                continue
+            name, category = field[len(CATEGORY_PREFIX):].split(':', 1)
+            if name in CATEGORY_FIELDS:
+                categories.setdefault(category, {f: 0 for f in CATEGORY_FIELDS})[name] = amount
+        
+        return {
+            'statusCode': 200,
+            'headers': conditional_headers(headers, etag, cache_control),
+            'body': json.dumps({
+                'total_products': int(item.get('product_count', 0)),
+                'total_units': int(item.get('total_units', 0)),
+                'total_value': round(float(item.get('total_value', 0)), 2),
+                'low_stock_count': int(item.get('low_stock_count', 0)),
+                'categories': {
+                    category: {
+                        'count': int(values['count']),
+                        'units': int(values['units']),
+                        'value': round(float(values['value']), 2),
+                        'low_stock': int(values['low_stock'])
+                    }
+                    for category, values in sorted(categories.items())
+                    if values['count'] > 0
+                },
+                'updated_at': item.get('updated_at')
+            })
+        }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': f'Failed to get stats: {str(e)}'})
+        }
+
+def is_low_stock(quantity, min_threshold):
+    """Low stock rule shared by writes and the backfill"""
+    return quantity <= min_threshold
+
+def query_low_stock(partition):
+    """Read only the partition's low-stock products from the sparse index"""
+    query_kwargs = {
+        'TableName': PRODUCTS_TABLE,
+        'IndexName': LOW_STOCK_INDEX,
+        'KeyConditionExpression': f'{LOW_STOCK_ATTRIBUTE} = :partition',
+        'ExpressionAttributeValues': {':partition': {'S': partition}}
+    }
+    products = []
+    while True:
+        response = dynamodb_client.query(**query_kwargs)
+        products.extend(from_item(item) for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return products
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
@@ -0,0 +1,49 @@
+from decimal import Decimal
+
+# Inventory summary item kept in the metadata table
+INVENTORY_SUMMARY_KEY = 'inventory_summary'
+
+# Top-level totals; per-category values are flattened into top-level attributes
+# ("category_value:Books") because DynamoDB ADD only works on top-level attributes
+TOTAL_FIELDS = ('product_count', 'total_units', 'total_value', 'low_stock_count')
+CATEGORY_FIELDS = ('count', 'units', 'value', 'low_stock')
+CATEGORY_PREFIX = 'category_'
+
+def product_contribution(product):
+    """What a single product adds to the summary (empty for a missing product)"""
+    if not product or 'quantity' not in product:
+        return {}
+    quantity = Decimal(str(product['quantity']))
+    price = Decimal(str(product.get('price', 0)))
+    min_threshold = Decimal(str(product.get('min_threshold', 0)))
+    low_stock = 1 if quantity <= min_threshold else 0
+    category = product.get('category') or 'General'
+    return {
+        'product_count': 1,
+        'total_units': quantity,
+        'total_value': quantity * price,
+        'low_stock_count': low_stock,
+        f'{CATEGORY_PREFIX}count:{category}': 1,
+        f'{CATEGORY_PREFIX}units:{category}': quantity,
+        f'{CATEGORY_PREFIX}value:{category}': quantity * price,
+        f'{CATEGORY_PREFIX}low_stock:{category}': low_stock
+    }
+
+def add_into(totals, contribution, sign=1):
+    """Accumulate a contribution into a flat totals dict"""
+    for field, amount in contribution.items():
+        totals[field] = totals.get(field, 0) + sign * amount
+    return totals
+
+def change_delta(old_image, new_image):
+    """Summary delta for one insert/modify/remove (old/new images as Python dicts)"""
+    delta = add_into({}, product_contribution(new_image))
+    add_into(delta, product_contribution(old_image), sign=-1)
+    return {field: amount for field, amount in delta.items() if amount != 0}
+
+def summarize_products(products):
+    """Full recompute of the summary from a list of products"""
+    totals = {}
+    for product in products:
+        add_into(totals, product_contribution(product))
+    return totals
@@ -0,0 +1,346 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from aggregates import INVENTORY_SUMMARY_KEY, add_into, change_delta
+from aws_clients import lazy_client
+from inventory_version import INVENTORY_CHANGES_RETENTION_SECONDS, inventory_changes_key, inventory_version_key
+from tenancy import partition_of_item, scoped_key
+
+# DynamoDB setup: this function only issues UpdateItem calls, so it uses the
+# low-level client and skips loading the resource model on cold start
+dynamodb = lazy_client('dynamodb')
+METADATA_TABLE = os.environ.get('METADATA_TABLE', 'stock-metadata')
+MOVEMENTS_TABLE = os.environ.get('MOVEMENTS_TABLE', 'stock-movements')
+
+# Products whose precomputed ai-assistant results are out of date. Past
+# DIRTY_MAX_PRODUCTS the queue is flagged as overflowed instead, and results
+# stay stale until the next scheduled full run.
+PRECOMPUTE_DIRTY_KEY = 'precompute_dirty'
+DIRTY_MAX_PRODUCTS = int(os.environ.get('DIRTY_MAX_PRODUCTS', '5000'))
+# Fields the recommendations and estimations depend on
+PRECOMPUTE_FIELDS = ('quantity', 'min_threshold', 'price', 'name')
+
+# Daily movement buckets expire after this many days (DynamoDB TTL)
+MOVEMENT_RETENTION_DAYS = int(os.environ.get('MOVEMENT_RETENTION_DAYS', '120'))
+
+# Stream records are delivered at least once: a failed batch is retried whole.
+# The counters are therefore applied with a watermark per product, a metadata
+# item ("stream_sequence:<product_id>", scoped by partition outside the default
+# one) holding the sequence number of its last record applied. A product's
+# movement buckets, its share of the summary delta and its watermark are
+# written in one transaction, conditional on none of its records in the batch
+# being applied yet. (Sequence numbers only order the records of one product,
+# which all go to the same shard, so a partition-wide watermark would not do.)
+# Sequence numbers are zero-padded to compare as strings, like in stock-alerts.
+STREAM_SEQUENCE_PREFIX = 'stream_sequence:'
+SEQUENCE_NUMBER_DIGITS = 40
+TRANSACTION_MAX_ITEMS = 100
+# Concurrent batches updating the same summary item cancel each other's transactions
+TRANSACTION_MAX_ATTEMPTS = 5
+
+deserializer = TypeDeserializer()
+serializer = TypeSerializer()
+
+def lambda_handler(event, context):
+    """Process a batch of stock-products stream records"""
+    records = event.get('Records', [])
+    if not records:
+        return {'processed': 0}
+    
+    # Summaries, versions and dirty queues are per partition (tenant and warehouse)
+    by_partition = {}
+    for record in records:
+        change = stream_change(record)
+        by_partition.setdefault(partition_of_item(change['new_image'] or change['old_image']), []).append(change)
+    
+    movements = summary_fields = replayed = dirty = 0
+    versions = {}
+    for partition, changes in by_partition.items():
+        applied = apply_counters(partition, changes)
+        movements += applied['movement_buckets']
+        summary_fields += applied['summary_fields']
+        replayed += applied['replayed_records']
+        dirty += mark_changed_products(partition, changes)
+        # One counter bump per partition and batch is enough to invalidate warm caches
+        versions[partition] = bump_inventory_version(partition, changed_product_ids(changes))
+    print(json.dumps({
+        'metric': 'stock_stream',
+        'records': len(records),
+        'partitions': len(by_partition),
+        'movement_buckets': movements,
+        'summary_fields': summary_fields,
+        'replayed_records': replayed,
+        'dirty_products': dirty,
+        'inventory_versions': versions
+    }))
+    
+    return {'processed': len(records), 'inventory_versions': versions}
+
+def bump_inventory_version(partition, product_ids):
+    """
+    Increment a partition's inventory version counter, recording the batch's products under the new version.
+    
+    The counter is read and then moved with a condition on its value, so the
+    changes item goes in the same transaction as the version it belongs to. A
+    stock API write bumping the counter in between cancels the transaction,
+    which is tried again.
+    """
+    key = serialize({'meta_key': inventory_version_key(partition)})
+    for attempt in range(TRANSACTION_MAX_ATTEMPTS):
+        item = dynamodb.get_item(TableName=METADATA_TABLE, Key=key, ConsistentRead=True).get('Item', {})
+        current = int(item['version']['N']) if 'version' in item else None
+        version = (current or 0) + 1
+        values = {':version': version, ':updated_at': datetime.now().isoformat()}
+        if current is None:
+            condition = 'attribute_not_exists(version)'
+        else:
+            condition = 'version = :current'
+            values[':current'] = current
+        transact_items = [{'Update': {
+            'TableName': METADATA_TABLE,
+            'Key': key,
+            'UpdateExpression': 'SET version = :version, updated_at = :updated_at',
+            'ConditionExpression': condition,
+            'ExpressionAttributeValues': serialize(values)
+        }}]
+        if product_ids:
+            transact_items.append({'Put': {
+                'TableName': METADATA_TABLE,
+                'Item': serialize({
+                    'meta_key': inventory_changes_key(partition, version),
+                    'product_ids': product_ids,
+                    'expire_at': int(time.time()) + INVENTORY_CHANGES_RETENTION_SECONDS
+                })
+            }})
+        
+        try:
+            dynamodb.transact_write_items(TransactItems=transact_items)
+            return version
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+        time.sleep(min(1.0, 0.05 * 2 ** attempt))
+    raise RuntimeError(f'Inventory version bump for partition {partition!r} kept conflicting')
+
+def changed_product_ids(changes):
+    """IDs of the products a partition's changes touched"""
+    product_ids = set()
+    for change in changes:
+        product_id = (change['new_image'] or change['old_image']).get('product_id')
+        if product_id is not None:
+            product_ids.add(product_id)
+    return product_ids
+
+def deserialize_image(image):
+    """Convert a stream image from DynamoDB JSON to Python values"""
+    return {k: deserializer.deserialize(v) for k, v in (image or {}).items()}
+
+def serialize(values):
+    """Convert Python values to DynamoDB JSON for the low-level client"""
+    return {k: serializer.serialize(v) for k, v in values.items()}
+
+def sequence_key(sequence_number):
+    return sequence_number.zfill(SEQUENCE_NUMBER_DIGITS)
+
+def stream_change(record):
+    """The parts of a stream record this function uses, images as Python values"""
+    stream = record.get('dynamodb', {})
+    timestamp = stream.get('ApproximateCreationDateTime')
+    moved_at = datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp else datetime.now(timezone.utc)
+    return {
+        'event_name': record.get('eventName'),
+        'sequence_number': sequence_key(stream.get('SequenceNumber', '')),
+        'day': moved_at.date().isoformat(),
+        'old_image': deserialize_image(stream.get('OldImage')),
+        'new_image': deserialize_image(stream.get('NewImage'))
+    }
+
+def product_counters(changes):
+    """One product's daily inbound/outbound buckets and inventory summary delta"""
+    buckets, delta = {}, {}
+    for change in changes:
+        if change['event_name'] not in ('INSERT', 'MODIFY', 'REMOVE'):
+            continue
+        old_image, new_image = change['old_image'], change['new_image']
+        add_into(delta, change_delta(old_image, new_image))
+        if 'quantity' not in new_image:
+            continue
+        
+        moved = int(new_image['quantity']) - int(old_image.get('quantity', 0))
+        if moved == 0:
+            continue
+        bucket = buckets.setdefault(change['day'], {'inbound': 0, 'outbound': 0})
+        if moved > 0:
+            bucket['inbound'] += moved
+        else:
+            bucket['outbound'] += -moved
+    return buckets, {field: amount for field, amount in delta.items() if amount != 0}
+
+def apply_counters(partition, changes):
+    """
+    Add a partition's changes to its movement buckets and inventory summary, once.
+    
+    Products are written in transactions of up to TRANSACTION_MAX_ITEMS items,
+    each with its own share of the summary delta. Changes an earlier attempt
+    of the batch already applied are skipped and counted as replayed.
+    """
+    by_product = {}
+    for change in changes:
+        product_id = (change['new_image'] or change['old_image']).get('product_id')
+        if product_id is not None:
+            by_product.setdefault(product_id, []).append(change)
+    
+    applied = {'movement_buckets': 0, 'summary_fields': 0, 'replayed_records': 0}
+    chunk, size = [], 1
+    for product_id, product_changes in by_product.items():
+        # Products whose changes move no counter need no watermark either
+        buckets, delta = product_counters(product_changes)
+        if not buckets and not delta:
+            continue
+        if size + 1 + len(buckets) > TRANSACTION_MAX_ITEMS:
+            add_into(applied, apply_chunk(partition, chunk))
+            chunk, size = [], 1
+        chunk.append((product_id, product_changes))
+        size += 1 + len(buckets)
+    if chunk:
+        add_into(applied, apply_chunk(partition, chunk))
+    return applied
+
+def apply_chunk(partition, chunk):
+    """Write the counters of (product_id, changes) pairs in one transaction"""
+    replayed = conflicts = 0
+    expire_at = int(time.time()) + MOVEMENT_RETENTION_DAYS * 86400
+    while True:
+        transact_items, watermarks, delta, bucket_count = [], [], {}, 0
+        for product_id, changes in chunk:
+            buckets, product_delta = product_counters(changes)
+            if not buckets and not product_delta:
+                continue
+            add_into(delta, product_delta)
+            watermarks.append((len(transact_items), product_id))
+            transact_items.append(watermark_update(partition, product_id, changes))
+            for day, bucket in buckets.items():
+                transact_items.append(movement_update(partition, product_id, day, bucket, expire_at))
+            bucket_count += len(buckets)
+        delta = {field: amount for field, amount in delta.items() if amount != 0}
+        if not watermarks:
+            return {'movement_buckets': 0, 'summary_fields': 0, 'replayed_records': replayed}
+        if delta:
+            transact_items.append(summary_update(partition, delta))
+        
+        try:
+            dynamodb.transact_write_items(TransactItems=transact_items)
+            return {'movement_buckets': bucket_count, 'summary_fields': len(delta), 'replayed_records': replayed}
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons', [])
+        
+        # A failed watermark condition holds the product's last applied sequence
+        # number: drop its changes up to there and write the rest again
+        stored = {}
+        for index, product_id in watermarks:
+            reason = reasons[index] if index < len(reasons) else {}
+            if reason.get('Code') == 'ConditionalCheckFailed':
+                stored[product_id] = reason['Item']['sequence_number']['S']
+        if not stored:
+            # Cancelled by a conflicting write (another batch on the same summary)
+            conflicts += 1
+            if conflicts >= TRANSACTION_MAX_ATTEMPTS:
+                raise RuntimeError(f'Counter transaction for partition {partition!r} kept conflicting: '
+                                   + ', '.join(reason.get('Code', 'Unknown') for reason in reasons))
+            time.sleep(min(1.0, 0.05 * 2 ** conflicts))
+            continue
+        remaining = []
+        for product_id, changes in chunk:
+            if product_id in stored:
+                unapplied = [change for change in changes if change['sequence_number'] > stored[product_id]]
+                replayed += len(changes) - len(unapplied)
+                changes = unapplied
+            if changes:
+                remaining.append((product_id, changes))
+        chunk = remaining
+
+def watermark_update(partition, product_id, changes):
+    """Transaction item moving a product's watermark past `changes`, if none of them is applied yet"""
+    return {'Update': {
+        'TableName': METADATA_TABLE,
+        'Key': serialize({'meta_key': STREAM_SEQUENCE_PREFIX + scoped_key(product_id, partition)}),
+        'UpdateExpression': 'SET sequence_number = :last, updated_at = :updated_at',
+        'ConditionExpression': 'attribute_not_exists(sequence_number) OR sequence_number < :first',
+        'ExpressionAttributeValues': serialize({
+            ':first': changes[0]['sequence_number'],
+            ':last': changes[-1]['sequence_number'],
+            ':updated_at': datetime.now().isoformat()
+        }),
+        'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+    }}
+
+def movement_update(partition, product_id, day, bucket, expire_at):
+    """Transaction item adding quantity changes to a product's daily inbound/outbound bucket"""
+    return {'Update': {
+        'TableName': MOVEMENTS_TABLE,
+        'Key': serialize({'product_id': scoped_key(product_id, partition), 'day': day}),
+        'UpdateExpression': 'ADD inbound :inbound, outbound :outbound SET expire_at = :expire_at',
+        'ExpressionAttributeValues': serialize({
+            ':inbound': bucket['inbound'],
+            ':outbound': bucket['outbound'],
+            ':expire_at': expire_at
+        })
+    }}
+
+def summary_update(partition, delta):
+    """Transaction item adding a net change to the partition's pre-aggregated inventory summary"""
+    # Attribute names are aliased because category names are free text
+    names = {'#updated_at': 'updated_at'}
+    values = {':updated_at': datetime.now().isoformat()}
+    additions = []
+    for i, (field, amount) in enumerate(delta.items()):
+        names[f'#f{i}'] = field
+        values[f':v{i}'] = amount
+        additions.append(f'#f{i} :v{i}')
+    return {'Update': {
+        'TableName': METADATA_TABLE,
+        'Key': serialize({'meta_key': scoped_key(INVENTORY_SUMMARY_KEY, partition)}),
+        'UpdateExpression': 'SET #updated_at = :updated_at ADD ' + ', '.join(additions),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': serialize(values)
+    }}
+
+def mark_changed_products(partition, changes):
+    """Queue the products whose precomputed results the batch changed"""
+    product_ids = set()
+    for change in changes:
+        old_image, new_image = change['old_image'], change['new_image']
+        changed = any(old_image.get(field) != new_image.get(field) for field in PRECOMPUTE_FIELDS)
+        if change['event_name'] == 'MODIFY' and not changed:
+            continue
+        product = new_image or old_image
+        if 'product_id' in product:
+            product_ids.add(product['product_id'])
+    if not product_ids:
+        return 0
+    
+    key = serialize({'meta_key': scoped_key(PRECOMPUTE_DIRTY_KEY, partition)})
+    try:
+        dynamodb.update_item(
+            TableName=METADATA_TABLE,
+            Key=key,
+            UpdateExpression='ADD product_ids :ids',
+            ConditionExpression='attribute_not_exists(product_ids) OR size(product_ids) < :max',
+            ExpressionAttributeValues=serialize({':ids': product_ids, ':max': DIRTY_MAX_PRODUCTS})
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        dynamodb.update_item(
+            TableName=METADATA_TABLE,
+            Key=key,
+            UpdateExpression='SET overflowed_at = if_not_exists(overflowed_at, :now)',
+            ExpressionAttributeValues=serialize({':now': int(time.time())})
+        )
+    
+    return len(product_ids)
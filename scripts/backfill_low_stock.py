@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Backfill the sparse low_stock attribute on an existing stock-products table.
+
+Products written before the low-stock index existed have no low_stock flag,
+so they never show up in GET /alerts. This script scans the table once and
+sets or removes the flag so the index matches quantity <= min_threshold.
+The flag value is the product's partition (tenant and warehouse), which the
+index is queried by.
+
+Usage:
+    python scripts/backfill_low_stock.py --table prod-stock-products [--dry-run]
+"""
+import argparse
+import os
+import sys
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'shared', 'python'))
+from tenancy import PARTITION_ATTRIBUTE, product_key
+
+LOW_STOCK_ATTRIBUTE = 'low_stock'
+
+def backfill(table, dry_run=False):
+    """Scan every product and fix its low_stock flag where needed"""
+    stats = {'scanned': 0, 'flagged': 0, 'cleared': 0, 'skipped': 0}
+    scan_kwargs = {
+        'ProjectionExpression': f'{PARTITION_ATTRIBUTE}, product_id, quantity, min_threshold, #flag',
+        'ExpressionAttributeNames': {'#flag': LOW_STOCK_ATTRIBUTE}
+    }
+    
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response['Items']:
+            stats['scanned'] += 1
+            if 'quantity' not in item or 'min_threshold' not in item:
+                stats['skipped'] += 1
+                continue
+            
+            partition = item[PARTITION_ATTRIBUTE]
+            should_flag = item['quantity'] <= item['min_threshold']
+            is_flagged = item.get(LOW_STOCK_ATTRIBUTE) == partition
+            if should_flag == is_flagged:
+                continue
+            
+            if should_flag:
+                update_expression = f'SET {LOW_STOCK_ATTRIBUTE} = :flag'
+                expression_values = {':flag': partition}
+                stats['flagged'] += 1
+            else:
+                update_expression = f'REMOVE {LOW_STOCK_ATTRIBUTE}'
+                expression_values = {}
+                stats['cleared'] += 1
+            
+            if dry_run:
+                continue
+            
+            # Only apply the fix if quantity/threshold did not change meanwhile
+            expression_values[':quantity'] = item['quantity']
+            expression_values[':min_threshold'] = item['min_threshold']
+            try:
+                table.update_item(
+                    Key=product_key(partition, item['product_id']),
+                    UpdateExpression=update_expression,
+                    ConditionExpression='quantity = :quantity AND min_threshold = :min_threshold',
+                    ExpressionAttributeValues=expression_values
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                # Concurrent write already maintained the flag
+                stats['skipped'] += 1
+        
+        if 'LastEvaluatedKey' not in response:
+            return stats
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the low_stock flag for the low-stock index')
+    parser.add_argument('--table', default='stock-products', help='DynamoDB table name')
+    parser.add_argument('--region', default=None, help='AWS region')
+    parser.add_argument('--dry-run', action='store_true', help='Report changes without writing')
+    args = parser.parse_args()
+    
+    table = boto3.resource('dynamodb', region_name=args.region).Table(args.table)
+    stats = backfill(table, dry_run=args.dry_run)
+    
+    prefix = '[dry-run] ' if args.dry_run else ''
+    print(f"{prefix}Scanned {stats['scanned']} products: "
+          f"{stats['flagged']} flagged, {stats['cleared']} cleared, {stats['skipped']} skipped")
+
+if __name__ == '__main__':
+    main()
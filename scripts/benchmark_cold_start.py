@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start cost of each Lambda handler locally.
+
+Every run starts a fresh Python process, the way Lambda starts a new
+execution environment. The process imports the handler module with the
+shared layer on sys.path, then invokes it twice with a sample event. Import
+time, first (cold) invocation and second (warm) invocation are reported as
+median / p90 over --runs processes.
+
+With --moto, AWS calls go to moto's in-memory DynamoDB (pip install moto),
+with the tables seeded with a few products, so the numbers are reproducible
+and need no credentials. Seeding imports boto3 first, so under --moto the
+import column leaves out boto3's own import time. Without --moto the
+handlers call real AWS using the usual environment (credentials, region,
+table names).
+
+Usage:
+    python scripts/benchmark_cold_start.py --moto [--runs 10] [--function stock-api]
+    python scripts/benchmark_cold_start.py --function ai-assistant --event event.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions')
+SHARED_LAYER = os.path.join(ROOT, 'shared', 'python')
+
+SAMPLE_EVENTS = {
+    'stock-api': {'httpMethod': 'GET', 'path': '/products', 'queryStringParameters': None, 'body': None},
+    'ai-assistant': {'httpMethod': 'POST', 'path': '/estimate', 'body': '{}'},
+    'stock-stream': {'Records': [{
+        'eventName': 'MODIFY',
+        'dynamodb': {
+            'SequenceNumber': '100000000000000000001',
+            'OldImage': {'product_id': {'S': 'P0001'}, 'quantity': {'N': '10'}, 'min_threshold': {'N': '5'},
+                         'price': {'N': '9.99'}, 'category': {'S': 'Electronics'}},
+            'NewImage': {'product_id': {'S': 'P0001'}, 'quantity': {'N': '4'}, 'min_threshold': {'N': '5'},
+                         'price': {'N': '9.99'}, 'category': {'S': 'Electronics'}}
+        }
+    }]},
+    'stock-alerts': {'Records': [{
+        'eventName': 'MODIFY',
+        'dynamodb': {
+            'SequenceNumber': '100000000000000000001',
+            'OldImage': {'product_id': {'S': 'P0001'}, 'name': {'S': 'Product 1'}, 'quantity': {'N': '10'},
+                         'min_threshold': {'N': '5'}, 'price': {'N': '9.99'}},
+            'NewImage': {'product_id': {'S': 'P0001'}, 'name': {'S': 'Product 1'}, 'quantity': {'N': '4'},
+                         'min_threshold': {'N': '5'}, 'price': {'N': '9.99'}}
+        }
+    }]}
+}
+
+# Runs inside the fresh process; prints one JSON line of timings
+CHILD = r'''
+import json, sys, time
+use_moto, event = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+if use_moto:
+    from moto import mock_aws
+    mock = mock_aws()
+    mock.start()
+    import boto3
+    seed = boto3.client('dynamodb')
+    seed.create_table(
+        TableName='stock-products', BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'partition_key', 'KeyType': 'HASH'},
+                   {'AttributeName': 'product_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'partition_key', 'AttributeType': 'S'},
+                              {'AttributeName': 'product_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'category', 'AttributeType': 'S'},
+                              {'AttributeName': 'low_stock', 'AttributeType': 'S'},
+                              {'AttributeName': 'quantity', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexes=[{'IndexName': 'category-index', 'Projection': {'ProjectionType': 'ALL'},
+                                 'KeySchema': [{'AttributeName': 'partition_key', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'category', 'KeyType': 'RANGE'}]},
+                                {'IndexName': 'low-stock-index', 'Projection': {'ProjectionType': 'ALL'},
+                                 'KeySchema': [{'AttributeName': 'low_stock', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'quantity', 'KeyType': 'RANGE'}]}])
+    seed.create_table(TableName='stock-metadata', BillingMode='PAY_PER_REQUEST',
+                      KeySchema=[{'AttributeName': 'meta_key', 'KeyType': 'HASH'}],
+                      AttributeDefinitions=[{'AttributeName': 'meta_key', 'AttributeType': 'S'}])
+    seed.create_table(TableName='stock-movements', BillingMode='PAY_PER_REQUEST',
+                      KeySchema=[{'AttributeName': 'product_id', 'KeyType': 'HASH'},
+                                 {'AttributeName': 'day', 'KeyType': 'RANGE'}],
+                      AttributeDefinitions=[{'AttributeName': 'product_id', 'AttributeType': 'S'},
+                                            {'AttributeName': 'day', 'AttributeType': 'S'}])
+    for i in range(20):
+        item = {'partition_key': {'S': 'default#main'}, 'product_id': {'S': f'P{i:04d}'},
+                'name': {'S': f'Product {i}'}, 'quantity': {'N': str(i)}, 'min_threshold': {'N': '5'},
+                'price': {'N': '9.99'}, 'category': {'S': 'Electronics'}}
+        if i <= 5:
+            item['low_stock'] = {'S': 'default#main'}
+        seed.put_item(TableName='stock-products', Item=item)
+
+timings = {}
+start = time.perf_counter()
+import app
+timings['import_ms'] = (time.perf_counter() - start) * 1000
+for label in ('first_invoke_ms', 'second_invoke_ms'):
+    start = time.perf_counter()
+    app.lambda_handler(json.loads(json.dumps(event)), None)
+    timings[label] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+'''
+
+def run_once(function, event, use_moto):
+    """Time one fresh process; returns the child's timing dict"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [SHARED_LAYER, env.get('PYTHONPATH')]))
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    if use_moto:
+        env.update({'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'})
+    # The handler directory goes first on sys.path, like the Lambda task root
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, json.dumps(use_moto), json.dumps(event)],
+        cwd=os.path.join(ROOT, function), env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(samples):
+    ordered = sorted(samples)
+    p90 = ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+    return f'{statistics.median(ordered):8.1f} {p90:8.1f}'
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure handler import time and first-invocation latency')
+    parser.add_argument('--function', choices=sorted(SAMPLE_EVENTS), action='append',
+                        help='Handler to measure (repeatable, default: all)')
+    parser.add_argument('--event', help='JSON event file to invoke with instead of the sample event')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes per handler')
+    parser.add_argument('--moto', action='store_true', help='Serve AWS calls from moto instead of real AWS')
+    args = parser.parse_args()
+    
+    functions = args.function or sorted(SAMPLE_EVENTS)
+    custom_event = None
+    if args.event:
+        with open(args.event) as f:
+            custom_event = json.load(f)
+    
+    print(f'{args.runs} fresh processes per handler, times in ms (median / p90)')
+    print(f'{"function":14} {"import":>17} {"first invoke":>17} {"second invoke":>17}')
+    for function in functions:
+        event = custom_event or SAMPLE_EVENTS[function]
+        runs = [run_once(function, event, args.moto) for _ in range(args.runs)]
+        print(f'{function:14} ' + ' '.join(
+            summarize([run[key] for run in runs])
+            for key in ('import_ms', 'first_invoke_ms', 'second_invoke_ms')
+        ))
+
+if __name__ == '__main__':
+    main()
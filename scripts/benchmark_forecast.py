@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized demand forecast behind POST /estimate.
+
+Generates synthetic daily movement history for N SKUs and times the two
+steps the ai-assistant runs per request: building the history matrix from
+movement rows and forecasting every SKU at once. Exits non-zero if the
+total exceeds the time budget (default: half the 60s function timeout).
+
+Usage:
+    python scripts/benchmark_forecast.py --skus 100000 [--budget 30]
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'ai-assistant'))
+from forecasting import forecast_demand, build_history_matrix, HISTORY_DAYS
+
+def synthetic_rows(n_skus, days, density, seed):
+    """Random daily outbound rows, roughly `density` of SKU-days having movements"""
+    rng = np.random.default_rng(seed)
+    n_rows = int(n_skus * days * density)
+    sku_idx = rng.integers(0, n_skus, n_rows)
+    day_idx = rng.integers(0, days, n_rows)
+    units = rng.poisson(rng.uniform(1, 20, n_rows))
+    product_ids = [f'SKU{i:07d}' for i in range(n_skus)]
+    rows = [(product_ids[s], int(d), int(u)) for s, d, u in zip(sku_idx, day_idx, units)]
+    quantities = rng.integers(0, 500, n_skus)
+    return product_ids, rows, quantities
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the demand forecast engine')
+    parser.add_argument('--skus', type=int, default=100000, help='Number of SKUs')
+    parser.add_argument('--density', type=float, default=0.3, help='Fraction of SKU-days with movements')
+    parser.add_argument('--budget', type=float, default=30.0, help='Maximum allowed seconds')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    product_ids, rows, quantities = synthetic_rows(args.skus, HISTORY_DAYS, args.density, args.seed)
+    print(f'{args.skus} SKUs, {len(rows)} movement rows over {HISTORY_DAYS} days')
+    
+    start = time.perf_counter()
+    history = build_history_matrix(product_ids, rows, HISTORY_DAYS)
+    built = time.perf_counter()
+    forecast = forecast_demand(history, quantities)
+    done = time.perf_counter()
+    
+    at_risk = int(np.sum(forecast['days_to_stockout'] <= 7))
+    print(f'build_history_matrix: {built - start:.3f}s')
+    print(f'forecast_demand:      {done - built:.3f}s')
+    print(f'total:                {done - start:.3f}s (budget {args.budget:.1f}s)')
+    print(f'{at_risk} SKUs forecast to stock out within 7 days')
+    
+    if done - start > args.budget:
+        print('FAIL: forecast exceeded the time budget')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
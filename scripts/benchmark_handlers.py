@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Benchmark the stock-api and ai-assistant handlers against a synthetic catalog.
+
+Both lambda_handler entry points are loaded in-process and driven with
+API Gateway proxy events, one scenario per route. AWS is replaced
+in-process, so no credentials or network are needed:
+
+- DynamoDB is the fake in fake_dynamodb.py, which pages scans and queries
+  at 1MB, runs parallel-scan segments and GSI queries, and adds a modeled
+  service latency to every call (--ddb-latency-ms plus --ddb-ms-per-mb of
+  response). The time the fake itself spends is left out of the reported
+  latencies, so they cover handler code, botocore and modeled latency.
+- Bedrock calls are answered by a stub with a fixed latency
+  (--bedrock-latency-ms, plus up to --bedrock-jitter-ms) before they reach
+  the network. --bedrock-error-rate and --bedrock-throttle-rate make that
+  share of calls fail with a 503 or a ThrottlingException, to exercise
+  the AI assistant's retries, circuit breaker and keyword fallback.
+
+For each route it reports latency percentiles, DynamoDB calls, consumed
+read/write capacity units (from item sizes, with DynamoDB's rounding) and
+the response payload size per request.
+
+--save-baseline writes the results as JSON; --baseline compares a run with
+a stored one (same catalog size and latency model only) and exits non-zero
+if calls, capacity or payload grow by more than --tolerance or a route's
+statuses change. Those are deterministic for a given seed. Latencies depend
+on the machine: they are compared after scaling the baseline by how much
+slower this machine runs a fixed in-run reference workload, and a latency
+over --latency-tolerance is only reported, unless --strict-latency is set
+(scripts/benchmark-baseline.json holds the default settings).
+
+--precompute runs the ai-assistant's scheduled precompute job after seeding,
+so /estimate and /recommendations serve the materialized results instead of
+computing them per request.
+
+Usage:
+    python scripts/benchmark_handlers.py [--products 10000] [--iterations 20]
+    python scripts/benchmark_handlers.py --save-baseline scripts/benchmark-baseline.json
+    python scripts/benchmark_handlers.py --baseline scripts/benchmark-baseline.json
+    python scripts/benchmark_handlers.py --precompute --route estimate --route recommendations
+"""
+import argparse
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions')
+SHARED_LAYER = os.path.join(ROOT, 'shared', 'python')
+
+# Requests are still signed before the fake answers them
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.update({'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing'})
+
+sys.path.insert(0, SHARED_LAYER)
+sys.path.insert(0, os.path.join(ROOT, 'stock-stream'))
+from aggregates import INVENTORY_SUMMARY_KEY, summarize_products
+from tenancy import DEFAULT_PARTITION, PARTITION_ATTRIBUTE
+from boto3.dynamodb.types import TypeSerializer
+from botocore.response import StreamingBody
+from fake_dynamodb import FakeDynamoDB
+
+serializer = TypeSerializer()
+
+PRODUCTS_TABLE = 'stock-products'
+METADATA_TABLE = 'stock-metadata'
+MOVEMENTS_TABLE = 'stock-movements'
+IDEMPOTENCY_TABLE = 'stock-idempotency'
+
+ADJECTIVES = ['Wireless', 'Ergonomic', 'Portable', 'Compact', 'Premium', 'Smart', 'Rugged',
+              'Vintage', 'Organic', 'Digital', 'Classic', 'Modular', 'Heavy-Duty', 'Ultra', 'Solar']
+NOUNS = ['Laptop', 'Keyboard', 'Mouse', 'Monitor', 'Headphones', 'Charger', 'Backpack',
+         'Notebook', 'Lamp', 'Speaker', 'Camera', 'Router', 'Printer', 'Tablet', 'Bottle']
+CATEGORIES = ['Electronics', 'Books', 'Clothing', 'Home', 'Sports', 'Office']
+
+# Products that get daily movement history, for the forecasting routes
+HISTORY_PRODUCTS = 100
+HISTORY_DAYS = 30
+
+# Products read over and over by the hot GET /products/{id} route
+HOT_PRODUCTS = 5
+
+# Metrics compared with the baseline, and whether they are latencies
+METRICS = {
+    'p50_ms': True, 'p99_ms': True,
+    'ddb_calls': False, 'rcu': False, 'wcu': False, 'payload_bytes': False
+}
+
+# Runs of the reference workload timed to gauge the machine's speed
+REFERENCE_RUNS = 7
+
+def synthetic_catalog(count, seed):
+    """Products shaped like the ones POST /products stores"""
+    rng = random.Random(seed)
+    now = datetime(2024, 1, 1).isoformat()
+    products = []
+    for i in range(count):
+        noun = rng.choice(NOUNS)
+        quantity = rng.choice([0, rng.randint(1, 10), rng.randint(10, 500), rng.randint(10, 500)])
+        min_threshold = rng.randint(2, 20)
+        product = {
+            PARTITION_ATTRIBUTE: DEFAULT_PARTITION,
+            'product_id': f'P{i:07d}',
+            'name': f'{rng.choice(ADJECTIVES)} {noun} {rng.choice("ABCDEFGHKMXZ")}{rng.randint(100, 9999)}',
+            'quantity': quantity,
+            'min_threshold': min_threshold,
+            'price': Decimal(str(round(rng.uniform(2, 1500), 2))),
+            'category': rng.choice(CATEGORIES),
+            'description': f'{rng.choice(ADJECTIVES)} {noun.lower()} for {rng.choice(CATEGORIES).lower()} use, '
+                           f'{rng.randint(1, 5)} year warranty',
+            'created_at': now,
+            'updated_at': now,
+            'version': 1
+        }
+        if quantity <= min_threshold:
+            product['low_stock'] = DEFAULT_PARTITION
+        products.append(product)
+    return products
+
+def movement_history(products, seed):
+    """Daily inbound/outbound buckets for the first HISTORY_PRODUCTS products"""
+    rng = random.Random(seed)
+    today = date.today()
+    items = []
+    for product in products[:HISTORY_PRODUCTS]:
+        rate = rng.uniform(0.5, 8)
+        for offset in range(HISTORY_DAYS):
+            items.append({
+                'product_id': product['product_id'],
+                'day': (today - timedelta(days=offset)).isoformat(),
+                'inbound': rng.choice([0, 0, 0, rng.randint(10, 60)]),
+                'outbound': max(0, int(rng.gauss(rate, rate / 2)))
+            })
+    return items
+
+def create_tables(client):
+    """The tables from infrastructure/template.yaml, with on-demand billing"""
+    client.create_table(
+        TableName=PRODUCTS_TABLE, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'partition_key', 'KeyType': 'HASH'},
+                   {'AttributeName': 'product_id', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'partition_key', 'AttributeType': 'S'},
+                              {'AttributeName': 'product_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'category', 'AttributeType': 'S'},
+                              {'AttributeName': 'low_stock', 'AttributeType': 'S'},
+                              {'AttributeName': 'quantity', 'AttributeType': 'N'}],
+        GlobalSecondaryIndexes=[{'IndexName': 'category-index', 'Projection': {'ProjectionType': 'ALL'},
+                                 'KeySchema': [{'AttributeName': 'partition_key', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'category', 'KeyType': 'RANGE'}]},
+                                {'IndexName': 'low-stock-index', 'Projection': {'ProjectionType': 'ALL'},
+                                 'KeySchema': [{'AttributeName': 'low_stock', 'KeyType': 'HASH'},
+                                               {'AttributeName': 'quantity', 'KeyType': 'RANGE'}]}])
+    client.create_table(
+        TableName=METADATA_TABLE, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'meta_key', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'meta_key', 'AttributeType': 'S'}])
+    client.create_table(
+        TableName=MOVEMENTS_TABLE, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'product_id', 'KeyType': 'HASH'},
+                   {'AttributeName': 'day', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'product_id', 'AttributeType': 'S'},
+                              {'AttributeName': 'day', 'AttributeType': 'S'}])
+    client.create_table(
+        TableName=IDEMPOTENCY_TABLE, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'idempotency_key', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'idempotency_key', 'AttributeType': 'S'}])
+
+def seed_tables(fake, products, movements):
+    """Load the catalog, its movement history and the inventory summary"""
+    # What the stock-stream function would have accumulated
+    summary = {'meta_key': INVENTORY_SUMMARY_KEY, 'updated_at': datetime(2024, 1, 1).isoformat()}
+    summary.update({k: v for k, v in summarize_products(products).items() if v != 0})
+    
+    for table_name, items in ((PRODUCTS_TABLE, products), (MOVEMENTS_TABLE, movements), (METADATA_TABLE, [summary])):
+        fake.load(table_name, ({k: serializer.serialize(v) for k, v in item.items()} for item in items))
+
+class BedrockStub:
+    """
+    Answers InvokeModel calls with a short canned text after a delay, or fails a share of them.
+    
+    Registered on the shared layer's boto3 session before any client exists,
+    so the handlers' Bedrock client inherits it.
+    """
+    
+    def __init__(self, session, latency_ms, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        session.events.register('before-call.bedrock-runtime.InvokeModel', self.invoke_model)
+    
+    def answer(self, params):
+        """(text, None), or (None, error response) for an injected failure"""
+        with self.lock:
+            self.calls += 1
+            draw = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        time.sleep(delay)
+        if draw < self.throttle_rate:
+            return None, self.failure(400, 'ThrottlingException', 'Too many requests, please wait before trying again.')
+        if draw < self.throttle_rate + self.error_rate:
+            return None, self.failure(503, 'ServiceUnavailableException', 'Service unavailable.')
+        prompt = json.loads(params['body'])['messages'][0]['content']
+        return f'Stubbed answer for a {len(prompt)} character prompt.', None
+    
+    def failure(self, status, code, message):
+        # botocore raises a ClientError for the parsed error of a non-2xx response
+        with self.lock:
+            self.failures += 1
+        return (SimpleNamespace(status_code=status, headers={}, content=b''),
+                {'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}})
+    
+    def invoke_model(self, params, **kwargs):
+        text, failure = self.answer(params)
+        if failure:
+            return failure
+        body = json.dumps({'content': [{'type': 'text', 'text': text}]}).encode('utf-8')
+        return (SimpleNamespace(status_code=200, headers={}, content=b''),
+                {'body': StreamingBody(io.BytesIO(body), len(body)), 'contentType': 'application/json'})
+
+def load_handler(function):
+    """Import a function's app.py under its own module name, its directory first on sys.path"""
+    directory = os.path.join(ROOT, function)
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(f'{function.replace("-", "_")}_app',
+                                                      os.path.join(directory, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        sys.path.remove(directory)
+
+def api_event(method, path, body=None, query=None, headers=None):
+    """API Gateway REST proxy event, from a browser that accepts gzip"""
+    return {
+        'httpMethod': method,
+        'path': path,
+        'headers': dict({'Accept-Encoding': 'gzip, deflate, br'}, **(headers or {})),
+        'queryStringParameters': query,
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False
+    }
+
+def scenarios(products, seed):
+    """(route name, function, event factory taking the iteration number)"""
+    rng = random.Random(seed)
+    ids = [p['product_id'] for p in products]
+    sample_ids = [rng.choice(ids) for _ in range(1000)]
+    history_ids = ids[:HISTORY_PRODUCTS]
+    words = [w.lower() for w in ADJECTIVES + NOUNS]
+    return [
+        ('GET /products', 'stock-api', lambda i: api_event('GET', '/products')),
+        ('GET /products?low_stock', 'stock-api', lambda i: api_event('GET', '/products', query={'low_stock': 'true'})),
+        ('GET /products?category', 'stock-api',
+         lambda i: api_event('GET', '/products', query={'category': CATEGORIES[i % len(CATEGORIES)]})),
+        ('GET /products/{id}', 'stock-api', lambda i: api_event('GET', f'/products/{sample_ids[i % 1000]}')),
+        # A few fast-moving SKUs, served from the product cache after the first read
+        ('GET /products/{id} (hot)', 'stock-api',
+         lambda i: api_event('GET', f'/products/{sample_ids[i % HOT_PRODUCTS]}')),
+        ('GET /products/search', 'stock-api',
+         lambda i: api_event('GET', '/products/search', query={'q': f'{words[i % len(words)]} {words[-1 - i % 7][:3]}'})),
+        ('GET /products/export', 'stock-api', lambda i: api_event('GET', '/products/export')),
+        ('GET /alerts', 'stock-api', lambda i: api_event('GET', '/alerts')),
+        ('GET /stats', 'stock-api', lambda i: api_event('GET', '/stats')),
+        ('POST /products/{id}/movements', 'stock-api',
+         lambda i: api_event('POST', f'/products/{sample_ids[i % 1000]}/movements',
+                             body={'delta': 5 if i % 2 else -1, 'allow_negative': True})),
+        ('POST /products', 'stock-api',
+         lambda i: api_event('POST', '/products', headers={'Idempotency-Key': f'benchmark-create-{i}'},
+                             body={'name': f'Benchmark Item {i}', 'category': CATEGORIES[0], 'quantity': 10})),
+        ('POST /products (replayed)', 'stock-api',
+         lambda i: api_event('POST', '/products', headers={'Idempotency-Key': 'benchmark-replayed'},
+                             body={'name': 'Benchmark Item', 'category': CATEGORIES[0], 'quantity': 10})),
+        ('POST /estimate', 'ai-assistant',
+         lambda i: api_event('POST', '/estimate', body={'product_id': history_ids[i % len(history_ids)]})),
+        ('POST /estimate x100', 'ai-assistant',
+         lambda i: api_event('POST', '/estimate', body={'product_ids': history_ids})),
+        ('POST /recommendations', 'ai-assistant', lambda i: api_event('POST', '/recommendations', body={})),
+        ('POST /chat', 'ai-assistant',
+         lambda i: api_event('POST', '/chat', body={'message': f'How many {words[i % len(words)]} items do we have? ({i})'}))
+    ]
+
+def payload_size(response):
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        return len(base64.b64decode(body))
+    return len(body.encode('utf-8'))
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_scenario(handler, make_event, iterations, fake, bedrock):
+    """Time one warm-up call plus `iterations` measured calls; returns per-request metrics"""
+    
+    def invoke(event):
+        fake.reset_usage()
+        bedrock_calls = bedrock.calls
+        start = time.perf_counter()
+        # Handler logs (CloudWatch lines) would interleave with the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = handler.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start - fake.usage['fake_seconds']
+        return response, elapsed * 1000, dict(fake.usage, bedrock_calls=bedrock.calls - bedrock_calls)
+    
+    _, first_ms, _ = invoke(make_event(0))
+    
+    latencies, sizes, statuses = [], [], set()
+    totals = {'calls': 0, 'rcu': 0.0, 'wcu': 0.0, 'bedrock_calls': 0}
+    for i in range(1, iterations + 1):
+        response, elapsed_ms, usage = invoke(make_event(i))
+        latencies.append(elapsed_ms)
+        sizes.append(payload_size(response))
+        statuses.add(response['statusCode'])
+        for name in totals:
+            totals[name] += usage[name]
+    
+    return {
+        'first_ms': round(first_ms, 2),
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'ddb_calls': round(totals['calls'] / iterations, 2),
+        'rcu': round(totals['rcu'] / iterations, 2),
+        'wcu': round(totals['wcu'] / iterations, 2),
+        'bedrock_calls': round(totals['bedrock_calls'] / iterations, 2),
+        'payload_bytes': int(sum(sizes) / len(sizes)),
+        'statuses': sorted(statuses)
+    }
+
+def reference_ms(products):
+    """Median time of a fixed CPU-bound workload (JSON round trips of catalog items), to compare machines"""
+    sample = products[:2000]
+    timings = []
+    for _ in range(REFERENCE_RUNS):
+        start = time.perf_counter()
+        for item in json.loads(json.dumps(sample, default=str)):
+            sorted(item.items())
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(percentile(timings, 0.5), 2)
+
+def compare(results, baseline, tolerance, latency_tolerance, latency_scale=1.0):
+    """
+    Messages for every metric that grew past its tolerance, as (regressions, latency regressions).
+    
+    Baseline latencies are multiplied by latency_scale first, the reference
+    workload's slowdown on this machine.
+    """
+    regressions, latency_regressions = [], []
+    for route, metrics in results.items():
+        previous = baseline.get(route)
+        if previous is None:
+            continue
+        if metrics['statuses'] != previous['statuses']:
+            regressions.append(f'{route}: statuses {metrics["statuses"]} != baseline {previous["statuses"]}')
+        for metric, is_latency in METRICS.items():
+            if is_latency:
+                expected = round(previous[metric] * latency_scale, 2)
+                # Small absolute slack so near-zero latencies do not flap
+                if metrics[metric] > expected * (1 + latency_tolerance) + 1.0:
+                    latency_regressions.append(f'{route}: {metric} {metrics[metric]} > {expected} '
+                                               f'(baseline {previous[metric]} x {latency_scale:.2f})')
+            elif metrics[metric] > previous[metric] * (1 + tolerance) + 0.01:
+                regressions.append(f'{route}: {metric} {metrics[metric]} > baseline {previous[metric]}')
+    return regressions, latency_regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API handlers against an in-memory AWS stand-in')
+    parser.add_argument('--products', type=int, default=10000, help='Synthetic catalog size')
+    parser.add_argument('--iterations', type=int, default=20, help='Measured requests per route')
+    parser.add_argument('--route', action='append', help='Only run routes containing this text (repeatable)')
+    parser.add_argument('--ddb-latency-ms', type=float, default=4.0, help='Modeled latency per DynamoDB call')
+    parser.add_argument('--ddb-ms-per-mb', type=float, default=40.0, help='Modeled transfer time per MB returned')
+    parser.add_argument('--bedrock-latency-ms', type=float, default=300.0, help='Stubbed Bedrock response time')
+    parser.add_argument('--bedrock-jitter-ms', type=float, default=0.0,
+                        help='Random extra Bedrock response time, up to this much')
+    parser.add_argument('--bedrock-error-rate', type=float, default=0.0,
+                        help='Share of Bedrock calls failing with ServiceUnavailableException')
+    parser.add_argument('--bedrock-throttle-rate', type=float, default=0.0,
+                        help='Share of Bedrock calls failing with ThrottlingException')
+    parser.add_argument('--baseline', help='Baseline JSON to compare with; exits 1 on regressions')
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Allowed relative growth of calls, capacity and payload size')
+    parser.add_argument('--latency-tolerance', type=float, default=0.50,
+                        help='Allowed relative growth of p50/p99 latency, after scaling to this machine')
+    parser.add_argument('--strict-latency', action='store_true',
+                        help='Fail on latency regressions too, instead of only reporting them')
+    parser.add_argument('--precompute', action='store_true',
+                        help='Run the scheduled precompute job first, so ai-assistant routes serve its results')
+    parser.add_argument('--shared-product-cache', action='store_true',
+                        help='Give both functions one in-memory shared product cache tier, like a Redis endpoint')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    import aws_clients
+    session = aws_clients.get_session()
+    fake = FakeDynamoDB(args.ddb_latency_ms, args.ddb_ms_per_mb)
+    fake.install(session)
+    bedrock = BedrockStub(session, args.bedrock_latency_ms, args.bedrock_jitter_ms, args.bedrock_error_rate,
+                          args.bedrock_throttle_rate, args.seed)
+    
+    start = time.perf_counter()
+    create_tables(session.client('dynamodb'))
+    products = synthetic_catalog(args.products, args.seed)
+    movements = movement_history(products, args.seed)
+    seed_tables(fake, products, movements)
+    print(f'Seeded {len(products)} products and {len(movements)} movement buckets '
+          f'in {time.perf_counter() - start:.1f}s')
+    
+    handlers = {function: load_handler(function) for function in ('stock-api', 'ai-assistant')}
+    if args.shared_product_cache:
+        from product_cache import LocalBackend
+        shared = LocalBackend()
+        for handler in handlers.values():
+            handler.product_cache.backend = shared
+    if args.precompute:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = handlers['ai-assistant'].precompute_handler({'source': 'scheduled-precompute'}, None)
+        products_done = sum(partition['products'] for partition in summary['partitions'].values())
+        print(f'Precomputed results for {products_done} products in {time.perf_counter() - start:.1f}s')
+    
+    reference = reference_ms(products)
+    print(f'Reference workload: {reference:.1f}ms')
+    
+    results = {}
+    print(f'{args.iterations} requests per route, per-request averages; times in ms')
+    print(f'{"route":30} {"first":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"ddb":>6} {"rcu":>8} {"wcu":>6} '
+          f'{"bytes":>9} status')
+    for route, function, make_event in scenarios(products, args.seed):
+        if args.route and not any(text in route for text in args.route):
+            continue
+        metrics = run_scenario(handlers[function], make_event, args.iterations, fake, bedrock)
+        results[route] = metrics
+        print(f'{route:30} {metrics["first_ms"]:8.1f} {metrics["p50_ms"]:8.1f} {metrics["p95_ms"]:8.1f} '
+              f'{metrics["p99_ms"]:8.1f} {metrics["ddb_calls"]:6.1f} {metrics["rcu"]:8.1f} {metrics["wcu"]:6.1f} '
+              f'{metrics["payload_bytes"]:9d} {",".join(map(str, metrics["statuses"]))}')
+    
+    if bedrock.failures:
+        print(f'Bedrock stub failed {bedrock.failures} of {bedrock.calls} calls')
+    for function, handler in handlers.items():
+        stats = handler.product_cache.stats()
+        if stats['hit_ratio'] is not None:
+            print(f'{function} product cache: {stats["local_hits"]} local hits, {stats["remote_hits"]} shared hits, '
+                  f'{stats["misses"]} misses (hit ratio {stats["hit_ratio"]:.0%})')
+    
+    failed = [route for route, metrics in results.items() if any(status >= 500 for status in metrics['statuses'])]
+    if failed:
+        print(f'FAIL: server errors on {", ".join(failed)}')
+    
+    settings = {'products': args.products, 'ddb_latency_ms': args.ddb_latency_ms,
+                'ddb_ms_per_mb': args.ddb_ms_per_mb, 'bedrock_latency_ms': args.bedrock_latency_ms}
+    if args.precompute:
+        settings['precompute'] = True
+    for name in ('bedrock_jitter_ms', 'bedrock_error_rate', 'bedrock_throttle_rate', 'shared_product_cache'):
+        if getattr(args, name):
+            settings[name] = getattr(args, name)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'settings': settings, 'reference_ms': reference, 'routes': results}, f, indent=2,
+                      sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.save_baseline}')
+    
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print(f'Baseline was recorded with {baseline["settings"]}; not comparing')
+        else:
+            # Only a slower machine scales the baseline: the modeled service latencies do not shrink
+            latency_scale = max(1.0, reference / baseline['reference_ms']) if baseline.get('reference_ms') else 1.0
+            regressions, latency_regressions = compare(results, baseline['routes'], args.tolerance,
+                                                       args.latency_tolerance, latency_scale)
+            if args.strict_latency:
+                regressions += latency_regressions
+            else:
+                for regression in latency_regressions:
+                    print(f'LATENCY (advisory) {regression}')
+            for regression in regressions:
+                print(f'REGRESSION {regression}')
+            if not regressions:
+                print('No regressions against the baseline')
+    
+    if failed or regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark the product embeddings behind the chat's retrieval stage.
+
+Embeds N synthetic products, then times an unchanged re-sync, a re-sync
+with --changed of the products edited, questions (exact, partial and
+misspelled product words) and reopening a saved index with its vectors
+memory-mapped. Also reports the size of the chat prompt built from the
+retrieved products, which stays within its token budget at any catalog size.
+Exits non-zero if the p99 question latency exceeds the budget.
+
+Usage:
+    python scripts/benchmark_retrieval.py --products 100000 [--queries 200] [--budget-ms 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'shared', 'python'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'ai-assistant'))
+from product_embeddings import ProductVectorIndex, make_embedder
+from prompt_builder import build_chat_prompt, estimate_tokens
+from benchmark_search import make_queries, percentile, synthetic_products, time_queries
+
+def edit_products(products, fraction, seed):
+    """A copy of the catalog with a fraction of the products renamed"""
+    rng = random.Random(seed)
+    edited = list(products)
+    for position in rng.sample(range(len(products)), int(len(products) * fraction)):
+        product = edited[position]
+        edited[position] = dict(product, name=f'{product["name"]} V2', updated_at='2024-02-01T00:00:00')
+    return edited
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the product embeddings used for chat retrieval')
+    parser.add_argument('--products', type=int, default=100000, help='Number of products')
+    parser.add_argument('--queries', type=int, default=200, help='Questions per kind')
+    parser.add_argument('--dimensions', type=int, default=128, help='Embedding dimensions')
+    parser.add_argument('--embedder', default='hashing', help='Registered embedder name')
+    parser.add_argument('--changed', type=float, default=0.01, help='Share of products edited between syncs')
+    parser.add_argument('--min-score', type=float, default=0.35, help='Lowest similarity kept')
+    parser.add_argument('--token-budget', type=int, default=3000, help='Chat prompt token budget')
+    parser.add_argument('--budget-ms', type=float, default=50.0, help='Maximum allowed p99 question latency')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    products = synthetic_products(args.products, args.seed)
+    for product in products:
+        product['min_threshold'] = 10
+    embedder = make_embedder(args.embedder, args.dimensions)
+    
+    start = time.perf_counter()
+    index = ProductVectorIndex(embedder)
+    index.sync(products)
+    build_seconds = time.perf_counter() - start
+    
+    # A warm re-sync with nothing changed is what most invocations pay
+    start = time.perf_counter()
+    index.sync(products)
+    resync_seconds = time.perf_counter() - start
+    
+    edited = edit_products(products, args.changed, args.seed)
+    start = time.perf_counter()
+    changed = index.sync(edited)
+    incremental_seconds = time.perf_counter() - start
+    
+    print(f'{args.products} products, {args.dimensions} dimensions, {index.nbytes / 2 ** 20:.1f}MB of vectors')
+    print(f'build:   {build_seconds:.3f}s')
+    print(f're-sync: {resync_seconds:.3f}s (no changes)')
+    print(f're-sync: {incremental_seconds:.3f}s ({changed} changed)')
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'products')
+        index.save(path)
+        start = time.perf_counter()
+        reopened = ProductVectorIndex.load(path, make_embedder(args.embedder, args.dimensions))
+        reopened.sync(edited)
+        print(f'reopen:  {time.perf_counter() - start:.3f}s (memory-mapped, then synced)')
+    
+    print(f'{"kind":8} {"p50 ms":>8} {"p99 ms":>8} {"found":>8}')
+    worst_p99 = 0.0
+    for kind in ('exact', 'prefix', 'fuzzy'):
+        queries = make_queries(kind, args.queries, args.seed)
+        latencies, found = time_queries(lambda q: index.search(q, limit=40, min_score=args.min_score), queries)
+        worst_p99 = max(worst_p99, percentile(latencies, 0.99))
+        print(f'{kind:8} {percentile(latencies, 0.5):8.3f} {percentile(latencies, 0.99):8.3f} '
+              f'{found:>4}/{len(queries)}')
+    
+    question = make_queries('exact', 1, args.seed)[0]
+    relevant = [product for product, _ in index.search(question, limit=40, min_score=args.min_score)]
+    prompt = build_chat_prompt(question, edited, args.token_budget, relevant)
+    print(f'prompt:  {estimate_tokens(prompt)} tokens for "{question}" (budget {args.token_budget})')
+    
+    if worst_p99 > args.budget_ms:
+        print(f'FAIL: p99 question latency {worst_p99:.3f}ms exceeds {args.budget_ms:.1f}ms')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark the product search index behind GET /products/search and the chat.
+
+Builds the inverted index over N synthetic products, then times exact,
+prefix (search-as-you-type) and misspelled queries against the previous
+approach: a substring test of every query word against every product name.
+Exits non-zero if the p99 indexed query latency exceeds the budget.
+
+Usage:
+    python scripts/benchmark_search.py --products 100000 [--queries 200] [--budget-ms 100]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'shared', 'python'))
+from product_search import ProductSearchIndex
+
+ADJECTIVES = ['wireless', 'ergonomic', 'portable', 'compact', 'premium', 'smart', 'rugged',
+              'vintage', 'organic', 'digital', 'classic', 'modular', 'heavy', 'ultra', 'solar']
+NOUNS = ['laptop', 'keyboard', 'mouse', 'monitor', 'headphones', 'charger', 'backpack',
+         'notebook', 'lamp', 'speaker', 'camera', 'router', 'printer', 'tablet', 'bottle']
+CATEGORIES = ['Electronics', 'Books', 'Clothing', 'Home', 'Sports', 'Office']
+
+def synthetic_products(count, seed):
+    """Products with generated names, a model code and a short description"""
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.choice(ADJECTIVES)[:3]}{rng.randint(100, 9999)}'
+        products.append({
+            'product_id': f'P{i:07d}',
+            'name': name.title(),
+            'category': rng.choice(CATEGORIES),
+            'description': f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for {rng.choice(CATEGORIES).lower()}',
+            'quantity': rng.randint(0, 500),
+            'updated_at': '2024-01-01T00:00:00'
+        })
+    return products
+
+def misspell(word, rng):
+    """Drop, swap or replace one character"""
+    i = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(['drop', 'swap', 'replace'])
+    if edit == 'drop':
+        return word[:i] + word[i + 1:]
+    if edit == 'swap':
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+    return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+
+def make_queries(kind, count, seed):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        if kind == 'exact':
+            queries.append(f'{adjective} {noun}')
+        elif kind == 'prefix':
+            queries.append(f'{adjective} {noun[:rng.randint(2, 4)]}')
+        else:
+            queries.append(f'{misspell(adjective, rng)} {misspell(noun, rng)}')
+    return queries
+
+def naive_search(products, query):
+    """The old chat fallback: any query word contained in the product name"""
+    words = query.lower().split()
+    return [p for p in products if any(word in p['name'].lower() for word in words)]
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def time_queries(search, queries):
+    """Per-query latencies in milliseconds and how many queries found something"""
+    latencies = []
+    found = 0
+    for query in queries:
+        start = time.perf_counter()
+        results = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += 1 if results else 0
+    return latencies, found
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the product search index')
+    parser.add_argument('--products', type=int, default=100000, help='Number of products')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per kind')
+    parser.add_argument('--naive-queries', type=int, default=20, help='Queries per kind for the naive scan')
+    parser.add_argument('--budget-ms', type=float, default=100.0, help='Maximum allowed p99 query latency')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    products = synthetic_products(args.products, args.seed)
+    
+    start = time.perf_counter()
+    index = ProductSearchIndex()
+    index.sync(products)
+    build_seconds = time.perf_counter() - start
+    
+    # A warm re-sync with nothing changed is what most invocations pay
+    start = time.perf_counter()
+    index.sync(products)
+    resync_seconds = time.perf_counter() - start
+    
+    print(f'{args.products} products, {len(index.postings)} distinct tokens')
+    print(f'build:   {build_seconds:.3f}s')
+    print(f're-sync: {resync_seconds:.3f}s (no changes)')
+    print(f'{"kind":8} {"engine":8} {"p50 ms":>8} {"p99 ms":>8} {"found":>8}')
+    
+    worst_p99 = 0.0
+    for kind in ('exact', 'prefix', 'fuzzy'):
+        queries = make_queries(kind, args.queries, args.seed)
+        latencies, found = time_queries(lambda q: index.search(q, limit=10), queries)
+        worst_p99 = max(worst_p99, percentile(latencies, 0.99))
+        print(f'{kind:8} {"index":8} {percentile(latencies, 0.5):8.3f} {percentile(latencies, 0.99):8.3f} '
+              f'{found:>4}/{len(queries)}')
+        naive_queries = queries[:args.naive_queries]
+        latencies, found = time_queries(lambda q: naive_search(products, q), naive_queries)
+        print(f'{kind:8} {"naive":8} {percentile(latencies, 0.5):8.3f} {percentile(latencies, 0.99):8.3f} '
+              f'{found:>4}/{len(naive_queries)}')
+    
+    if worst_p99 > args.budget_ms:
+        print(f'FAIL: p99 query latency {worst_p99:.3f}ms exceeds {args.budget_ms:.1f}ms')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
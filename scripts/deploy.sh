@@ -173,6 +173,22 @@ else
     echo "⚠️  Stock API test returned HTTP ${STOCK_TEST}"
 fi
 
+echo "Testing CORS preflights..."
+# Both API Gateways treat every media type as binary (for compressed
+# responses); a preflight must still answer 200 with the CORS headers
+for PREFLIGHT_URL in "${STOCK_API_URL}/products" "${STOCK_API_URL}/products/PREFLIGHT" "${AI_API_URL}/chat"; do
+    PREFLIGHT_HEADERS=$(curl -s -D - -o /dev/null -X OPTIONS "${PREFLIGHT_URL}" \
+        -H "Origin: https://example.com" \
+        -H "Access-Control-Request-Method: POST" \
+        -H "Access-Control-Request-Headers: content-type,x-tenant-id,x-warehouse-id")
+    PREFLIGHT_STATUS=$(echo "$PREFLIGHT_HEADERS" | head -1 | awk '{print $2}')
+    if [ "$PREFLIGHT_STATUS" = "200" ] && echo "$PREFLIGHT_HEADERS" | grep -qi "^access-control-allow-headers:.*X-Tenant-Id"; then
+        echo "✅ Preflight OK: ${PREFLIGHT_URL}"
+    else
+        echo "⚠️  Preflight failed for ${PREFLIGHT_URL} (HTTP ${PREFLIGHT_STATUS})"
+    fi
+done
+
 echo "Testing AI API..."
 AI_TEST=$(curl -s -o /dev/null -w "%{http_code}" -X POST "${AI_API_URL}/chat" \
     -H "Content-Type: application/json" \
@@ -230,18 +246,16 @@ if [[ $REPLY =~ ^[Yy]$ ]]; then
         }
     ]'
     
-    # Add each product
-    echo "$SAMPLE_PRODUCTS" | jq -c '.[]' | while read product; do
-        curl -s -X POST "${STOCK_API_URL}/products" \
-            -H "Content-Type: application/json" \
-            -d "$product" > /dev/null
-        
-        if [ $? -eq 0 ]; then
-            echo "✅ Added: $(echo $product | jq -r '.name')"
-        else
-            echo "❌ Failed to add: $(echo $product | jq -r '.name')"
-        fi
-    done
+    # Add all products in one bulk request
+    BULK_RESULT=$(curl -s -X POST "${STOCK_API_URL}/products/bulk" \
+        -H "Content-Type: application/json" \
+        -d "{\"products\": ${SAMPLE_PRODUCTS}}")
+    
+    if [ $? -eq 0 ]; then
+        echo "✅ Added: $(echo $BULK_RESULT | jq -r '.created') products"
+    else
+        echo "❌ Failed to add sample products"
+    fi
     
     echo "📦 Sample products added successfully!"
 fi
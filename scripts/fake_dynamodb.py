@@ -0,0 +1,959 @@
+"""
+In-process stand-in for DynamoDB, used by the local benchmarks.
+
+Answers DynamoDB API calls inside botocore (on the before-send event) with
+real JSON responses, so boto3 clients, resources and Table objects work
+unchanged and still pay for request serialization and response parsing,
+but no HTTP request is made. Unlike moto it is built for large catalogs:
+scans and queries page straight through sorted in-memory indexes.
+
+What it models:
+- 1MB pages for Scan and Query (measured on the items read, before the
+  filter), Limit, ExclusiveStartKey and parallel-scan segments, which split
+  the partition key hash space into contiguous ranges like DynamoDB does
+- sparse global secondary indexes (projection ALL)
+- condition, filter, key condition, projection and update expressions, for
+  the syntax the Lambda functions use (top-level attributes only)
+- BatchGetItem/BatchWriteItem limits and TransactWriteItems with per-item
+  cancellation reasons
+- read/write capacity units per call from item sizes, with DynamoDB's
+  rounding and GSI write costs, returned as ConsumedCapacity when asked for
+  and totalled in `usage`
+- service latency: a fixed cost per call plus a cost per MB returned,
+  slept outside the fake's lock so concurrent calls overlap
+
+Binary attributes, nested document paths, local indexes, TTL and streams
+are not modeled.
+"""
+import hashlib
+import io
+import json
+import math
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+
+from botocore.awsrequest import AWSResponse
+
+PAGE_SIZE_LIMIT = 1024 * 1024
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+TRANSACTION_MAX_ITEMS = 100
+HASH_SPACE = 2 ** 128
+
+COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+CONDITION_FUNCTIONS = ('attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains')
+UPDATE_CLAUSES = ('SET', 'REMOVE', 'ADD', 'DELETE')
+
+TOKEN_PATTERN = re.compile(
+    r'\s*(?:(#[A-Za-z0-9_]+)|(:[A-Za-z0-9_]+)|([A-Za-z_][A-Za-z0-9_]*)|(<>|<=|>=|[=<>(),+\-]))')
+
+class FakeDynamoDBError(Exception):
+    """An error DynamoDB would return; sent back to botocore as an error response"""
+    
+    def __init__(self, code, message, **fields):
+        super().__init__(message)
+        self.code = code
+        self.fields = fields
+
+def validation_error(message):
+    return FakeDynamoDBError('ValidationException', message)
+
+class RawResponse(io.BytesIO):
+    """Response body in the shape botocore's AWSResponse reads from"""
+    
+    def stream(self, **kwargs):
+        chunk = self.read()
+        while chunk:
+            yield chunk
+            chunk = self.read()
+
+# --- Attribute values -------------------------------------------------------
+
+def comparable(value):
+    """AttributeValue to a (type, value) pair that compares like DynamoDB"""
+    kind, data = next(iter(value.items()))
+    if kind == 'N':
+        return ('N', Decimal(data))
+    if kind == 'NS':
+        return ('NS', frozenset(Decimal(v) for v in data))
+    if kind in ('SS', 'BS'):
+        return (kind, frozenset(data))
+    if kind in ('M', 'L'):
+        return (kind, json.dumps(data, sort_keys=True))
+    return (kind, data)
+
+def format_number(number):
+    if number == number.to_integral_value():
+        return str(int(number))
+    return str(number.normalize())
+
+def attribute_size(value):
+    """Stored size of one AttributeValue in bytes, per DynamoDB's sizing rules"""
+    kind, data = next(iter(value.items()))
+    if kind == 'S':
+        return len(data.encode('utf-8'))
+    if kind == 'N':
+        return (len(data.lstrip('-').replace('.', '').lstrip('0')) + 1) // 2 + 1
+    if kind in ('BOOL', 'NULL'):
+        return 1
+    if kind == 'B':
+        return len(data) * 3 // 4
+    if kind == 'SS':
+        return sum(len(v.encode('utf-8')) for v in data)
+    if kind == 'NS':
+        return sum(attribute_size({'N': v}) for v in data)
+    if kind == 'BS':
+        return sum(len(v) * 3 // 4 for v in data)
+    if kind == 'M':
+        return 3 + sum(len(k.encode('utf-8')) + 1 + attribute_size(v) for k, v in data.items())
+    if kind == 'L':
+        return 3 + sum(1 + attribute_size(v) for v in data)
+    return 0
+
+def item_size(item):
+    """Stored size of an item: attribute names plus values"""
+    if not item:
+        return 0
+    return sum(len(name.encode('utf-8')) + attribute_size(value) for name, value in item.items())
+
+def read_units(size, consistent):
+    units = math.ceil(max(size, 1) / READ_UNIT_BYTES)
+    return float(units) if consistent else units / 2
+
+def write_units(size):
+    return float(math.ceil(max(size, 1) / WRITE_UNIT_BYTES))
+
+def partition_token(hash_value):
+    """Position of a partition key in the 128-bit hash space"""
+    kind, data = hash_value
+    return int.from_bytes(hashlib.md5(f'{kind}:{data}'.encode('utf-8')).digest(), 'big')
+
+# --- Expressions ------------------------------------------------------------
+
+def tokenize_expression(text):
+    tokens = []
+    text = text.strip()
+    position = 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise validation_error(f'Invalid expression near "{text[position:]}"')
+        name, value, word, symbol = match.groups()
+        if name:
+            tokens.append(('name', name))
+        elif value:
+            tokens.append(('value', value))
+        elif word:
+            tokens.append(('word', word))
+        else:
+            tokens.append(('symbol', symbol))
+        position = match.end()
+    return tokens
+
+class ExpressionParser:
+    """
+    Recursive-descent parser for DynamoDB expressions.
+    
+    Conditions become nested tuples evaluated by `evaluate`; updates become
+    a list of (clause, attribute, operand) actions applied by `apply_update`.
+    Placeholders are resolved while parsing.
+    """
+    
+    def __init__(self, text, names=None, values=None):
+        self.tokens = tokenize_expression(text)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+    
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+    
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise validation_error('Unexpected end of expression')
+        self.position += 1
+        return token
+    
+    def expect(self, symbol):
+        if self.take()[1] != symbol:
+            raise validation_error(f'Expected "{symbol}" in expression')
+    
+    def keyword(self, *words):
+        kind, text = self.peek()
+        return kind == 'word' and text.upper() in words
+    
+    def finish(self, node):
+        if self.position != len(self.tokens):
+            raise validation_error(f'Unexpected "{self.peek()[1]}" in expression')
+        return node
+    
+    def attribute(self):
+        kind, text = self.take()
+        if kind == 'name':
+            if text not in self.names:
+                raise validation_error(f'Undefined expression attribute name {text}')
+            return self.names[text]
+        if kind == 'word':
+            return text
+        raise validation_error(f'Expected an attribute name, got "{text}"')
+    
+    def operand(self):
+        kind, text = self.peek()
+        if kind == 'value':
+            self.take()
+            if text not in self.values:
+                raise validation_error(f'Undefined expression attribute value {text}')
+            return ('value', self.values[text])
+        if kind == 'word' and text == 'size' and self.peek(1)[1] == '(':
+            self.take()
+            self.expect('(')
+            attribute = self.attribute()
+            self.expect(')')
+            return ('size', attribute)
+        return ('attribute', self.attribute())
+    
+    def parse_condition(self):
+        return self.finish(self.disjunction())
+    
+    def disjunction(self):
+        node = self.conjunction()
+        while self.keyword('OR'):
+            self.take()
+            node = ('or', node, self.conjunction())
+        return node
+    
+    def conjunction(self):
+        node = self.negation()
+        while self.keyword('AND'):
+            self.take()
+            node = ('and', node, self.negation())
+        return node
+    
+    def negation(self):
+        if self.keyword('NOT'):
+            self.take()
+            return ('not', self.negation())
+        return self.predicate()
+    
+    def predicate(self):
+        kind, text = self.peek()
+        if text == '(':
+            self.take()
+            node = self.disjunction()
+            self.expect(')')
+            return node
+        if kind == 'word' and text in CONDITION_FUNCTIONS and self.peek(1)[1] == '(':
+            self.take()
+            self.expect('(')
+            arguments = [self.operand()]
+            while self.peek()[1] == ',':
+                self.take()
+                arguments.append(self.operand())
+            self.expect(')')
+            return ('function', text, arguments)
+        
+        left = self.operand()
+        if self.keyword('BETWEEN'):
+            self.take()
+            low = self.operand()
+            if not self.keyword('AND'):
+                raise validation_error('BETWEEN needs AND')
+            self.take()
+            return ('between', left, low, self.operand())
+        if self.keyword('IN'):
+            self.take()
+            self.expect('(')
+            choices = [self.operand()]
+            while self.peek()[1] == ',':
+                self.take()
+                choices.append(self.operand())
+            self.expect(')')
+            return ('in', left, choices)
+        operator = self.take()[1]
+        if operator not in COMPARATORS:
+            raise validation_error(f'Expected a comparator, got "{operator}"')
+        return ('compare', operator, left, self.operand())
+    
+    def parse_update(self):
+        actions = []
+        while self.peek()[0] is not None:
+            clause = (self.take()[1] or '').upper()
+            if clause not in UPDATE_CLAUSES:
+                raise validation_error(f'Unknown update clause "{clause}"')
+            while True:
+                attribute = self.attribute()
+                if clause == 'SET':
+                    self.expect('=')
+                    actions.append((clause, attribute, self.set_value()))
+                elif clause == 'REMOVE':
+                    actions.append((clause, attribute, None))
+                else:
+                    actions.append((clause, attribute, self.operand()))
+                if self.peek()[1] != ',':
+                    break
+                self.take()
+        return actions
+    
+    def set_value(self):
+        node = self.set_operand()
+        if self.peek()[1] in ('+', '-'):
+            operator = self.take()[1]
+            node = ('arithmetic', operator, node, self.set_operand())
+        return node
+    
+    def set_operand(self):
+        kind, text = self.peek()
+        if kind == 'word' and text in ('if_not_exists', 'list_append') and self.peek(1)[1] == '(':
+            self.take()
+            self.expect('(')
+            first = self.set_operand()
+            self.expect(',')
+            second = self.set_operand()
+            self.expect(')')
+            return (text, first, second)
+        return self.operand()
+    
+    def parse_projection(self):
+        attributes = [self.attribute()]
+        while self.peek()[1] == ',':
+            self.take()
+            attributes.append(self.attribute())
+        return self.finish(attributes)
+
+def parse_condition(text, request):
+    if not text:
+        return None
+    return ExpressionParser(text, request.get('ExpressionAttributeNames'),
+                            request.get('ExpressionAttributeValues')).parse_condition()
+
+def parse_projection(request):
+    text = request.get('ProjectionExpression')
+    if not text:
+        return None
+    return ExpressionParser(text, request.get('ExpressionAttributeNames')).parse_projection()
+
+def resolve(operand, item):
+    """Value of an expression operand for an item, or None if the attribute is missing"""
+    kind = operand[0]
+    if kind == 'value':
+        return operand[1]
+    if kind == 'attribute':
+        return item.get(operand[1])
+    if kind == 'size':
+        value = item.get(operand[1])
+        if value is None:
+            return None
+        value_kind, data = next(iter(value.items()))
+        return {'N': str(len(data.encode('utf-8')) if value_kind == 'S' else len(data))}
+    if kind == 'if_not_exists':
+        existing = resolve(operand[1], item)
+        return existing if existing is not None else resolve(operand[2], item)
+    if kind == 'list_append':
+        return {'L': resolve(operand[1], item)['L'] + resolve(operand[2], item)['L']}
+    if kind == 'arithmetic':
+        left, right = resolve(operand[2], item), resolve(operand[3], item)
+        if left is None or right is None or 'N' not in left or 'N' not in right:
+            raise validation_error('An operand in the update expression has an incorrect data type')
+        total = Decimal(left['N']) + (Decimal(right['N']) if operand[1] == '+' else -Decimal(right['N']))
+        return {'N': format_number(total)}
+    raise validation_error(f'Unsupported operand {kind}')
+
+def compare(operator, left, right):
+    # Comparisons with a missing attribute are false, as in DynamoDB
+    if left is None or right is None:
+        return False
+    left, right = comparable(left), comparable(right)
+    if operator == '=':
+        return left == right
+    if operator == '<>':
+        return left != right
+    if left[0] != right[0] or left[0] not in ('S', 'N', 'B'):
+        return False
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[operator]
+
+def evaluate(node, item):
+    """Evaluate a parsed condition against an item (an empty dict when it does not exist)"""
+    kind = node[0]
+    if kind == 'and':
+        return evaluate(node[1], item) and evaluate(node[2], item)
+    if kind == 'or':
+        return evaluate(node[1], item) or evaluate(node[2], item)
+    if kind == 'not':
+        return not evaluate(node[1], item)
+    if kind == 'compare':
+        return compare(node[1], resolve(node[2], item), resolve(node[3], item))
+    if kind == 'between':
+        value = resolve(node[1], item)
+        return compare('>=', value, resolve(node[2], item)) and compare('<=', value, resolve(node[3], item))
+    if kind == 'in':
+        value = resolve(node[1], item)
+        return any(compare('=', value, resolve(choice, item)) for choice in node[2])
+    
+    name, arguments = node[1], node[2]
+    value = resolve(arguments[0], item)
+    if name == 'attribute_exists':
+        return value is not None
+    if name == 'attribute_not_exists':
+        return value is None
+    if value is None:
+        return False
+    argument = resolve(arguments[1], item)
+    if name == 'attribute_type':
+        return argument is not None and next(iter(value)) == argument.get('S')
+    if name == 'begins_with':
+        return 'S' in value and argument is not None and value['S'].startswith(argument.get('S', ''))
+    if name == 'contains':
+        if argument is None:
+            return False
+        if 'S' in value:
+            return 'S' in argument and argument['S'] in value['S']
+        if 'L' in value:
+            return any(comparable(element) == comparable(argument) for element in value['L'])
+        for set_kind in ('SS', 'NS', 'BS'):
+            if set_kind in value:
+                return comparable({set_kind[0]: next(iter(argument.values()))}) in {
+                    comparable({set_kind[0]: element}) for element in value[set_kind]}
+        return False
+    raise validation_error(f'Unsupported function {name}')
+
+def apply_update(actions, item, key_names):
+    """New item from an existing one (or its key) and parsed update actions"""
+    # Every operand is evaluated against the item as it was before the update
+    before = dict(item)
+    updated = dict(item)
+    for clause, attribute, operand in actions:
+        if attribute in key_names:
+            raise validation_error(f'Cannot update attribute {attribute}. This attribute is part of the key')
+        if clause == 'SET':
+            updated[attribute] = resolve(operand, before)
+        elif clause == 'REMOVE':
+            updated.pop(attribute, None)
+        elif clause == 'ADD':
+            value = resolve(operand, before)
+            current = updated.get(attribute)
+            if 'N' in value:
+                if current is None:
+                    updated[attribute] = value
+                elif 'N' in current:
+                    updated[attribute] = {'N': format_number(Decimal(current['N']) + Decimal(value['N']))}
+                else:
+                    raise validation_error('An operand in the update expression has an incorrect data type')
+            else:
+                set_kind = next(iter(value))
+                if set_kind not in ('SS', 'NS', 'BS') or (current is not None and set_kind not in current):
+                    raise validation_error('An operand in the update expression has an incorrect data type')
+                merged = list(dict.fromkeys((current or {}).get(set_kind, []) + value[set_kind]))
+                updated[attribute] = {set_kind: merged}
+        else:
+            value = resolve(operand, before)
+            current = updated.get(attribute)
+            if current is not None:
+                set_kind = next(iter(value))
+                remaining = [v for v in current.get(set_kind, []) if v not in set(value[set_kind])]
+                if remaining:
+                    updated[attribute] = {set_kind: remaining}
+                else:
+                    updated.pop(attribute)
+    return updated
+
+def project(item, attributes):
+    if attributes is None:
+        return item
+    return {name: item[name] for name in attributes if name in item}
+
+# --- Tables -----------------------------------------------------------------
+
+class FakeIndex:
+    """Items of a table grouped by partition key, each partition sorted by sort key"""
+    
+    def __init__(self, name, key_schema):
+        self.name = name
+        self.hash_key = next(k['AttributeName'] for k in key_schema if k['KeyType'] == 'HASH')
+        self.range_key = next((k['AttributeName'] for k in key_schema if k['KeyType'] == 'RANGE'), None)
+        self.partitions = {}   # hash value -> {table storage key: sort value}
+        self.sorted = {}       # hash value -> sorted [(sort value, table storage key)], rebuilt lazily
+    
+    def entry(self, item):
+        """(hash value, sort value) of an item in this index, or None if the item is not indexed"""
+        if item is None or self.hash_key not in item:
+            return None
+        if self.range_key is None:
+            return comparable(item[self.hash_key]), None
+        if self.range_key not in item:
+            return None
+        return comparable(item[self.hash_key]), comparable(item[self.range_key])
+    
+    def move(self, storage_key, old_item, new_item):
+        """Re-file an item after a write; returns how many index entries were written"""
+        old, new = self.entry(old_item), self.entry(new_item)
+        if old == new:
+            return 1 if new is not None else 0
+        if old is not None:
+            del self.partitions[old[0]][storage_key]
+            if not self.partitions[old[0]]:
+                del self.partitions[old[0]]
+            self.sorted.pop(old[0], None)
+        if new is not None:
+            self.partitions.setdefault(new[0], {})[storage_key] = new[1]
+            self.sorted.pop(new[0], None)
+        return (old is not None) + (new is not None)
+    
+    def partition(self, hash_value):
+        if hash_value not in self.sorted:
+            members = self.partitions.get(hash_value, {})
+            self.sorted[hash_value] = sorted((sort_value, key) for key, sort_value in members.items())
+        return self.sorted[hash_value]
+
+class FakeTable:
+    def __init__(self, definition):
+        self.name = definition['TableName']
+        self.key_schema = definition['KeySchema']
+        self.attribute_definitions = definition.get('AttributeDefinitions', [])
+        self.primary = FakeIndex(None, self.key_schema)
+        self.key_names = [self.primary.hash_key] + ([self.primary.range_key] if self.primary.range_key else [])
+        self.indexes = {
+            index['IndexName']: FakeIndex(index['IndexName'], index['KeySchema'])
+            for index in definition.get('GlobalSecondaryIndexes', [])
+        }
+        self.items = {}          # storage key -> item
+        self.scan_order = None   # sorted [(token, sort value, storage key)], built on the first scan
+    
+    def description(self):
+        description = {
+            'TableName': self.name,
+            'TableStatus': 'ACTIVE',
+            'KeySchema': self.key_schema,
+            'AttributeDefinitions': self.attribute_definitions,
+            'ItemCount': len(self.items),
+            'BillingModeSummary': {'BillingMode': 'PAY_PER_REQUEST'}
+        }
+        if self.indexes:
+            description['GlobalSecondaryIndexes'] = [
+                {'IndexName': index.name, 'IndexStatus': 'ACTIVE', 'Projection': {'ProjectionType': 'ALL'},
+                 'KeySchema': [{'AttributeName': index.hash_key, 'KeyType': 'HASH'}] +
+                              ([{'AttributeName': index.range_key, 'KeyType': 'RANGE'}] if index.range_key else [])}
+                for index in self.indexes.values()
+            ]
+        return description
+    
+    def storage_key(self, key):
+        """Hashable primary key of an item or key map; validates the key attributes"""
+        try:
+            hash_value = comparable(key[self.primary.hash_key])
+            range_value = comparable(key[self.primary.range_key]) if self.primary.range_key else None
+        except KeyError:
+            raise validation_error('The provided key element does not match the schema')
+        return hash_value, range_value
+    
+    def key_of(self, item, index=None):
+        """Key attributes of an item, including the index keys for index reads (LastEvaluatedKey)"""
+        names = list(self.key_names)
+        if index is not None:
+            names += [index.hash_key] + ([index.range_key] if index.range_key else [])
+        return {name: item[name] for name in dict.fromkeys(names)}
+    
+    def order_entry(self, storage_key):
+        return partition_token(storage_key[0]), storage_key[1], storage_key
+    
+    def write(self, storage_key, item):
+        """Store (or with item None, delete) an item; returns the write units consumed"""
+        old = self.items.get(storage_key)
+        if item is None:
+            self.items.pop(storage_key, None)
+        else:
+            self.items[storage_key] = item
+        if self.scan_order is not None and (old is None) != (item is None):
+            entry = self.order_entry(storage_key)
+            if item is None:
+                del self.scan_order[bisect_left(self.scan_order, entry)]
+            else:
+                insort(self.scan_order, entry)
+        
+        self.primary.move(storage_key, old, item)
+        units = write_units(max(item_size(old), item_size(item)))
+        for index in self.indexes.values():
+            # Each index entry written or removed costs a write of its own
+            units += index.move(storage_key, old, item) * write_units(max(item_size(old), item_size(item)))
+        return units
+    
+    def ordered_keys(self, start, end):
+        """Storage keys in scan order with a hash token in [start, end)"""
+        if self.scan_order is None:
+            self.scan_order = sorted(self.order_entry(key) for key in self.items)
+        low = bisect_left(self.scan_order, (start,))
+        high = bisect_left(self.scan_order, (end,))
+        return low, high
+
+class FakeDynamoDB:
+    """
+    The tables and operations behind every DynamoDB client of a boto3 session.
+    
+    Install it on a session before creating clients:
+    
+        fake = FakeDynamoDB(latency_ms=4)
+        fake.install(boto3.session.Session())
+    """
+    
+    def __init__(self, latency_ms=0.0, ms_per_mb=0.0):
+        self.latency = latency_ms / 1000
+        self.seconds_per_byte = ms_per_mb / 1000 / (1024 * 1024)
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.reset_usage()
+    
+    def install(self, session):
+        """Answer the session's DynamoDB calls; clients created afterwards inherit the hook"""
+        session.events.register('before-send.dynamodb', self.before_send)
+    
+    def load(self, table_name, items):
+        """Seed a table with low-level items directly, without going through botocore"""
+        table = self.table(table_name)
+        with self.lock:
+            for item in items:
+                table.write(table.storage_key(item), item)
+    
+    def reset_usage(self):
+        with self.lock:
+            self.usage = {'calls': 0, 'rcu': 0.0, 'wcu': 0.0, 'fake_seconds': 0.0, 'bytes': 0}
+    
+    def before_send(self, request, **kwargs):
+        target = request.headers['X-Amz-Target']
+        if isinstance(target, bytes):
+            target = target.decode('utf-8')
+        operation = target.split('.')[-1]
+        body = json.loads(request.body or b'{}')
+        
+        with self.lock:
+            started = time.perf_counter()
+            try:
+                result = self.call(operation, body)
+                status = 200
+            except FakeDynamoDBError as e:
+                result = dict(e.fields, __type=f'com.amazonaws.dynamodb.v20120810#{e.code}', message=str(e))
+                status = 400
+            payload = json.dumps(result).encode('utf-8')
+            self.usage['calls'] += 1
+            self.usage['bytes'] += len(payload)
+            # Time spent in the fake itself, for benchmarks to leave out
+            self.usage['fake_seconds'] += time.perf_counter() - started
+        
+        time.sleep(self.latency + len(payload) * self.seconds_per_byte)
+        headers = {'Content-Type': 'application/x-amz-json-1.0', 'Content-Length': str(len(payload))}
+        return AWSResponse(request.url, status, headers, RawResponse(payload))
+    
+    def call(self, operation, request):
+        handler = getattr(self, f'op_{re.sub(r"(?<!^)(?=[A-Z])", "_", operation).lower()}', None)
+        if handler is None:
+            raise validation_error(f'{operation} is not supported by the fake')
+        return handler(request)
+    
+    def table(self, name):
+        if name not in self.tables:
+            raise FakeDynamoDBError('ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+        return self.tables[name]
+    
+    def consume(self, request, table_name, read=0.0, write=0.0):
+        """Add a call's capacity to the totals; returns ConsumedCapacity if the request asked for it"""
+        self.usage['rcu'] += read
+        self.usage['wcu'] += write
+        if request.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return None
+        return {'TableName': table_name, 'CapacityUnits': read + write,
+                'ReadCapacityUnits': read, 'WriteCapacityUnits': write}
+    
+    def with_capacity(self, response, capacity):
+        if capacity is not None:
+            response['ConsumedCapacity'] = capacity
+        return response
+    
+    # Tables
+    
+    def op_create_table(self, request):
+        if request['TableName'] in self.tables:
+            raise FakeDynamoDBError('ResourceInUseException', f'Table already exists: {request["TableName"]}')
+        table = FakeTable(request)
+        self.tables[table.name] = table
+        return {'TableDescription': table.description()}
+    
+    def op_describe_table(self, request):
+        return {'Table': self.table(request['TableName']).description()}
+    
+    def op_delete_table(self, request):
+        table = self.table(request['TableName'])
+        del self.tables[table.name]
+        return {'TableDescription': table.description()}
+    
+    def op_list_tables(self, request):
+        return {'TableNames': sorted(self.tables)}
+    
+    # Single items
+    
+    def check_condition(self, request, current, return_on_failure=True):
+        condition = parse_condition(request.get('ConditionExpression'), request)
+        if condition is not None and not evaluate(condition, current or {}):
+            fields = {}
+            if return_on_failure and request.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD' and current:
+                fields['Item'] = current
+            raise FakeDynamoDBError('ConditionalCheckFailedException', 'The conditional request failed', **fields)
+    
+    def op_get_item(self, request):
+        table = self.table(request['TableName'])
+        item = table.items.get(table.storage_key(request['Key']))
+        capacity = self.consume(request, table.name, read=read_units(item_size(item), request.get('ConsistentRead')))
+        response = {}
+        if item is not None:
+            response['Item'] = project(item, parse_projection(request))
+        return self.with_capacity(response, capacity)
+    
+    def op_put_item(self, request):
+        table = self.table(request['TableName'])
+        item = request['Item']
+        storage_key = table.storage_key(item)
+        current = table.items.get(storage_key)
+        self.check_condition(request, current)
+        capacity = self.consume(request, table.name, write=table.write(storage_key, item))
+        response = {}
+        if request.get('ReturnValues') == 'ALL_OLD' and current:
+            response['Attributes'] = current
+        return self.with_capacity(response, capacity)
+    
+    def op_update_item(self, request):
+        table = self.table(request['TableName'])
+        storage_key = table.storage_key(request['Key'])
+        current = table.items.get(storage_key)
+        self.check_condition(request, current)
+        
+        actions = []
+        if request.get('UpdateExpression'):
+            actions = ExpressionParser(request['UpdateExpression'], request.get('ExpressionAttributeNames'),
+                                       request.get('ExpressionAttributeValues')).parse_update()
+        updated = apply_update(actions, current or dict(request['Key']), table.key_names)
+        capacity = self.consume(request, table.name, write=table.write(storage_key, updated))
+        
+        response = {}
+        return_values = request.get('ReturnValues', 'NONE')
+        changed = {attribute for _, attribute, _ in actions}
+        if return_values == 'ALL_NEW':
+            response['Attributes'] = updated
+        elif return_values == 'ALL_OLD' and current:
+            response['Attributes'] = current
+        elif return_values == 'UPDATED_NEW':
+            response['Attributes'] = {k: v for k, v in updated.items() if k in changed}
+        elif return_values == 'UPDATED_OLD' and current:
+            response['Attributes'] = {k: v for k, v in current.items() if k in changed}
+        return self.with_capacity(response, capacity)
+    
+    def op_delete_item(self, request):
+        table = self.table(request['TableName'])
+        storage_key = table.storage_key(request['Key'])
+        current = table.items.get(storage_key)
+        self.check_condition(request, current)
+        units = table.write(storage_key, None) if current is not None else write_units(0)
+        capacity = self.consume(request, table.name, write=units)
+        response = {}
+        if request.get('ReturnValues') == 'ALL_OLD' and current:
+            response['Attributes'] = current
+        return self.with_capacity(response, capacity)
+    
+    # Batches and transactions
+    
+    def op_batch_get_item(self, request):
+        requested = request['RequestItems']
+        if sum(len(entry['Keys']) for entry in requested.values()) > BATCH_GET_MAX_KEYS:
+            raise validation_error('Too many items requested for the BatchGetItem call')
+        responses, capacities = {}, []
+        for table_name, entry in requested.items():
+            table = self.table(table_name)
+            projection = parse_projection(entry)
+            items, units = [], 0.0
+            for key in entry['Keys']:
+                item = table.items.get(table.storage_key(key))
+                units += read_units(item_size(item), entry.get('ConsistentRead'))
+                if item is not None:
+                    items.append(project(item, projection))
+            responses[table_name] = items
+            capacity = self.consume(request, table_name, read=units)
+            if capacity is not None:
+                capacities.append(capacity)
+        response = {'Responses': responses, 'UnprocessedKeys': {}}
+        if capacities:
+            response['ConsumedCapacity'] = capacities
+        return response
+    
+    def op_batch_write_item(self, request):
+        requested = request['RequestItems']
+        if sum(len(writes) for writes in requested.values()) > BATCH_WRITE_MAX_ITEMS:
+            raise validation_error('Too many items requested for the BatchWriteItem call')
+        capacities = []
+        for table_name, writes in requested.items():
+            table = self.table(table_name)
+            units = 0.0
+            for write in writes:
+                if 'PutRequest' in write:
+                    item = write['PutRequest']['Item']
+                    units += table.write(table.storage_key(item), item)
+                else:
+                    units += table.write(table.storage_key(write['DeleteRequest']['Key']), None)
+            capacity = self.consume(request, table_name, write=units)
+            if capacity is not None:
+                capacities.append(capacity)
+        response = {'UnprocessedItems': {}}
+        if capacities:
+            response['ConsumedCapacity'] = capacities
+        return response
+    
+    def op_transact_write_items(self, request):
+        transact_items = request['TransactItems']
+        if len(transact_items) > TRANSACTION_MAX_ITEMS:
+            raise validation_error(f'Member must have length less than or equal to {TRANSACTION_MAX_ITEMS}')
+        
+        # Check every condition against the current state before writing anything
+        planned, reasons, failed = [], [], False
+        for entry in transact_items:
+            (action, spec), = entry.items()
+            table = self.table(spec['TableName'])
+            key = spec['Item'] if action == 'Put' else spec['Key']
+            storage_key = table.storage_key(key)
+            current = table.items.get(storage_key)
+            try:
+                self.check_condition(spec, current, return_on_failure=False)
+                reasons.append({'Code': 'None'})
+            except FakeDynamoDBError:
+                reason = {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'}
+                if spec.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD' and current:
+                    reason['Item'] = current
+                reasons.append(reason)
+                failed = True
+                continue
+            if action == 'Put':
+                planned.append((table, storage_key, spec['Item']))
+            elif action == 'Delete':
+                planned.append((table, storage_key, None))
+            elif action == 'Update':
+                actions = ExpressionParser(spec['UpdateExpression'], spec.get('ExpressionAttributeNames'),
+                                           spec.get('ExpressionAttributeValues')).parse_update()
+                planned.append((table, storage_key, apply_update(actions, current or dict(key), table.key_names)))
+        
+        if failed:
+            raise FakeDynamoDBError(
+                'TransactionCanceledException',
+                'Transaction cancelled, please refer cancellation reasons for specific reasons '
+                f'[{", ".join(reason["Code"] for reason in reasons)}]',
+                CancellationReasons=reasons
+            )
+        
+        units = {}
+        for table, storage_key, item in planned:
+            # Transactions cost two units per write: prepare and commit
+            units[table.name] = units.get(table.name, 0.0) + 2 * table.write(storage_key, item)
+        capacities = [self.consume(request, name, write=amount) for name, amount in units.items()]
+        response = {}
+        if capacities and capacities[0] is not None:
+            response['ConsumedCapacity'] = capacities
+        return response
+    
+    # Scans and queries
+    
+    def read_page(self, table, index, entries, request, key_condition=None):
+        """
+        One page of Scan/Query results from storage keys in read order.
+        
+        A page ends after Limit items or 1MB of data read, counting items the
+        filter expression then drops, like DynamoDB.
+        """
+        limit = request.get('Limit')
+        filter_condition = parse_condition(request.get('FilterExpression'), request)
+        projection = parse_projection(request)
+        consistent = request.get('ConsistentRead')
+        
+        items, read_bytes, scanned, last_item, truncated = [], 0, 0, None, False
+        for storage_key in entries:
+            item = table.items.get(storage_key)
+            if item is None or (key_condition is not None and not evaluate(key_condition, item)):
+                continue
+            size = item_size(item)
+            if scanned and (scanned == limit or read_bytes + size > PAGE_SIZE_LIMIT):
+                truncated = True
+                break
+            scanned += 1
+            read_bytes += size
+            last_item = item
+            if filter_condition is None or evaluate(filter_condition, item):
+                items.append(project(item, projection))
+        
+        capacity = self.consume(request, table.name, read=read_units(read_bytes, consistent))
+        response = {'Count': len(items), 'ScannedCount': scanned}
+        if request.get('Select') != 'COUNT':
+            response['Items'] = items
+        if truncated:
+            response['LastEvaluatedKey'] = table.key_of(last_item, index)
+        return self.with_capacity(response, capacity)
+    
+    def op_scan(self, request):
+        table = self.table(request['TableName'])
+        if request.get('IndexName'):
+            raise validation_error('Index scans are not supported by the fake')
+        
+        start, end = 0, HASH_SPACE
+        total_segments = request.get('TotalSegments')
+        if total_segments is not None:
+            segment = request['Segment']
+            start = segment * HASH_SPACE // total_segments
+            end = (segment + 1) * HASH_SPACE // total_segments
+        
+        low, high = table.ordered_keys(start, end)
+        if request.get('ExclusiveStartKey'):
+            resume = table.order_entry(table.storage_key(request['ExclusiveStartKey']))
+            low = max(low, bisect_right(table.scan_order, resume))
+        order = table.scan_order
+        entries = (order[position][2] for position in range(low, high))
+        return self.read_page(table, None, entries, request)
+    
+    def op_query(self, request):
+        table = self.table(request['TableName'])
+        index = table.primary
+        if request.get('IndexName'):
+            if request['IndexName'] not in table.indexes:
+                raise validation_error(f'The table does not have the specified index: {request["IndexName"]}')
+            index = table.indexes[request['IndexName']]
+        
+        key_condition = parse_condition(request.get('KeyConditionExpression'), request)
+        hash_value = partition_value(key_condition, index.hash_key)
+        if hash_value is None:
+            raise validation_error('Query condition missed key schema element')
+        members = index.partition(comparable(hash_value))
+        
+        forward = request.get('ScanIndexForward', True)
+        low, high = 0, len(members)
+        if request.get('ExclusiveStartKey'):
+            start_key = request['ExclusiveStartKey']
+            sort_value = comparable(start_key[index.range_key]) if index.range_key else None
+            resume = (sort_value, table.storage_key(start_key))
+            if forward:
+                low = bisect_right(members, resume)
+            else:
+                high = bisect_left(members, resume)
+        positions = range(low, high) if forward else range(high - 1, low - 1, -1)
+        entries = (members[position][1] for position in positions)
+        return self.read_page(table, None if index is table.primary else index, entries, request, key_condition)
+
+def partition_value(condition, hash_key):
+    """The value a key condition requires the partition key to equal"""
+    if condition is None:
+        return None
+    if condition[0] == 'and':
+        return partition_value(condition[1], hash_key) or partition_value(condition[2], hash_key)
+    if condition[0] == 'compare' and condition[1] == '=':
+        left, right = condition[2], condition[3]
+        if left == ('attribute', hash_key) and right[0] == 'value':
+            return right[1]
+        if right == ('attribute', hash_key) and left[0] == 'value':
+            return left[1]
+    return None
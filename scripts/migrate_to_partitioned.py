@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Copy a stock-products table keyed by product_id into the partitioned table.
+
+Tables created before multi-tenancy have product_id as their only key. The
+partitioned table is keyed by partition_key ("<tenant_id>#<warehouse_id>")
+and product_id, so this script scans the old table once and writes every
+product into a tenant's warehouse, with the low_stock flag the low-stock
+index expects. --warehouse-attribute takes the warehouse of each product
+from one of its attributes instead (products without it go to --warehouse).
+
+Products already in the target table are left alone: they were written by
+the application since it moved to the new table and are newer than the copy.
+That also makes the copy safe to run again after an interruption. Once
+done, the number of products in each target partition is checked against
+the source.
+
+Derived data follows the copy through the products stream, except the
+inventory summary: rebuild it once the stream has caught up with
+replay_inventory_stats.py --repair.
+
+Usage:
+    python scripts/migrate_to_partitioned.py --source prod-stock-products \
+        --target prod-stock-products-v2 [--tenant acme] [--warehouse main] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'shared', 'python'))
+from tenancy import DEFAULT_TENANT, DEFAULT_WAREHOUSE, PARTITION_ATTRIBUTE, partition_of, product_key
+
+LOW_STOCK_ATTRIBUTE = 'low_stock'
+BATCH_GET_MAX_KEYS = 100
+
+def partitioned_item(item, tenant_id, warehouse_id, warehouse_attribute=None):
+    """The product as stored in the partitioned table"""
+    if warehouse_attribute and item.get(warehouse_attribute):
+        warehouse_id = str(item[warehouse_attribute])
+    partition = partition_of(tenant_id, warehouse_id)
+    migrated = {k: v for k, v in item.items() if k != LOW_STOCK_ATTRIBUTE}
+    migrated[PARTITION_ATTRIBUTE] = partition
+    if 'quantity' in item and 'min_threshold' in item and item['quantity'] <= item['min_threshold']:
+        migrated[LOW_STOCK_ATTRIBUTE] = partition
+    return migrated
+
+def existing_keys(dynamodb, table_name, items):
+    """(partition, product_id) of the given items that are already in the target table"""
+    keys = [product_key(item[PARTITION_ATTRIBUTE], item['product_id']) for item in items]
+    found = set()
+    for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+        request = {table_name: {
+            'Keys': keys[start:start + BATCH_GET_MAX_KEYS],
+            'ProjectionExpression': f'{PARTITION_ATTRIBUTE}, product_id'
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            found.update((item[PARTITION_ATTRIBUTE], item['product_id'])
+                         for item in response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys')
+    return found
+
+def migrate(dynamodb, source, target, tenant_id, warehouse_id, warehouse_attribute=None, dry_run=False):
+    """Copy every product of the source table; returns the stats and the products per target partition"""
+    stats = {'scanned': 0, 'copied': 0, 'existing': 0}
+    partitions = {}
+    scan_kwargs = {}
+    
+    with target.batch_writer() as writer:
+        while True:
+            response = source.scan(**scan_kwargs)
+            items = [partitioned_item(item, tenant_id, warehouse_id, warehouse_attribute)
+                     for item in response['Items']]
+            stats['scanned'] += len(items)
+            existing = set() if dry_run or not items else existing_keys(dynamodb, target.name, items)
+            
+            for item in items:
+                partition = item[PARTITION_ATTRIBUTE]
+                partitions[partition] = partitions.get(partition, 0) + 1
+                if (partition, item['product_id']) in existing:
+                    stats['existing'] += 1
+                    continue
+                stats['copied'] += 1
+                if not dry_run:
+                    writer.put_item(Item=item)
+            
+            if 'LastEvaluatedKey' not in response:
+                return stats, partitions
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def count_partition(table, partition):
+    """Number of products in one partition of the target table"""
+    count = 0
+    query_kwargs = {
+        'KeyConditionExpression': f'{PARTITION_ATTRIBUTE} = :partition',
+        'ExpressionAttributeValues': {':partition': partition},
+        'Select': 'COUNT'
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        count += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            return count
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy a product_id-keyed products table into the partitioned table')
+    parser.add_argument('--source', required=True, help='Table keyed by product_id')
+    parser.add_argument('--target', required=True, help='Table keyed by partition_key and product_id')
+    parser.add_argument('--tenant', default=DEFAULT_TENANT, help='Tenant the products belong to')
+    parser.add_argument('--warehouse', default=DEFAULT_WAREHOUSE, help='Warehouse the products are in')
+    parser.add_argument('--warehouse-attribute', help='Product attribute holding its warehouse ID, if any')
+    parser.add_argument('--region', default=None, help='AWS region')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be copied without writing')
+    args = parser.parse_args()
+    
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    target = dynamodb.Table(args.target)
+    stats, partitions = migrate(dynamodb, dynamodb.Table(args.source), target, args.tenant, args.warehouse,
+                                args.warehouse_attribute, dry_run=args.dry_run)
+    
+    prefix = '[dry-run] ' if args.dry_run else ''
+    print(f"{prefix}Scanned {stats['scanned']} products: {stats['copied']} copied, "
+          f"{stats['existing']} already in {args.target}")
+    
+    mismatches = 0
+    for partition, expected in sorted(partitions.items()):
+        if args.dry_run:
+            print(f'{prefix}{partition}: {expected} products')
+            continue
+        # Products the application added since count too; ones it deleted show up as a mismatch
+        count = count_partition(target, partition)
+        status = 'OK' if count >= expected else 'MISMATCH'
+        mismatches += status == 'MISMATCH'
+        print(f'{status} {partition}: {expected} source products, {count} in {args.target}')
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
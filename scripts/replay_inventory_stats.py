@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Check the incrementally maintained inventory summary against a full recompute.
+
+Replay mode feeds recorded DynamoDB Streams batches (Lambda event JSON files,
+or --synthetic N generated changes) through the same delta logic the
+stock-stream function uses, rebuilds the final table state from the stream
+images, and compares the incremental totals with a full recompute.
+
+Live mode compares the summary item of each partition (tenant and warehouse)
+stored in the metadata table with a full scan of the products table, and can
+overwrite the drifted ones with --repair.
+
+Usage:
+    python scripts/replay_inventory_stats.py --records batch1.json batch2.json
+    python scripts/replay_inventory_stats.py --synthetic 5000
+    python scripts/replay_inventory_stats.py --table prod-stock-products \
+        --metadata-table prod-stock-metadata [--repair]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'stock-stream'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda-functions', 'shared', 'python'))
+from aggregates import INVENTORY_SUMMARY_KEY, add_into, change_delta, summarize_products
+from tenancy import partition_of_item, scoped_key
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+deserializer = TypeDeserializer()
+serializer = TypeSerializer()
+
+def load_records(paths):
+    """Read stream records from Lambda event files (or plain record lists)"""
+    records = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f, parse_float=Decimal)
+        records.extend(data['Records'] if isinstance(data, dict) else data)
+    return records
+
+def synthetic_records(count, seed=42):
+    """Random INSERT/MODIFY/REMOVE records shaped like DynamoDB Streams output"""
+    rng = random.Random(seed)
+    categories = ['Electronics', 'Books', 'Clothing', 'Home']
+    products = {}
+    records = []
+    for i in range(count):
+        action = rng.random()
+        if not products or action < 0.3:
+            product_id = f'SYN{i:06d}'
+            old = None
+            new = {'product_id': product_id, 'quantity': rng.randint(0, 50),
+                   'min_threshold': rng.randint(1, 10), 'price': Decimal(str(round(rng.uniform(1, 500), 2))),
+                   'category': rng.choice(categories)}
+            event_name = 'INSERT'
+        elif action < 0.9:
+            product_id = rng.choice(sorted(products))
+            old = products[product_id]
+            new = dict(old, quantity=max(0, old['quantity'] + rng.randint(-10, 10)))
+            if rng.random() < 0.1:
+                new['category'] = rng.choice(categories)
+            event_name = 'MODIFY'
+        else:
+            product_id = rng.choice(sorted(products))
+            old = products[product_id]
+            new = None
+            event_name = 'REMOVE'
+        
+        stream = {}
+        if old:
+            stream['OldImage'] = {k: serializer.serialize(v) for k, v in old.items()}
+        if new:
+            stream['NewImage'] = {k: serializer.serialize(v) for k, v in new.items()}
+            products[product_id] = new
+        else:
+            del products[product_id]
+        records.append({'eventName': event_name, 'dynamodb': stream})
+    return records
+
+def deserialize_image(image):
+    """Convert a stream image from DynamoDB JSON to Python values"""
+    return {k: deserializer.deserialize(v) for k, v in (image or {}).items()}
+
+def replay(records):
+    """Return (incremental summary, full recompute of the final state)"""
+    incremental = {}
+    final_state = {}
+    for record in records:
+        stream = record.get('dynamodb', {})
+        old_image = deserialize_image(stream.get('OldImage'))
+        new_image = deserialize_image(stream.get('NewImage'))
+        add_into(incremental, change_delta(old_image, new_image))
+        image = new_image or old_image
+        key = (partition_of_item(image), image.get('product_id'))
+        if record.get('eventName') == 'REMOVE':
+            final_state.pop(key, None)
+        else:
+            final_state[key] = new_image
+    return incremental, summarize_products(final_state.values())
+
+def compare(incremental, recomputed):
+    """List fields whose values differ (zero and missing are equal)"""
+    mismatches = []
+    for field in sorted(set(incremental) | set(recomputed)):
+        a = Decimal(str(incremental.get(field, 0)))
+        b = Decimal(str(recomputed.get(field, 0)))
+        if a != b:
+            mismatches.append((field, a, b))
+    return mismatches
+
+def live_check(table_name, metadata_table_name, region, repair):
+    """Compare each partition's stored summary with a full scan of the products table"""
+    import boto3
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+    table = dynamodb.Table(table_name)
+    metadata_table = dynamodb.Table(metadata_table_name)
+    
+    by_partition = {}
+    scan_kwargs = {}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for product in response['Items']:
+            by_partition.setdefault(partition_of_item(product), []).append(product)
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    mismatches = []
+    for partition, products in sorted(by_partition.items()):
+        summary_key = scoped_key(INVENTORY_SUMMARY_KEY, partition)
+        stored = metadata_table.get_item(Key={'meta_key': summary_key}).get('Item', {})
+        stored = {k: v for k, v in stored.items() if k not in ('meta_key', 'updated_at')}
+        recomputed = summarize_products(products)
+        drifted = compare(stored, recomputed)
+        mismatches.extend((f'{partition} {field}', a, b) for field, a, b in drifted)
+        
+        if drifted and repair:
+            item = {'meta_key': summary_key}
+            item.update({k: v for k, v in recomputed.items() if v != 0})
+            metadata_table.put_item(Item=item)
+            print(f'Repaired {partition} summary from {len(products)} products')
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify the inventory summary against a full recompute')
+    parser.add_argument('--records', nargs='*', help='Recorded stream event JSON files to replay')
+    parser.add_argument('--synthetic', type=int, help='Replay N synthetic stream records')
+    parser.add_argument('--table', help='Products table for live mode')
+    parser.add_argument('--metadata-table', default='stock-metadata', help='Metadata table for live mode')
+    parser.add_argument('--region', default=None, help='AWS region')
+    parser.add_argument('--repair', action='store_true', help='Overwrite a drifted summary (live mode)')
+    args = parser.parse_args()
+    
+    if args.table:
+        mismatches = live_check(args.table, args.metadata_table, args.region, args.repair)
+    elif args.records or args.synthetic:
+        records = load_records(args.records) if args.records else synthetic_records(args.synthetic)
+        incremental, recomputed = replay(records)
+        print(f'Replayed {len(records)} records')
+        mismatches = compare(incremental, recomputed)
+    else:
+        parser.error('use --records, --synthetic or --table')
+    
+    for field, incremental_value, recomputed_value in mismatches:
+        print(f'MISMATCH {field}: incremental={incremental_value} recomputed={recomputed_value}')
+    if mismatches:
+        sys.exit(1)
+    print('OK: incremental summary matches full recompute')
+
+if __name__ == '__main__':
+    main()
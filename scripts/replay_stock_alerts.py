@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Replay DynamoDB Streams batches through the stock-alerts function locally.
+
+Each batch (a recorded Lambda event JSON file, or --synthetic N generated
+changes split into --batch-size batches) is handed to the real
+lambda_handler the way the event source mapping does it: when the handler
+reports batchItemFailures, the batch is retried from the lowest failed
+sequence number. The metadata table is the in-process fake from
+fake_dynamodb.py and PutEvents is answered by a stub that keeps the events,
+so no AWS account is needed.
+
+--publish-failure-rate and --write-failure-rate make a share of the
+PutEvents entries and alert-state writes fail, to exercise partial batch
+failures and retries (alerts are at-least-once only when clearing a
+pending alert fails, which is not injected).
+
+The published alerts are then checked against the crossings found by a
+plain pass over the stream images: every product must get exactly the
+expected Low Stock Detected / Resolved events, in stream order and without
+duplicates, and its stored alert state and recommendation must match its
+final image.
+
+Usage:
+    python scripts/replay_stock_alerts.py --records batch1.json batch2.json
+    python scripts/replay_stock_alerts.py --synthetic 5000 --publish-failure-rate 0.05
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import threading
+from decimal import Decimal
+from types import SimpleNamespace
+
+from benchmark_handlers import METADATA_TABLE, create_tables, load_handler
+from fake_dynamodb import FakeDynamoDB
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from restock import build_recommendation, is_low_stock
+
+deserializer = TypeDeserializer()
+serializer = TypeSerializer()
+
+CATEGORIES = ['Electronics', 'Books', 'Clothing', 'Home']
+FIRST_SEQUENCE_NUMBER = 10 ** 20
+
+class EventBridgeStub:
+    """Accepts PutEvents entries (rejecting a random share of them) and keeps the accepted ones"""
+    
+    def __init__(self, session, failure_rate, seed):
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.accepted = []
+        self.rejected = 0
+        self.lock = threading.Lock()
+        session.events.register('before-call.events.PutEvents', self.put_events)
+    
+    def put_events(self, params, **kwargs):
+        results = []
+        with self.lock:
+            for entry in json.loads(params['body'])['Entries']:
+                if self.rng.random() < self.failure_rate:
+                    self.rejected += 1
+                    results.append({'ErrorCode': 'InternalFailure', 'ErrorMessage': 'Injected failure'})
+                else:
+                    self.accepted.append(entry)
+                    results.append({'EventId': f'event-{len(self.accepted)}'})
+        failed = sum(1 for result in results if 'ErrorCode' in result)
+        return (SimpleNamespace(status_code=200, headers={}, content=b''),
+                {'FailedEntryCount': failed, 'Entries': results})
+
+class WriteFailures:
+    """
+    Fails a random share of alert-state writes with a non-retryable error.
+    
+    Clearing the pending flag is left alone: that write comes after the event
+    is out, and a failure there can only repeat an alert on a later retry.
+    """
+    
+    def __init__(self, session, failure_rate, seed):
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.injected = 0
+        self.lock = threading.Lock()
+        session.events.register('before-call.dynamodb.UpdateItem', self.update_item)
+    
+    def update_item(self, params, **kwargs):
+        if json.loads(params['body'])['UpdateExpression'] == 'REMOVE pending':
+            return None
+        with self.lock:
+            if self.rng.random() >= self.failure_rate:
+                return None
+            self.injected += 1
+        return (SimpleNamespace(status_code=400, headers={}, content=b''),
+                {'Error': {'Code': 'InjectedFailure', 'Message': 'Injected write failure'}})
+
+def load_batches(paths):
+    """One batch per Lambda event file (or plain record list)"""
+    batches = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f, parse_float=Decimal)
+        batches.append(data['Records'] if isinstance(data, dict) else data)
+    return batches
+
+def synthetic_records(count, seed=42):
+    """Stock changes around the thresholds of a small catalog, shaped like DynamoDB Streams records"""
+    rng = random.Random(seed)
+    products = {}
+    records = []
+    for i in range(count):
+        action = rng.random()
+        if len(products) < 20 or action < 0.1:
+            product_id = f'SYN{i:06d}'
+            old = None
+            threshold = rng.randint(2, 10)
+            new = {'product_id': product_id, 'name': f'Synthetic product {i}', 'quantity': rng.randint(0, 3 * threshold),
+                   'min_threshold': threshold, 'price': Decimal(str(round(rng.uniform(1, 500), 2))),
+                   'category': rng.choice(CATEGORIES)}
+            event_name = 'INSERT'
+        elif action < 0.95:
+            product_id = rng.choice(sorted(products))
+            old = products[product_id]
+            new = dict(old, quantity=max(0, old['quantity'] + rng.randint(-4, 4)))
+            if rng.random() < 0.05:
+                new['min_threshold'] = rng.randint(2, 10)
+            event_name = 'MODIFY'
+        else:
+            product_id = rng.choice(sorted(products))
+            old = products[product_id]
+            new = None
+            event_name = 'REMOVE'
+        
+        stream = {'Keys': {'product_id': {'S': product_id}},
+                  'SequenceNumber': str(FIRST_SEQUENCE_NUMBER + i),
+                  'ApproximateCreationDateTime': 1718000000 + i}
+        if old:
+            stream['OldImage'] = {k: serializer.serialize(v) for k, v in old.items()}
+        if new:
+            stream['NewImage'] = {k: serializer.serialize(v) for k, v in new.items()}
+            products[product_id] = new
+        else:
+            del products[product_id]
+        records.append({'eventID': str(i), 'eventName': event_name, 'eventSource': 'aws:dynamodb', 'dynamodb': stream})
+    return records
+
+def deserialize_image(image):
+    """Convert a stream image from DynamoDB JSON to Python values"""
+    return {k: deserializer.deserialize(v) for k, v in (image or {}).items()}
+
+def is_low(image):
+    return 'quantity' in image and 'min_threshold' in image and is_low_stock(image['quantity'], image['min_threshold'])
+
+def expected_alerts(records):
+    """Alert kinds per product, and the final image of each product currently alerted as low"""
+    alerts = {}
+    alerted = {}
+    for record in records:
+        stream = record['dynamodb']
+        old_image = deserialize_image(stream.get('OldImage'))
+        new_image = deserialize_image(stream.get('NewImage'))
+        product_id = (new_image or old_image)['product_id']
+        if is_low(new_image):
+            if not is_low(old_image) and product_id not in alerted:
+                alerts.setdefault(product_id, []).append('detected')
+            if not is_low(old_image) or product_id in alerted:
+                alerted[product_id] = new_image
+        elif is_low(old_image) and product_id in alerted:
+            alerts.setdefault(product_id, []).append('resolved')
+            del alerted[product_id]
+    return alerts, alerted
+
+def deliver(handler, batch, max_attempts):
+    """Invoke the handler like the event source mapping; returns the number of retries"""
+    remaining = batch
+    for attempt in range(max_attempts):
+        response = handler.lambda_handler({'Records': remaining}, None)
+        failures = response.get('batchItemFailures') or []
+        if not failures:
+            return attempt
+        first = min(int(failure['itemIdentifier']) for failure in failures)
+        remaining = [record for record in remaining if int(record['dynamodb']['SequenceNumber']) >= first]
+    raise RuntimeError(f'Batch still failing after {max_attempts} attempts')
+
+def check(stub, fake, alerts, alerted, prefix):
+    """List differences between the published alerts / stored state and the expected ones"""
+    problems = []
+    published = {}
+    for entry in stub.accepted:
+        detail = json.loads(entry['Detail'])
+        kind = 'detected' if entry['DetailType'] == 'Low Stock Detected' else 'resolved'
+        published.setdefault(detail['product_id'], []).append(kind)
+    for product_id in sorted(set(alerts) | set(published)):
+        if alerts.get(product_id, []) != published.get(product_id, []):
+            problems.append(f'{product_id}: expected {alerts.get(product_id, [])}, published {published.get(product_id, [])}')
+    
+    stored = {}
+    for item in fake.table(METADATA_TABLE).items.values():
+        item = deserialize_image(item)
+        if item['meta_key'].startswith(prefix) and item.get('state') == 'low':
+            stored[item['product_id']] = item
+    for product_id in sorted(set(alerted) | set(stored)):
+        if product_id not in stored or product_id not in alerted:
+            problems.append(f'{product_id}: expected low={product_id in alerted}, stored low={product_id in stored}')
+            continue
+        expected = json.loads(json.dumps(build_recommendation(alerted[product_id]), default=str), parse_float=Decimal)
+        if stored[product_id].get('recommendation') != expected:
+            problems.append(f'{product_id}: stale recommendation {stored[product_id].get("recommendation")}')
+        if stored[product_id].get('pending'):
+            problems.append(f'{product_id}: alert still pending')
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay stream batches through the stock-alerts function')
+    parser.add_argument('--records', nargs='*', help='Recorded stream event JSON files, one batch each')
+    parser.add_argument('--synthetic', type=int, help='Replay N synthetic stream records')
+    parser.add_argument('--batch-size', type=int, default=100, help='Records per synthetic batch')
+    parser.add_argument('--publish-failure-rate', type=float, default=0.0, help='Share of PutEvents entries to reject')
+    parser.add_argument('--write-failure-rate', type=float, default=0.0, help='Share of alert-state writes to fail')
+    parser.add_argument('--max-attempts', type=int, default=50, help='Invocations per batch before giving up')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    if args.records:
+        batches = load_batches(args.records)
+    elif args.synthetic:
+        records = synthetic_records(args.synthetic, args.seed)
+        batches = [records[i:i + args.batch_size] for i in range(0, len(records), args.batch_size)]
+    else:
+        parser.error('use --records or --synthetic')
+    
+    import aws_clients
+    session = aws_clients.get_session()
+    fake = FakeDynamoDB()
+    fake.install(session)
+    stub = EventBridgeStub(session, args.publish_failure_rate, args.seed)
+    writes = WriteFailures(session, args.write_failure_rate, args.seed)
+    create_tables(session.client('dynamodb'))
+    handler = load_handler('stock-alerts')
+    
+    retries = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for batch in batches:
+            retries += deliver(handler, batch, args.max_attempts)
+    
+    records = [record for batch in batches for record in batch]
+    alerts, alerted = expected_alerts(records)
+    print(f'Replayed {len(records)} records in {len(batches)} batches: {len(stub.accepted)} alerts published, '
+          f'{retries} retries ({stub.rejected} rejected events, {writes.injected} failed writes), '
+          f'{fake.usage["calls"]} DynamoDB calls')
+    
+    problems = check(stub, fake, alerts, alerted, handler.ALERT_KEY_PREFIX)
+    for problem in problems:
+        print(f'MISMATCH {problem}')
+    if problems:
+        sys.exit(1)
+    print('OK: published alerts match the threshold crossings in the stream')
+
+if __name__ == '__main__':
+    main()